@@ -0,0 +1,128 @@
+# =================================================================================================
+# Purpose:                  Many independent matches stepped at once as NumPy arrays, with the same
+#                           ball, paddle and scoring rules as MatchSimulation (and so playGame), for
+#                           bot training and bulk validation
+# =================================================================================================
+
+# Needs numpy, which neither pongClient nor pongServer imports. Every match is one index into the
+# arrays below, and step() runs MatchSimulation.step for all of them with whole-array operations:
+#   ball.updatePos()            x += xVel, y += yVel
+#   ball.reset(nowGoing)        back to the start position, xVel -5 (left) or 5 (right), yVel 0
+#   ball.hitPaddle(center)      xVel = -xVel, yVel = (ball center y - paddle center y) // 2
+#   ball.hitWall()              yVel = -yVel
+#   Rect.colliderect            a.x < b.x + b.w and b.x < a.x + a.w, the same for y
+# Positions are whole numbers like pygame.Rect's, and numpy's // floors like Python's, so the results
+# match MatchSimulation exactly, see benchmarks/batchSimulation.py --check.
+
+import numpy as np
+
+from assets.code.matchSimulation import PADDLE_HEIGHT, PADDLE_WIDTH, WINNING_SCORE
+
+BALL_SIZE = 5
+BALL_SPEED = 5
+PADDLE_SPEED = 5
+WALL_HEIGHT = 10
+
+
+class BatchSimulation:
+    # matches matches at once, every array has one entry per match
+    def __init__(self, matches: int, screenWidth: int = 640, screenHeight: int = 480) -> None:
+        self.matches = matches
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+
+        # Where the Rects in MatchSimulation.reset_match end up once pygame truncates them
+        self.ballStartX = int(screenWidth / 2)
+        self.ballStartY = int(screenHeight / 2)
+        self.paddleStartY = int((screenHeight / 2) - (PADDLE_HEIGHT / 2))
+        self.leftX = 10
+        self.rightX = screenWidth - 20
+
+        # Paddle limits of MatchSimulation.set_paddle
+        self.lowest = screenHeight - WALL_HEIGHT - PADDLE_HEIGHT + PADDLE_SPEED - 1
+        self.highest = WALL_HEIGHT - PADDLE_SPEED + 1
+
+        self.ballX = np.empty(matches, np.int32)
+        self.ballY = np.empty(matches, np.int32)
+        self.xVel = np.empty(matches, np.int32)
+        self.yVel = np.empty(matches, np.int32)
+        self.leftY = np.empty(matches, np.int32)
+        self.rightY = np.empty(matches, np.int32)
+        self.lScore = np.empty(matches, np.int32)
+        self.rScore = np.empty(matches, np.int32)
+        self.tick = np.empty(matches, np.int64)
+        self.reset_matches()
+
+    def reset_matches(self, which = None) -> None:
+        # MatchSimulation.reset_match for the matches where which is True, every match without it
+        which = np.ones(self.matches, bool) if which is None else np.asarray(which, bool)
+        np.copyto(self.leftY, self.paddleStartY, where = which)
+        np.copyto(self.rightY, self.paddleStartY, where = which)
+        np.copyto(self.ballX, self.ballStartX, where = which)
+        np.copyto(self.ballY, self.ballStartY, where = which)
+        np.copyto(self.xVel, -BALL_SPEED, where = which)
+        np.copyto(self.yVel, 0, where = which)
+        np.copyto(self.lScore, 0, where = which)
+        np.copyto(self.rScore, 0, where = which)
+        np.copyto(self.tick, 0, where = which)
+
+    @property
+    def game_over(self) -> np.ndarray:
+        return (self.lScore >= WINNING_SCORE) | (self.rScore >= WINNING_SCORE)
+
+    def set_paddles(self, leftY, rightY) -> None:
+        # MatchSimulation.set_paddle for both sides of every match, a scalar applies to all of them
+        np.clip(np.asarray(leftY).astype(np.int32), self.highest, self.lowest, out = self.leftY)
+        np.clip(np.asarray(rightY).astype(np.int32), self.highest, self.lowest, out = self.rightY)
+
+    def move_paddles(self, left, right) -> None:
+        # playGame's paddle movement, -1 up, 1 down, 0 stays: one step of PADDLE_SPEED unless the
+        # paddle already touches that wall
+        for paddleY, moving in ((self.leftY, np.asarray(left)), (self.rightY, np.asarray(right))):
+            down = (moving > 0) & (paddleY + PADDLE_HEIGHT < self.screenHeight - WALL_HEIGHT)
+            up = (moving < 0) & (paddleY > WALL_HEIGHT)
+            paddleY += (down.astype(np.int32) - up) * PADDLE_SPEED
+
+    def step(self) -> None:
+        # One MatchSimulation.step for every match that is not over
+        active = ~self.game_over
+        self.tick += active
+        self.ballX += self.xVel * active
+        self.ballY += self.yVel * active
+        x, y = self.ballX, self.ballY
+
+        # If the ball makes it past the edge of the screen, update score, etc.
+        scoredLeft = active & (x > self.screenWidth)
+        scoredRight = active & (x < 0) & ~scoredLeft
+        self.lScore += scoredLeft
+        self.rScore += scoredRight
+        scored = scoredLeft | scoredRight
+        np.copyto(x, self.ballStartX, where = scored)
+        np.copyto(y, self.ballStartY, where = scored)
+        np.copyto(self.xVel, -BALL_SPEED, where = scoredLeft)
+        np.copyto(self.xVel, BALL_SPEED, where = scoredRight)
+        np.copyto(self.yVel, 0, where = scored)
+
+        # If the ball hits a paddle, the left one is checked first
+        hitLeft = active & self._collides(self.leftX, self.leftY)
+        hitRight = active & ~hitLeft & self._collides(self.rightX, self.rightY)
+        for hit, paddleY in ((hitLeft, self.leftY), (hitRight, self.rightY)):
+            np.negative(self.xVel, out = self.xVel, where = hit)
+            np.copyto(self.yVel, ((y + BALL_SIZE // 2) - (paddleY + PADDLE_HEIGHT // 2)) // 2, where = hit)
+
+        # If the ball hits a wall
+        acrossCourt = (x < self.screenWidth + 10) & (x + BALL_SIZE > -10)
+        topWall = (y < WALL_HEIGHT) & (y + BALL_SIZE > 0)
+        bottomWall = (y < self.screenHeight) & (y + BALL_SIZE > self.screenHeight - WALL_HEIGHT)
+        np.negative(self.yVel, out = self.yVel, where = active & acrossCourt & (topWall | bottomWall))
+
+    def _collides(self, paddleX: int, paddleY: np.ndarray) -> np.ndarray:
+        x, y = self.ballX, self.ballY
+        return ((x < paddleX + PADDLE_WIDTH) & (x + BALL_SIZE > paddleX)
+                & (y < paddleY + PADDLE_HEIGHT) & (y + BALL_SIZE > paddleY))
+
+    def states(self) -> np.ndarray:
+        # (matches, 7) array of MatchSimulation.state() rows: leftY, rightY, ballX, ballY, lScore,
+        # rScore, tick
+        return np.stack((self.leftY, self.rightY, self.ballX, self.ballY, self.lScore, self.rScore,
+                         self.tick), axis = 1)
@@ -0,0 +1,261 @@
+# =================================================================================================
+# Purpose:                  Bounded per-client outbound queues so one slow client never stalls the
+#                           broadcast to everyone else
+# =================================================================================================
+
+import asyncio
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+# What to do when a client's queue is full
+#   latest      Drop every queued snapshot and keep only the newest one
+#   disconnect  Close the client, it can reconnect when its link recovers
+SLOW_POLICIES = ('latest', 'disconnect')
+
+
+class ClientOutbox(ABC):
+    # Shared queueing and slow-consumer policy, ThreadedOutbox and AsyncOutbox do the sending
+    # side        'left', 'right' or 'spectator'
+    # max_frames  Queued snapshots allowed before the slow-consumer policy kicks in
+    # policy      One of SLOW_POLICIES
+    def __init__(self, side: str, max_frames: int = 8, policy: str = 'latest') -> None:
+        if policy not in SLOW_POLICIES:
+            raise ValueError(f"policy must be one of {SLOW_POLICIES}")
+        self.side = side
+        self.max_frames = max_frames
+        self.policy = policy
+        self.protocol = 'text'
+        self.queue = deque()
+        self.queued_snapshots = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.dropped_frames = 0
+        self.closed = False
+
+        # rateControl.RateController with --adaptive-rate, which decides which snapshots go out. The
+        # most snapshots queued at once since its last update is one of the signals it reads
+        self.rate = None
+        self.peak_snapshots = 0
+
+        # Round trip measurement, for clients that accepted the ping feature (server metrics on)
+        self.pings = False
+        self.ping_id = 0
+        self.ping_sent = 0.0
+        self.pong_id = 0
+        self.rtt = None
+
+        # Set by udpTransport.UdpEndpoint once the client's UDP address is known, snapshots then go
+        # out through it as datagrams and never wait in the queue
+        self.udp_token = None
+        self.datagram = None
+
+        # deltaSnapshot.DeltaTracker for binary clients that accepted the delta feature
+        self.deltas = None
+
+    def _enqueue(self, frame: bytes, droppable: bool) -> bool:
+        # Returns False when the client should be disconnected instead
+        if droppable and self.queued_snapshots >= self.max_frames:
+            if self.policy == 'disconnect':
+                self.dropped_frames += 1
+                return False
+
+            # Control messages (START, ...) are never dropped, only snapshots are
+            self.dropped_frames += self.queued_snapshots
+            self.queue = deque(item for item in self.queue if not item[1])
+            self.queued_snapshots = 0
+
+        self.queue.append((frame, droppable))
+        if droppable:
+            self.queued_snapshots += 1
+            self.peak_snapshots = max(self.peak_snapshots, self.queued_snapshots)
+        return True
+
+    def _dequeue(self) -> bytes:
+        frame, droppable = self.queue.popleft()
+        if droppable:
+            self.queued_snapshots -= 1
+        self.sent_frames += 1
+        self.sent_bytes += len(frame)
+        return frame
+
+    def _select(self, messages: dict, restart: bool = False) -> bytes:
+        # Text clients get the layout for their side, binary clients share one layout per protocol,
+        # unless they take deltas: then the tracker picks the base, over UDP when datagram is set.
+        # restart says the queued snapshots are about to be dropped, so the next one is a keyframe
+        if self.protocol == 'text':
+            return messages[self.side]
+        if self.deltas is not None:
+            snapshot = messages.get('delta')
+            if snapshot is not None:
+                return self.deltas.next_frame(snapshot, self.datagram is None, restart)
+
+            # START: clients ignore snapshots until they have it, so deltas start over from a keyframe
+            self.deltas.restart()
+        return messages[self.protocol]
+
+    def _full(self, droppable: bool) -> bool:
+        return droppable and self.queued_snapshots >= self.max_frames
+
+    def _held_back(self, droppable: bool) -> bool:
+        # A snapshot the rate controller skips for this client, control messages always go out
+        return droppable and self.rate is not None and not self.rate.due(time.perf_counter())
+
+    def _send_datagram(self, messages: dict) -> None:
+        frame = self._select(messages)
+        self.datagram(frame)
+        self.sent_frames += 1
+        self.sent_bytes += len(frame)
+
+    def buffered(self) -> int:
+        # Bytes already handed to the transport that the socket has not taken yet
+        return 0
+
+    @abstractmethod
+    def push(self, frame: bytes, droppable: bool = True) -> None:
+        # Queue one encoded message, a control message (not droppable) is never dropped
+        ...
+
+    @abstractmethod
+    def push_snapshot(self, messages: dict, droppable: bool = True) -> None:
+        # messages maps each side and each binary protocol name to its encoded snapshot, and 'delta'
+        # to its DeltaSnapshot. The choice is made under the same lock as switch_protocol, so
+        # nothing is sent out of order
+        ...
+
+    @abstractmethod
+    def switch_protocol(self, protocol: str, ack: bytes) -> None:
+        # Queue the ack and switch encodings in one step, every snapshot after the ack uses protocol
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        # Stop sending, queued messages are discarded
+        ...
+
+
+class ThreadedOutbox(ClientOutbox):
+    # Drains the queue with a dedicated sender thread, so a blocking send only ever blocks
+    # the thread of the client it belongs to
+    def __init__(self, sock: socket.socket, side: str, max_frames: int = 8, policy: str = 'latest') -> None:
+        super().__init__(side, max_frames, policy)
+        self.sock = sock
+        self.ready = threading.Condition()
+        threading.Thread(target = self._drain, daemon = True).start()
+
+    def push(self, frame: bytes, droppable: bool = True) -> None:
+        with self.ready:
+            if self.closed:
+                return
+            keep = self._enqueue(frame, droppable)
+            self.ready.notify()
+        if not keep:
+            self.close()
+
+    def push_snapshot(self, messages: dict, droppable: bool = True) -> None:
+        with self.ready:
+            if self.closed or self._held_back(droppable):
+                return
+            if droppable and self.datagram is not None:
+                self._send_datagram(messages)
+                return
+            keep = self._enqueue(self._select(messages, self._full(droppable)), droppable)
+            self.ready.notify()
+        if not keep:
+            self.close()
+
+    def switch_protocol(self, protocol: str, ack: bytes) -> None:
+        with self.ready:
+            if self.closed:
+                return
+            self._enqueue(ack, False)
+            self.protocol = protocol
+            self.ready.notify()
+
+    def _drain(self) -> None:
+        while True:
+            with self.ready:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+                frame = self._dequeue()
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.close()
+                return
+
+    def close(self) -> None:
+        with self.ready:
+            if self.closed:
+                return
+            self.closed = True
+            self.ready.notify()
+
+        # Wakes up the handle_client thread blocked in recv so it can clean up
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class AsyncOutbox(ClientOutbox):
+    # Drains the queue from an event loop task, awaiting drain() only blocks this client's task
+    def __init__(self, writer: asyncio.StreamWriter, side: str, max_frames: int = 8, policy: str = 'latest',
+                 write_buffer_limit: int = 16384) -> None:
+        super().__init__(side, max_frames, policy)
+        self.writer = writer
+        self.ready = asyncio.Event()
+
+        # Keep the transport's own buffer small so backlog builds up in our queue, where it can be dropped
+        writer.transport.set_write_buffer_limits(high = write_buffer_limit)
+        self.task = asyncio.get_running_loop().create_task(self._drain())
+
+    def push(self, frame: bytes, droppable: bool = True) -> None:
+        if self.closed:
+            return
+        if not self._enqueue(frame, droppable):
+            self.close()
+            return
+        self.ready.set()
+
+    def push_snapshot(self, messages: dict, droppable: bool = True) -> None:
+        if self.closed or self._held_back(droppable):
+            return
+        if droppable and self.datagram is not None:
+            self._send_datagram(messages)
+            return
+        self.push(self._select(messages, self._full(droppable)), droppable)
+
+    def switch_protocol(self, protocol: str, ack: bytes) -> None:
+        if self.closed:
+            return
+        self._enqueue(ack, False)
+        self.protocol = protocol
+        self.ready.set()
+
+    def buffered(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+    async def _drain(self) -> None:
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue and not self.closed:
+                    self.writer.write(self._dequeue())
+                    await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.ready.set()
+
+        # Closing the transport feeds EOF to the reader, so handle_client_async cleans up
+        self.writer.close()
@@ -0,0 +1,90 @@
+# =================================================================================================
+# Purpose:                  Draws pongClient's court from a background rendered once and updates only
+#                           the parts of the window that changed, so a frame costs a few small blits
+#                           instead of a full redraw and a full display update
+# =================================================================================================
+
+import pygame
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+
+
+class CourtRenderer:
+    # The background (black, both walls and the center line) never changes, so it is drawn once.
+    # Every frame the rects drawn last frame are restored from it, the paddles, ball and score are
+    # drawn again, and drawFrame returns old and new rects for pygame.display.update(). The score
+    # text is only rendered again when the score changes.
+    def __init__(self, screen: pygame.Surface, scoreFont: pygame.font.Font, winFont: pygame.font.Font,
+                 walls: list, centerLine: list, color: tuple = WHITE) -> None:
+        self.screen = screen
+        self.scoreFont = scoreFont
+        self.winFont = winFont
+        self.color = color
+
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.background.fill(BLACK)
+        for rect in list(walls) + list(centerLine):
+            pygame.draw.rect(self.background, color, rect)
+
+        self.score = None
+        self.scoreSurface = None
+        self.scoreRect = None
+        self.winText = None
+        self.winSurface = None
+        self.winRect = None
+
+        # Rects drawn last frame, and whether the whole window has to go out (first frame)
+        self.drawn = []
+        self.fullUpdate = True
+
+    def scoreImage(self, lScore: int, rScore: int) -> tuple:
+        # Same text and place as helperCode.updateScore, rendered once per score
+        if (lScore, rScore) != self.score:
+            self.score = (lScore, rScore)
+            self.scoreSurface = self.scoreFont.render(f"{lScore}   {rScore}", False, self.color)
+            self.scoreRect = self.scoreSurface.get_rect()
+            self.scoreRect.center = ((self.screen.get_width() / 2) + 5, 50)
+        return self.scoreSurface, self.scoreRect
+
+    def winImage(self, winText: str) -> tuple:
+        if winText != self.winText:
+            self.winText = winText
+            self.winSurface = self.winFont.render(winText, False, self.color, BLACK)
+            self.winRect = self.winSurface.get_rect()
+            self.winRect.center = (self.screen.get_width() / 2, self.screen.get_height() / 2)
+        return self.winSurface, self.winRect
+
+    def drawFrame(self, paddles: list, ball: pygame.Rect, lScore: int, rScore: int, winText: str = None) -> list:
+        # ball is not drawn once somebody has won, winText is drawn instead
+        screen = self.screen
+        if self.fullUpdate:
+            screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.drawn:
+                screen.blit(self.background, rect, rect)
+
+        previous = self.drawn
+        self.drawn = [pygame.draw.rect(screen, self.color, paddle) for paddle in paddles]
+        if winText:
+            self.drawn.append(screen.blit(*self.winImage(winText)))
+        else:
+            self.drawn.append(pygame.draw.rect(screen, self.color, ball))
+        self.drawn.append(screen.blit(*self.scoreImage(lScore, rScore)))
+
+        if self.fullUpdate:
+            self.fullUpdate = False
+            return [screen.get_rect()]
+        return previous + self.drawn
+
+    def addDrawn(self, rect: pygame.Rect) -> list:
+        # Something else drew on top of this frame (the profiler overlay), restore it next frame too.
+        # Returns the rects to add to this frame's update
+        if rect is None:
+            return []
+        self.drawn.append(rect)
+        return [rect]
+
+    def invalidate(self) -> None:
+        # Redraw and update the whole window next frame, e.g. after the window was covered
+        self.fullUpdate = True
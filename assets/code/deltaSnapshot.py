@@ -0,0 +1,141 @@
+# =================================================================================================
+# Purpose:                  Delta snapshots for clients that take the 'FEATURES delta;' offer: the server
+#                           side picks each client's base and keyframes, the client side rebuilds full
+#                           states from them
+# =================================================================================================
+
+# A state is the tuple (leftY, rightY, ballX, ballY, lScore, rScore, sync), the fields of MSG_STATE.
+# Most snapshots change only the ball and maybe one paddle, so a delta is 9 to 13 bytes where a
+# MSG_STATE is 15, and a spectator's TCP stream shrinks by about a third.
+
+from collections import OrderedDict
+
+from assets.code.wireProtocol import (
+    DELTA_FIELDS, DELTA_STRUCTS, MSG_DELTA, MSG_STATE, STATE, encode_delta
+)
+
+# Snapshots between keyframes for each client, about one a second at 60 Hz
+KEYFRAME_INTERVAL = 60
+
+# Sent states remembered per UDP client for its acknowledgements to refer to
+SENT_HISTORY = 128
+
+
+class DeltaSnapshot:
+    # One broadcast's state, shared by every recipient. Deltas are encoded once per distinct base,
+    # and over TCP nearly every client has the same one, the previous broadcast
+    __slots__ = ('state', 'keyframe', 'deltas')
+
+    def __init__(self, state: tuple, keyframe: bytes) -> None:
+        self.state = state
+        self.keyframe = keyframe
+        self.deltas = {}
+
+    def frame(self, base: tuple) -> bytes:
+        frame = self.deltas.get(base)
+        if frame is None:
+            frame = self.deltas[base] = encode_delta(base, self.state) or self.keyframe
+        return frame
+
+
+class DeltaTracker:
+    # Per client on the server. Over TCP (reliable) everything queued arrives in order, so the base
+    # is the previous snapshot, unless the slow-consumer policy is about to drop queued ones
+    # (restart). Over UDP the base is the newest state the client acknowledged, found by its sync,
+    # and a sync sent with two different states is never used as a base.
+    __slots__ = ('keyframe_interval', 'base', 'acked', 'reliable', 'since_keyframe', 'sent',
+                 'keyframes_sent', 'deltas_sent')
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.base = None
+        self.acked = None
+        self.reliable = True
+        self.since_keyframe = 0
+        self.sent = OrderedDict()
+        self.keyframes_sent = 0
+        self.deltas_sent = 0
+
+    def next_frame(self, snapshot: DeltaSnapshot, reliable: bool, restart: bool = False) -> bytes:
+        # restart is True when queued snapshots are about to be dropped, the client never gets the base
+        base = self.base if reliable else self.acked
+        if (restart or base is None or reliable != self.reliable
+                or self.since_keyframe >= self.keyframe_interval):
+            frame = snapshot.keyframe
+        else:
+            frame = snapshot.frame(base)
+
+        if frame is snapshot.keyframe:
+            self.keyframes_sent += 1
+            self.since_keyframe = 0
+        else:
+            self.deltas_sent += 1
+            self.since_keyframe += 1
+        self.base = snapshot.state
+        self.reliable = reliable
+
+        if not reliable:
+            sync = snapshot.state[6]
+            self.sent[sync] = snapshot.state if self.sent.get(sync, snapshot.state) == snapshot.state else None
+            self.sent.move_to_end(sync)
+            if len(self.sent) > SENT_HISTORY:
+                self.sent.popitem(last = False)
+        return frame
+
+    def restart(self) -> None:
+        # The next snapshot is a keyframe, whatever the client had before is forgotten
+        self.base = None
+        self.acked = None
+
+    def ack(self, sync: int) -> None:
+        state = self.sent.get(sync)
+        if state is not None and (self.acked is None or ((sync - self.acked[6]) & 0xFFFFFFFF) < 0x80000000):
+            self.acked = state
+
+
+class DeltaDecoder:
+    # Client side: turns MSG_STATE and MSG_DELTA into full states. The last few states are kept by
+    # sync, a delta whose base is not among them (lost, or from before this client joined) is
+    # skipped until the next keyframe
+    def __init__(self, history: int = SENT_HISTORY) -> None:
+        self.history = OrderedDict()
+        self.capacity = history
+        self.latest = None
+        self.missingBase = 0
+
+    def apply(self, frame) -> tuple:
+        # Returns the state, or None when it cannot be rebuilt
+        if frame[0] == MSG_STATE:
+            state = STATE.unpack_from(frame)[1:]
+        elif frame[0] == MSG_DELTA:
+            state = self.rebuild(frame)
+            if state is None:
+                self.missingBase += 1
+                return None
+        else:
+            return None
+
+        sync = state[6]
+        self.history[sync] = state
+        self.history.move_to_end(sync)
+        if len(self.history) > self.capacity:
+            self.history.popitem(last = False)
+        self.latest = sync
+        return state
+
+    def rebuild(self, frame) -> tuple:
+        mask = frame[1]
+        if self.latest is None or mask >= len(DELTA_STRUCTS) or len(frame) != DELTA_STRUCTS[mask].size:
+            return None
+        _, _, baseLow, advance, *values = DELTA_STRUCTS[mask].unpack(frame)
+
+        # The base is the newest sync we have whose low 16 bits match
+        baseSync = self.latest - ((self.latest - baseLow) & 0xFFFF)
+        base = self.history.get(baseSync)
+        if base is None:
+            return None
+
+        if mask == 0:
+            return (*base[:6], baseSync + advance)
+        values = iter(values)
+        return (*(next(values) if mask >> i & 1 else base[i] for i in range(len(DELTA_FIELDS))), baseSync + advance)
@@ -0,0 +1,53 @@
+# =================================================================================================
+# Purpose:                  Fixed-timestep accumulator for pongClient, so the ball, the paddles and the
+#                           sync counter advance at the simulation rate whatever rate frames are drawn at
+# =================================================================================================
+
+import time
+
+
+class FixedTimestep:
+    # Every frame advance() adds the real time since the last call and returns how many whole ticks
+    # fit in it. The rest carries over, and alpha says how far into the next tick the frame is, for
+    # drawing between the last two simulated states. A stall longer than maxSteps ticks (a dragged
+    # window, a breakpoint) is not made up all at once, the extra time is dropped and counted.
+    def __init__(self, tickRate: float = 60.0, maxSteps: int = 15) -> None:
+        self.tickSeconds = 1.0 / tickRate
+        self.maxSteps = maxSteps
+        self.accumulator = 0.0
+        self.last = None
+        self.ticks = 0
+        self.droppedSeconds = 0.0
+
+    def advance(self, now: float = None) -> int:
+        if now is None:
+            now = time.perf_counter()
+
+        # The first frame runs one tick so the game starts moving straight away
+        if self.last is None:
+            self.last = now
+            self.ticks += 1
+            return 1
+        self.accumulator += now - self.last
+        self.last = now
+
+        steps = int(self.accumulator / self.tickSeconds)
+        self.accumulator -= steps * self.tickSeconds
+        if steps > self.maxSteps:
+            self.droppedSeconds += (steps - self.maxSteps) * self.tickSeconds
+            steps = self.maxSteps
+        self.ticks += steps
+        return steps
+
+    @property
+    def alpha(self) -> float:
+        # 0 right after a tick, close to 1 just before the next one
+        return min(1.0, self.accumulator / self.tickSeconds)
+
+
+def interpolate(previous: int, current: int, alpha: float, jumpDistance: int = 100) -> int:
+    # Where to draw something that moved from previous to current in the last tick. A bigger jump is
+    # a reset or a correction, not movement, and is drawn where it ended up
+    if abs(current - previous) > jumpDistance:
+        return current
+    return round(previous + (current - previous) * alpha)
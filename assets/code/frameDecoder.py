@@ -0,0 +1,99 @@
+# =================================================================================================
+# Purpose:                  Incremental decoder that turns a TCP byte stream into complete text or
+#                           binary messages, shared by pongClient and pongServer
+# =================================================================================================
+
+from typing import Iterable, Iterator
+
+from assets.code.wireProtocol import MESSAGE_SIZES, TEXT_PROTOCOL, message_size
+
+# ';' as an int, bytearray finds an int several times faster than a one-byte bytes
+TERMINATOR = ord(';')
+
+
+class FrameDecoder:
+    # Bytes go in with feed(), complete messages come out of frames(), each a bytearray of its own.
+    # Text is split once per call. A read that holds no complete message, or exactly one, is answered
+    # without a generator; several messages come from one, since the caller may stop or switch the
+    # protocol after any of them and the rest must stay in the buffer.
+    #
+    # Next to splitting a str inline, as playGame used to, this wins once reads hold several messages
+    # and loses a method call or two per read when they hold one message or less, see
+    # benchmarks/frameDecoder.py.
+    #
+    # Text messages are ';' terminated (the ';' is not part of the message). Binary messages are sized
+    # by their type byte, see wireProtocol.MESSAGE_SIZES. The protocol can be switched between two
+    # messages, e.g. right after the 'USE bin1' ack, and frames() picks it up on the next message.
+    def __init__(self, protocol: str = TEXT_PROTOCOL) -> None:
+        self.protocol = protocol
+        self.buffer = bytearray()
+        self.seen_delimiter = False
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+
+    def frames(self) -> Iterable[bytearray]:
+        buffer = self.buffer
+        if self.protocol != TEXT_PROTOCOL:
+            if not buffer:
+                return ()
+
+            # message_size is only needed for deltas, their size depends on the mask
+            size = MESSAGE_SIZES.get(buffer[0]) or message_size(buffer, 0)
+            if len(buffer) < size:
+                return ()
+
+            # A read that is exactly one message is the message
+            if len(buffer) == size:
+                self.buffer = bytearray()
+                return (buffer,)
+            return self._binary_frames()
+
+        if TERMINATOR not in buffer:
+            return ()
+        messages = buffer.split(b';')
+        self.buffer = messages.pop()
+        self.seen_delimiter = True
+
+        # Nothing follows a lone message that ends the read, so it cannot be read in the wrong protocol
+        if len(messages) == 1 and not self.buffer:
+            return messages
+        return self._text_frames(messages)
+
+    def _text_frames(self, messages: list) -> Iterator[bytearray]:
+        # A caller that stops early or switches protocol gets the messages it did not take put back
+        protocol = self.protocol
+        taken = 0
+        try:
+            for message in messages:
+                taken += 1
+                yield message
+                if self.protocol != protocol:
+                    break
+        finally:
+            if taken < len(messages):
+                self.buffer = bytearray(b';'.join(messages[taken:])) + b';' + self.buffer
+        if self.protocol != protocol:
+            yield from self.frames()
+
+    def _binary_frames(self) -> Iterator[bytearray]:
+        # What a caller that stops early did not take stays at the front of the buffer
+        buffer = self.buffer
+        start = 0
+        try:
+            while start < len(buffer):
+                end = start + (MESSAGE_SIZES.get(buffer[start]) or message_size(buffer, start))
+                if end > len(buffer):
+                    return
+                frame = buffer[start:end]
+                start = end
+                yield frame
+        finally:
+            del buffer[:start]
+
+    def switch_protocol(self, protocol: str) -> None:
+        self.protocol = protocol
+
+    def pending(self) -> int:
+        # Bytes received that do not form a complete message yet
+        return len(self.buffer)
@@ -0,0 +1,170 @@
+# =================================================================================================
+# Purpose:                  Opt-in per-frame phase timers for pongClient's game loop, with rolling
+#                           percentiles drawn as an overlay and an optional CSV trace of every frame
+# =================================================================================================
+
+# playGame calls lap(phase) right after each part of the frame, so every phase gets the time since
+# the previous lap, and endFrame() once per frame. A phase lapped twice in one frame (drawing happens
+# in a few places) adds up. Turned on with the PONG_PROFILE environment variable, see fromSetting().
+
+import csv
+import time
+from collections import deque
+
+import pygame
+
+# In loop order, anything lapped under another name is added to the end of the table
+PHASES = ('events', 'paddles', 'ball', 'send', 'draw', 'overlay', 'flip', 'tick', 'recv', 'apply')
+
+OVERLAY_COLOR = (0, 255, 0)
+OVERLAY_WIDTH = 170
+OVERLAY_COLUMNS = (80, 125, 170)     # right edges of the p50, p99 and max columns
+
+
+class NullProfiler:
+    # What playGame uses when profiling is off, every call does nothing
+    overlay = False
+
+    def lap(self, phase: str) -> None:
+        pass
+
+    def endFrame(self) -> None:
+        pass
+
+    def draw(self, screen: pygame.Surface) -> pygame.Rect:
+        return None
+
+    def toggleOverlay(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FrameProfiler:
+    # window          Frames the rolling percentiles cover
+    # hitchSeconds    A frame longer than this is a hitch, its slowest phase is remembered
+    # csvPath         Write one row per frame (frame, start time, total, every phase) in milliseconds
+    def __init__(self, overlay: bool = True, csvPath: str = None, window: int = 240,
+                 hitchSeconds: float = 1 / 30, refreshSeconds: float = 0.5) -> None:
+        self.overlay = overlay
+        self.hitchSeconds = hitchSeconds
+        self.refreshSeconds = refreshSeconds
+        self.phases = list(PHASES)
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.history = {phase: deque(maxlen = window) for phase in self.phases + ['total']}
+        self.frames = 0
+        self.hitches = 0
+        self.lastHitch = None
+        self.frameStart = time.perf_counter()
+        self.last = self.frameStart
+
+        # Overlay lines are rendered at most every refreshSeconds, not every frame
+        self.font = None
+        self.lines = []
+        self.nextRefresh = 0.0
+
+        self.csvFile = None
+        self.writer = None
+        self.nextFlush = 0.0
+        if csvPath:
+            self.csvFile = open(csvPath, 'w', newline = '')
+            self.writer = csv.writer(self.csvFile)
+            self.writer.writerow(['frame', 'start_s', 'total_ms'] + [f'{phase}_ms' for phase in self.phases])
+
+    @classmethod
+    def fromSetting(cls, setting: str):
+        # 'overlay', 'csv=trace.csv' or both, comma separated. Empty means no profiling
+        if not setting:
+            return NullProfiler()
+        options = [option.strip() for option in setting.split(',')]
+        csvPath = next((option[4:] for option in options if option.startswith('csv=')), None)
+        return cls(overlay = 'overlay' in options or not csvPath, csvPath = csvPath)
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        if phase not in self.current:
+            self.phases.append(phase)
+            self.current[phase] = 0.0
+            self.history[phase] = deque(maxlen = self.history['total'].maxlen)
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def endFrame(self) -> None:
+        now = time.perf_counter()
+        total = now - self.frameStart
+        self.frames += 1
+        for phase in self.phases:
+            self.history[phase].append(self.current[phase])
+        self.history['total'].append(total)
+
+        if total > self.hitchSeconds:
+            self.hitches += 1
+            worst = max(self.phases, key = self.current.get)
+            self.lastHitch = (worst, self.current[worst], total)
+
+        if self.writer is not None:
+            self.writer.writerow([self.frames, f'{self.frameStart:.6f}', f'{total * 1000:.3f}'] +
+                                 [f'{self.current[phase] * 1000:.3f}' for phase in self.phases])
+            if now >= self.nextFlush:
+                self.nextFlush = now + 1.0
+                self.csvFile.flush()
+
+        for phase in self.phases:
+            self.current[phase] = 0.0
+        self.frameStart = self.last = now
+
+    def percentiles(self, phase: str) -> tuple:
+        # (p50, p99, max) in seconds over the rolling window
+        ordered = sorted(self.history[phase])
+        if not ordered:
+            return 0.0, 0.0, 0.0
+        return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], ordered[-1]
+
+    def draw(self, screen: pygame.Surface) -> pygame.Rect:
+        # Blit the table in the top left corner, call it after everything else is drawn. Returns the
+        # area covered, or None when the overlay is hidden
+        if not self.overlay:
+            return None
+        now = time.perf_counter()
+        if now >= self.nextRefresh:
+            self.nextRefresh = now + self.refreshSeconds
+            self.lines = self.renderLines()
+        area = pygame.Rect(14, 14, 0, 0)
+        y = 14
+        for surface in self.lines:
+            area.union_ip(screen.blit(surface, (14, y)))
+            y += surface.get_height()
+        return area
+
+    def renderLines(self) -> list:
+        # One surface per row, every cell placed at a fixed column so any font lines up
+        if self.font is None:
+            self.font = pygame.font.SysFont('monospace', 12)
+        rows = [('ms', 'p50', 'p99', 'max')]
+        for phase in self.phases + ['total']:
+            rows.append((phase, *(f'{value * 1000:.2f}' for value in self.percentiles(phase))))
+        rows.append((f'hitches {self.hitches}',))
+        if self.lastHitch is not None:
+            phase, spent, total = self.lastHitch
+            rows.append((f'last {total * 1000:.1f} ms, {phase} {spent * 1000:.1f}',))
+
+        lines = []
+        for row in rows:
+            label = self.font.render(row[0], False, OVERLAY_COLOR)
+            line = pygame.Surface((max(OVERLAY_WIDTH, label.get_width()), self.font.get_linesize()))
+            line.blit(label, (0, 0))
+            for right, cell in zip(OVERLAY_COLUMNS, row[1:]):
+                surface = self.font.render(cell, False, OVERLAY_COLOR)
+                line.blit(surface, (right - surface.get_width(), 0))
+            lines.append(line)
+        return lines
+
+    def toggleOverlay(self) -> None:
+        self.overlay = not self.overlay
+
+    def close(self) -> None:
+        if self.csvFile is not None:
+            self.csvFile.close()
+            self.csvFile = None
+            self.writer = None
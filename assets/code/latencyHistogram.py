@@ -0,0 +1,67 @@
+# =================================================================================================
+# Purpose:                  Fixed-size histogram of durations with about 3% resolution, so millions of
+#                           latency samples can be counted, merged across processes and turned into
+#                           percentiles without keeping every sample
+# =================================================================================================
+
+import math
+
+# Bucket i holds durations from e^(i / BUCKETS_PER_E) to e^((i + 1) / BUCKETS_PER_E) microseconds,
+# 1 us up to about 3 minutes
+BUCKETS_PER_E = 32
+BUCKET_COUNT = 620
+
+
+class LatencyHistogram:
+    # record() takes seconds, percentile() and the other readouts return seconds
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = seconds * 1e6
+        index = int(math.log(micros) * BUCKETS_PER_E) if micros > 1 else 0
+        self.counts[min(index, BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct: float) -> float:
+        # Middle of the bucket holding the pct-th sample (nearest rank), NaN when empty
+        if not self.count:
+            return float('nan')
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.max, math.exp((i + 0.5) / BUCKETS_PER_E) / 1e6)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float('nan')
+
+    def to_dict(self) -> dict:
+        # Sparse form, small enough to print as JSON or send between processes
+        return {'count': self.count, 'total': self.total, 'max': self.max,
+                'buckets': {i: c for i, c in enumerate(self.counts) if c}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        histogram = cls()
+        for i, count in data['buckets'].items():
+            histogram.counts[int(i)] = count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.max = data['max']
+        return histogram
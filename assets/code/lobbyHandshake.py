@@ -0,0 +1,133 @@
+# =================================================================================================
+# Purpose:                  The client's side of the lobby, from the server's ROOMS offer up to START
+#                           and the binary protocol ack, without any socket of its own
+# =================================================================================================
+
+# LobbyHandshake is fed whatever bytes the server sent and returns what to answer, so the caller
+# decides how to wait: pongClient's readHandshake blocks in recv (resuming a session), the start
+# screen checks the socket from Tk's event loop and the command line waits in select. Nothing here
+# imports pygame or tkinter.
+
+import time
+
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.matchRoom import SESSION_LINE
+from assets.code.matchStats import NAME_REQUEST, PLAYER_NAME
+from assets.code.udpTransport import parse_udp_offer
+from assets.code.wireProtocol import (
+    AUTHORITATIVE_MODE, BINARY_PROTOCOL, DELTA_FEATURE, MSG_PING, MSG_PONG, MSG_START, NAME_FEATURE, PING,
+    PING_FEATURE, PROTOCOL_ACCEPT, ROLLBACK_MODE, encode_ping
+)
+
+
+class LobbyHandshake:
+    # One connection's handshake. info holds what playGame needs, complete once done is True
+    def __init__(self, roomRequest: bytes, playerName: str = "") -> None:
+        self.roomRequest = roomRequest
+        self.playerName = playerName
+        self.info = {'screenWidth': None, 'screenHeight': None, 'paddleSide': None, 'authoritative': False,
+                     'rollback': False, 'roomName': None, 'udpOffer': None, 'sessionToken': None,
+                     'startTime': None}
+
+        # Text until the server acknowledges our request for the binary protocol
+        self.decoder = self.info['decoder'] = FrameDecoder()
+        self.negotiating = False
+        self.gameStarted = False
+
+    @property
+    def done(self) -> bool:
+        # START arrived and, if we asked for bin1, so did the server's ack
+        return self.gameStarted and not self.negotiating
+
+    def feed(self, data: bytes) -> bytes:
+        # Everything the server sent since the last call, returns our answers (often nothing). The
+        # decoder keeps whatever followed START for playGame
+        self.decoder.feed(data)
+        replies = []
+        for frame in self.decoder.frames():
+            if self.handle(frame, replies):
+                break
+        return b''.join(replies)
+
+    def handle(self, frame: bytes, replies: list) -> bool:
+        # One message, answers go on replies. True once the rest belongs to playGame
+        info = self.info
+
+        # Binary messages, only START is expected before the game loop takes over
+        if self.decoder.protocol == BINARY_PROTOCOL:
+            if frame[0] == MSG_START:
+                self.start()
+                return True
+            if frame[0] == MSG_PING:
+                replies.append(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
+            return False
+
+        msg = str(frame, 'ascii').strip()
+
+        # Parse the message from the server
+        if msg == "START":
+            self.start()
+            return not self.negotiating
+        elif msg.startswith("ROOMS"):
+
+            # Servers hosting several matches ask which one we want before the handshake
+            replies.append(self.roomRequest)
+        elif msg.startswith("ROOM "):
+            info['roomName'] = msg.split()[1]
+        elif msg.startswith(SESSION_LINE + " "):
+
+            # Sent to players, it gets our side back if the connection drops during the match
+            info['sessionToken'] = msg.split()[1]
+        elif msg == AUTHORITATIVE_MODE.decode().rstrip(';'):
+
+            # The server simulates the ball and score, we only send our paddle
+            info['authoritative'] = True
+        elif msg == ROLLBACK_MODE.decode().rstrip(';'):
+
+            # The server only relays inputs, we simulate the match ourselves
+            info['rollback'] = True
+        elif msg == PING_FEATURE.decode().rstrip(';'):
+
+            # The server measures round trips, say we will answer its pings (before 'USE bin1;')
+            replies.append(PING_FEATURE)
+        elif msg == DELTA_FEATURE.decode().rstrip(';'):
+
+            # Snapshots may come as deltas against one we already have, also before 'USE bin1;'
+            replies.append(DELTA_FEATURE)
+        elif msg == NAME_FEATURE.decode().rstrip(';'):
+
+            # The server keeps results per player, without a name we are known by our IP address
+            if PLAYER_NAME.fullmatch(self.playerName):
+                replies.append(f"{NAME_REQUEST} {self.playerName};".encode())
+        elif msg.startswith("PROTOCOLS"):
+
+            # Newer servers offer the binary protocol, accept it before sending any update
+            if BINARY_PROTOCOL in msg.split()[1:]:
+                replies.append(PROTOCOL_ACCEPT)
+                self.negotiating = True
+        elif msg.startswith("UDP "):
+
+            # The server can send snapshots over UDP, playGame takes it up once we speak bin1
+            info['udpOffer'] = parse_udp_offer(msg)
+        elif msg == PROTOCOL_ACCEPT.decode().rstrip(';'):
+
+            # Everything after the server's ack is binary
+            self.decoder.switch_protocol(BINARY_PROTOCOL)
+            self.negotiating = False
+            return self.gameStarted
+        elif "," in msg:
+            try:
+                screenWidth, screenHeight, paddleSide = msg.split(",")
+                info['screenWidth'] = int(screenWidth)
+                info['screenHeight'] = int(screenHeight)
+                info['paddleSide'] = paddleSide
+            except ValueError:
+                pass
+        return False
+
+    def start(self) -> None:
+        # START arrived, noted once for the time to the first frame
+        if not self.gameStarted:
+            self.gameStarted = True
+            self.info['startTime'] = time.perf_counter()
+            print("Game starting.")
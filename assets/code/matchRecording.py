@@ -0,0 +1,248 @@
+# =================================================================================================
+# Purpose:                  Match recordings: pongServer (--record) appends every broadcast state of a
+#                           match to a compact binary log with a seek index, and a replay server
+#                           (--replay) memory-maps one and plays it to spectators from any sync
+# =================================================================================================
+
+# File layout, big-endian like wireProtocol:
+#   header    RECORD_HEADER    magic, court width and height, authoritative flag, room name
+#   records   RECORD_TIME      milliseconds since the previous record, then one wireProtocol message:
+#                              MSG_START, a MSG_STATE keyframe, or a MSG_DELTA against the record
+#                              before it
+#   index     INDEX_ENTRY      (sync, milliseconds since the start, offset) of every keyframe
+#   footer    RECORD_FOOTER    where the index starts, how many entries it has, index magic
+# There is a keyframe every INDEX_INTERVAL states, so a seek decodes at most that many records. The
+# index and footer are written by close(), a recording that was cut short (the server was killed)
+# has neither and Recording rebuilds the index by scanning it once.
+
+import bisect
+import mmap
+import os
+import struct
+import time
+from typing import Callable
+
+from assets.code.deltaSnapshot import DeltaDecoder
+from assets.code.wireProtocol import (
+    MSG_START, MSG_STATE, START_MESSAGE, STATE, encode_delta, encode_state, message_size
+)
+
+RECORD_MAGIC = b'PONGREC1'
+INDEX_MAGIC = b'PONGIDX1'
+RECORD_SUFFIX = '.pongrec'
+
+RECORD_HEADER = struct.Struct('!8sHH?16s')
+RECORD_TIME = struct.Struct('!H')
+INDEX_ENTRY = struct.Struct('!IIQ')
+RECORD_FOOTER = struct.Struct('!QI8s')
+
+# States between keyframes, and so between index entries: one second of a 60 Hz match
+INDEX_INTERVAL = 60
+
+# Longest pause one record can hold, a longer one is replayed this long
+MAX_RECORD_GAP = 0xFFFF
+
+# Seconds between checks for the first spectator, a replay starts when somebody is watching
+SPECTATOR_POLL = 0.05
+
+
+class MatchRecorder:
+    # Writes one match. start() and append() are called in broadcast order (pongServer holds the
+    # room lock), and go through the file's buffer so most of them cost no system call
+    def __init__(self, path: str, width: int, height: int, authoritative: bool, room_name: str,
+                 index_interval: int = INDEX_INTERVAL, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.path = path
+        self.file = open(path, 'xb')
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, width, height, authoritative, room_name.encode()))
+        self.offset = RECORD_HEADER.size
+        self.index_interval = index_interval
+        self.index = []
+        self.base = None
+        self.since_keyframe = 0
+        self.states = 0
+
+        # Wall clock of the last record, and recording time, which only differs after a pause longer
+        # than MAX_RECORD_GAP
+        self.clock = clock
+        self.started = clock()
+        self.wall = 0
+        self.time = 0
+
+    def start(self) -> None:
+        self._write(self._gap(), START_MESSAGE)
+
+    def append(self, state: tuple, keyframe: bytes = None) -> None:
+        # state is (leftY, rightY, ballX, ballY, lScore, rScore, sync), keyframe its MSG_STATE if
+        # the caller already has it
+        gap = self._gap()
+        frame = None
+        if self.base is not None and self.since_keyframe < self.index_interval:
+            frame = encode_delta(self.base, state)
+        if frame is None:
+            frame = keyframe or encode_state(*state)
+            self.index.append((state[6] & 0xFFFFFFFF, self.time, self.offset))
+            self.since_keyframe = 0
+        self.since_keyframe += 1
+        self.base = state
+        self.states += 1
+        self._write(gap, frame)
+
+    def close(self) -> int:
+        # Writes the index and footer, returns the file's size
+        start = self.offset
+        self.file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in self.index))
+        self.file.write(RECORD_FOOTER.pack(start, len(self.index), INDEX_MAGIC))
+        self.file.close()
+        return start + len(self.index) * INDEX_ENTRY.size + RECORD_FOOTER.size
+
+    def _gap(self) -> int:
+        wall = int((self.clock() - self.started) * 1000)
+        gap = min(wall - self.wall, MAX_RECORD_GAP)
+        self.wall = wall
+        self.time += gap
+        return gap
+
+    def _write(self, gap: int, message: bytes) -> None:
+        self.file.write(RECORD_TIME.pack(gap))
+        self.file.write(message)
+        self.offset += RECORD_TIME.size + len(message)
+
+
+class Recording:
+    # A recording opened for replay. The file is memory-mapped, so opening it reads the header and
+    # index only, a seek is a bisect over the index, and reading records touches only their pages
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        if len(self.data) < RECORD_HEADER.size or self.data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            raise ValueError(f"{path} is not a match recording")
+        _, self.width, self.height, self.authoritative, room = RECORD_HEADER.unpack_from(self.data)
+        self.room = room.rstrip(b'\0').decode()
+
+        # Records end where the index starts
+        self.end = len(self.data)
+        self.complete = False
+        if len(self.data) >= RECORD_HEADER.size + RECORD_FOOTER.size:
+            start, count, magic = RECORD_FOOTER.unpack_from(self.data, len(self.data) - RECORD_FOOTER.size)
+            if magic == INDEX_MAGIC and start + count * INDEX_ENTRY.size + RECORD_FOOTER.size == len(self.data):
+                self.end = start
+                self.complete = True
+                entries = list(INDEX_ENTRY.iter_unpack(self.data[start:start + count * INDEX_ENTRY.size]))
+        if not self.complete:
+            entries = self._scan()
+        self.syncs = [sync for sync, _, _ in entries]
+        self.times = [ms for _, ms, _ in entries]
+        self.offsets = [offset for _, _, offset in entries]
+
+    def _scan(self) -> list:
+        # Index entries of a recording without one, which also ends the records at the last whole one
+        entries = []
+        elapsed = 0
+        end = RECORD_HEADER.size
+        try:
+            for gap, frame, offset in self.records():
+                elapsed += gap
+                if frame[0] == MSG_STATE:
+                    entries.append((STATE.unpack_from(frame)[7], elapsed, offset))
+                end = offset + RECORD_TIME.size + len(frame)
+        except ValueError:
+            pass
+        self.end = end
+        return entries
+
+    def records(self, offset: int = RECORD_HEADER.size):
+        # (milliseconds since the previous record, message, offset of the record) from offset on
+        data = self.data
+        while offset + RECORD_TIME.size < self.end:
+            start = offset + RECORD_TIME.size
+            end = start + message_size(data, start)
+            if end > self.end:
+                return
+            yield RECORD_TIME.unpack_from(data, offset)[0], data[start:end], offset
+            offset = end
+
+    def seek(self, sync: int) -> tuple:
+        # (offset, milliseconds since the start) of the last keyframe at or before sync, the first
+        # one if sync comes before it. Syncs never go down during a match, so the index is sorted
+        if not self.offsets:
+            return RECORD_HEADER.size, 0
+        i = max(0, bisect.bisect_right(self.syncs, sync) - 1)
+
+        # The entry's time includes the gap before its record, which records() gives back
+        return self.offsets[i], self.times[i] - RECORD_TIME.unpack_from(self.data, self.offsets[i])[0]
+
+    def duration(self) -> float:
+        # Seconds from the first record to the last keyframe, or to the end once scanned
+        return self.times[-1] / 1000 if self.times else 0.0
+
+
+class ReplayPlayer:
+    # Plays a Recording on the server's clock, speed times as fast as it was recorded, starting at
+    # from_sync. It has the attributes apply_upstream_events reads from an UpstreamFeed (width,
+    # height, room, authoritative) and due() returns the same events after ('ready',), so a replay
+    # server serves its spectators the way a relay does
+    def __init__(self, recording: Recording, speed: float = 1.0, from_sync: int = 0) -> None:
+        self.recording = recording
+        self.width = recording.width
+        self.height = recording.height
+        self.room = recording.room
+        self.authoritative = recording.authoritative
+        self.speed = speed
+        self.from_sync = from_sync
+        offset, self.clock = recording.seek(from_sync)
+        self.records = recording.records(offset)
+        self.decoder = DeltaDecoder()
+        self.started = None
+        self.first = None
+        self.pending = None
+        self.finished = False
+        self.snapshots = 0
+
+    def due(self, now: float) -> list:
+        # Events for every state whose time has come, with ('start',) first on the first call, which
+        # is when playback starts
+        events = []
+        if self.started is None:
+            self.started = now
+            events.append(('start',))
+        while True:
+            wake = self.next_due()
+            if wake is None or wake > now:
+                return events
+            events.append(('state', self.pending[1]))
+            self.pending = None
+            self.snapshots += 1
+
+    def next_due(self) -> float:
+        # When the next state is due, in the clock due() is given, None once the recording has ended
+        if self.pending is None:
+            self.pending = self._next()
+            if self.pending is None:
+                self.finished = True
+                return None
+        return self.started + (self.pending[0] - self.first) / 1000 / self.speed
+
+    def _next(self) -> tuple:
+        # (recording time, state) of the next state at or after from_sync
+        for gap, frame, _ in self.records:
+            self.clock += gap
+            if frame[0] == MSG_START:
+                continue
+            state = self.decoder.apply(frame)
+            if state is not None and state[6] >= self.from_sync:
+                if self.first is None:
+                    self.first = self.clock
+                return self.clock, state
+        return None
+
+
+def recording_path(directory: str, room_name: str) -> str:
+    # A new file in directory for a match in room_name, named after the room and the time it started
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f'{room_name}-{stamp}{RECORD_SUFFIX}')
+    count = 1
+    while os.path.exists(path):
+        count += 1
+        path = os.path.join(directory, f'{room_name}-{stamp}-{count}{RECORD_SUFFIX}')
+    return path
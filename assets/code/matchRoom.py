@@ -0,0 +1,262 @@
+# =================================================================================================
+# Purpose:                  Per-match state for pongServer and the manager that places clients into
+#                           matches, so one server process can host many games at once
+# =================================================================================================
+
+# Room selection, between the server's first line and the usual handshake:
+#   server -> client   'ROOMS default:1 room-3:1;'   rooms waiting for a player, no commas so older
+#                                                    clients ignore it
+#   client -> server   'ROOM name;'                  join that room, creating it if needed
+#   client -> server   'ROOM;'                       join any room waiting for a player, or a new one
+#   client -> server   'WATCH name;'                 join that room as a spectator, even while it is
+#                                                    missing a player (spectator relays)
+#   client -> server   'RESUME name token;'          take back the side token was issued for
+#   server -> client   'width,height,side;ROOM name;SESSION token;PROTOCOLS bin1;...'
+# Older clients never answer, after a short wait they go to the 'default' room, which behaves like
+# the single match the server used to host.
+#
+# Every player gets a session token with its side. When a player's connection drops during a match,
+# its side is held for resume_grace seconds: new clients become spectators meanwhile, and a client
+# that answers the ROOMS offer with the room and token gets the side back. A connection that still
+# holds the side (its drop was not noticed yet) is closed in favour of the one resuming. Older
+# clients ignore the SESSION line.
+
+import re
+import secrets
+import threading
+import time
+from typing import Callable
+
+DEFAULT_ROOM = 'default'
+WATCH_REQUEST = 'WATCH'
+RESUME_REQUEST = 'RESUME'
+SESSION_LINE = 'SESSION'
+ROOM_NAME = re.compile(r'[A-Za-z0-9_-]{1,16}')
+
+# Seconds a dropped player's side is kept for it during a match
+RESUME_GRACE = 30.0
+
+PADDLE_START_Y = 215
+
+
+class MatchRoom:
+    # Everything one match needs, in slots instead of a per-instance __dict__ so hundreds of rooms
+    # stay small. The field names are the ones pongServer used for its module globals
+    __slots__ = ('name', 'leftPaddleY', 'rightPaddleY', 'ballX', 'ballY', 'lScore', 'rScore', 'sync',
+                 'clients', 'lock', 'game_running', 'state_dirty', 'simulation', 'recorder',
+                 'inputs', 'input_frames', 'tokens', 'held', 'tally', 'names')
+
+    def __init__(self, name: str, screenWidth: int = 640, screenHeight: int = 480, simulation = None,
+                 lock = None) -> None:
+        self.name = name
+        self.leftPaddleY = PADDLE_START_Y
+        self.rightPaddleY = PADDLE_START_Y
+        self.ballX = screenWidth // 2
+        self.ballY = screenHeight // 2
+        self.lScore = 0
+        self.rScore = 0
+        self.sync = 0
+
+        # (outbox, side) pairs, 2 players + any spectators
+        self.clients = []
+        self.lock = lock or threading.Lock()
+        self.game_running = False
+        self.state_dirty = False
+
+        # MatchSimulation when the server owns the ball and score, None when the left client does
+        self.simulation = simulation
+
+        # matchRecording.MatchRecorder while the match is being recorded (pongServer --record)
+        self.recorder = None
+
+        # Every MSG_PEER_INPUT of the running match in rollback mode, for clients that join it late, and
+        # the newest frame relayed per side, so inputs a resumed player sends again are not repeated
+        self.inputs = []
+        self.input_frames = {'left': 0, 'right': 0}
+
+        # Session token of each player side, and until when (time.monotonic()) a dropped player's side
+        # is kept for it
+        self.tokens = {}
+        self.held = {}
+
+        # matchStats.MatchTally of the running match, and the name each player side's results are kept
+        # under (pongServer --match-stats)
+        self.tally = None
+        self.names = {}
+
+    def set_paddle(self, side: str, paddleY: int) -> None:
+        if side == 'left':
+            self.leftPaddleY = paddleY
+        elif side == 'right':
+            self.rightPaddleY = paddleY
+
+    def open_side(self) -> str:
+        # The player side nobody holds, left first, or None when both are taken or kept for a dropped player
+        sides = [s for _, s in self.clients]
+        now = time.monotonic()
+        for side in ('left', 'right'):
+            if side not in sides and self.held.get(side, 0) <= now:
+                return side
+        return None
+
+    def holding(self) -> bool:
+        # A dropped player's side is still kept for it
+        now = time.monotonic()
+        return any(deadline > now for deadline in self.held.values())
+
+    def resume(self, token: str) -> tuple:
+        # The side token was issued for, and the outbox still connected on it (None if the side is
+        # free), or (None, None) for an unknown token
+        for side, issued in self.tokens.items():
+            if secrets.compare_digest(issued, token):
+                return side, next((c for c, s in self.clients if s == side), None)
+        return None, None
+
+    def waiting(self) -> bool:
+        # Somebody is in the room and a player is still missing
+        return bool(self.clients) and not self.game_running and self.open_side() is not None
+
+
+class RoomManager:
+    # Rooms by name. Lock order is manager, then room, for anything that needs both
+    def __init__(self, screenWidth: int = 640, screenHeight: int = 480,
+                 make_simulation: Callable[[], object] = None, max_listed: int = 20,
+                 make_lock: Callable[[], object] = None, resume_grace: float = RESUME_GRACE) -> None:
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+        self.make_simulation = make_simulation
+        self.resume_grace = resume_grace
+
+        # Room locks come from here when set, e.g. serverMetrics.TimedLock
+        self.make_lock = make_lock
+        self.max_listed = max_listed
+        self.rooms = {}
+        self.lock = threading.Lock()
+        self.created = 0
+
+        # Names of rooms kept when their last client leaves, see pin(), and of empty rooms kept while a
+        # dropped player may still resume
+        self.pinned = set()
+        self.abandoned = set()
+
+    def _create(self, name: str) -> MatchRoom:
+        # Caller holds self.lock
+        simulation = self.make_simulation() if self.make_simulation else None
+        lock = self.make_lock() if self.make_lock else None
+        room = MatchRoom(name, self.screenWidth, self.screenHeight, simulation, lock)
+        self.rooms[name] = room
+        self.created += 1
+        return room
+
+    def join(self, name: str, outbox_factory: Callable[[MatchRoom, str], object], spectator: bool = False,
+             token: str = None) -> tuple:
+        # name is a room name, '' for any room waiting for a player, or None for the default room.
+        # outbox_factory(room, side) builds the client's outbox once its side is known, under the
+        # room lock so nothing is broadcast to it before whatever the factory queues first.
+        # spectator keeps the client off the player sides, token takes back the side it was issued
+        # for. Returns (room, outbox, resumed), the outbox is already in room.clients
+        stale = None
+        with self.lock:
+            self._forget_abandoned()
+            if name == '':
+                room = next((r for r in self.rooms.values() if r.waiting()), None)
+                if room is None:
+                    while f'room-{self.created}' in self.rooms:
+                        self.created += 1
+                    room = self._create(f'room-{self.created}')
+            else:
+                name = name or DEFAULT_ROOM
+                room = self.rooms.get(name) or self._create(name)
+
+            with room.lock:
+                side, stale = room.resume(token) if token else (None, None)
+                resumed = side is not None
+                if resumed:
+                    room.clients[:] = [(c, s) for c, s in room.clients if c is not stale]
+                    room.held.pop(side, None)
+                else:
+                    side = 'spectator' if spectator else room.open_side() or 'spectator'
+                    if side != 'spectator':
+                        room.tokens[side] = secrets.token_hex(8)
+                        room.names.pop(side, None)
+                outbox = outbox_factory(room, side)
+                room.clients.append((outbox, outbox.side))
+
+        # The connection being replaced cleans up after itself once it notices it was closed
+        if stale is not None:
+            stale.close()
+        return room, outbox, resumed
+
+    def leave(self, room: MatchRoom, outbox) -> None:
+        # Take the client out, reset its paddle and keep its side for it if a match is on, and forget
+        # the room once nobody is left in it or coming back. A client replaced by a resume was already
+        # taken out and changes nothing
+        with self.lock:
+            with room.lock:
+                present = any(c is outbox for c, _ in room.clients)
+                if present:
+                    room.clients[:] = [(c, s) for c, s in room.clients if c is not outbox]
+                    room.set_paddle(outbox.side, PADDLE_START_Y)
+                    if room.game_running and outbox.side in room.tokens and self.resume_grace:
+                        room.held[outbox.side] = time.monotonic() + self.resume_grace
+                empty = not room.clients
+            if empty and self.rooms.get(room.name) is room and room.name not in self.pinned:
+                if room.holding():
+                    self.abandoned.add(room.name)
+                else:
+                    del self.rooms[room.name]
+            self._forget_abandoned()
+
+    def _forget_abandoned(self) -> None:
+        # Caller holds self.lock. Empty rooms go away once the sides they kept have expired
+        for name in list(self.abandoned):
+            room = self.rooms.get(name)
+            if room is None or room.clients:
+                self.abandoned.discard(name)
+            elif not room.holding():
+                self.abandoned.discard(name)
+                del self.rooms[name]
+
+    def pin(self, name: str) -> MatchRoom:
+        # The room called name, created if needed, which then stays until the process exits
+        with self.lock:
+            self.pinned.add(name)
+            return self.rooms.get(name) or self._create(name)
+
+    def all(self) -> list:
+        with self.lock:
+            return list(self.rooms.values())
+
+    def listing(self) -> bytes:
+        # The ROOMS offer, rooms a new player could join right now
+        with self.lock:
+            open_rooms = [f'{r.name}:{len(r.clients)}' for r in self.rooms.values() if r.waiting()]
+        return ' '.join(['ROOMS', *open_rooms[:self.max_listed]]).encode() + b';'
+
+
+def parse_room_request(line: str) -> str:
+    # 'ROOM name' -> name, 'ROOM' -> '' (any open room), anything else -> None (default room)
+    parts = line.strip().split()
+    if not parts or parts[0] != 'ROOM':
+        return None
+    if len(parts) == 1:
+        return ''
+    return parts[1] if ROOM_NAME.fullmatch(parts[1]) else ''
+
+
+def parse_resume_request(line: str) -> tuple:
+    # 'RESUME name token' -> (name, token), anything else -> None
+    parts = line.strip().split()
+    if len(parts) != 3 or parts[0] != RESUME_REQUEST or not ROOM_NAME.fullmatch(parts[1]):
+        return None
+    return parts[1], parts[2]
+
+
+def parse_watch_request(line: str) -> str:
+    # 'WATCH name' -> name, 'WATCH' -> the default room, anything else -> None
+    parts = line.strip().split()
+    if not parts or parts[0] != WATCH_REQUEST:
+        return None
+    if len(parts) == 1 or not ROOM_NAME.fullmatch(parts[1]):
+        return DEFAULT_ROOM
+    return parts[1]
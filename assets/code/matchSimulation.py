@@ -0,0 +1,88 @@
+# =================================================================================================
+# Purpose:                  Headless copy of the playGame ball, paddle and scoring rules so the
+#                           server can own the match state
+# =================================================================================================
+
+import os
+
+# pygame.Rect needs neither a display nor pygame.init(), only keep the import quiet on servers
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+from assets.code.helperCode import Ball, Paddle
+
+PADDLE_HEIGHT = 50
+PADDLE_WIDTH = 10
+WINNING_SCORE = 5
+
+
+class MatchSimulation:
+    # One match, stepped once per server tick with the same rules and order playGame uses per frame
+    def __init__(self, screenWidth: int = 640, screenHeight: int = 480) -> None:
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+        self.topWall = pygame.Rect(-10, 0, screenWidth + 20, 10)
+        self.bottomWall = pygame.Rect(-10, screenHeight - 10, screenWidth + 20, 10)
+        self.reset_match()
+
+    def reset_match(self) -> None:
+        paddleStartPosY = (self.screenHeight / 2) - (PADDLE_HEIGHT / 2)
+        self.leftPaddle = Paddle(pygame.Rect(10, paddleStartPosY, PADDLE_WIDTH, PADDLE_HEIGHT))
+        self.rightPaddle = Paddle(pygame.Rect(self.screenWidth - 20, paddleStartPosY, PADDLE_WIDTH, PADDLE_HEIGHT))
+        self.ball = Ball(pygame.Rect(self.screenWidth / 2, self.screenHeight / 2, 5, 5), -5, 0)
+        self.lScore = 0
+        self.rScore = 0
+        self.tick = 0
+
+    @property
+    def game_over(self) -> bool:
+        return self.lScore >= WINNING_SCORE or self.rScore >= WINNING_SCORE
+
+    def set_paddle(self, side: str, paddleY: int) -> None:
+        # Clients report where their paddle is, clamp it to where playGame's movement rules allow
+        paddle = self.leftPaddle if side == 'left' else self.rightPaddle
+        lowest = self.screenHeight - 10 - PADDLE_HEIGHT + paddle.speed - 1
+        highest = 10 - paddle.speed + 1
+        paddle.rect.y = max(highest, min(lowest, int(paddleY)))
+
+    def step(self) -> None:
+        if self.game_over:
+            return
+        self.tick += 1
+        ball = self.ball
+        ball.updatePos()
+
+        # If the ball makes it past the edge of the screen, update score, etc.
+        if ball.rect.x > self.screenWidth:
+            self.lScore += 1
+            ball.reset(nowGoing = "left")
+        elif ball.rect.x < 0:
+            self.rScore += 1
+            ball.reset(nowGoing = "right")
+
+        # If the ball hits a paddle
+        if ball.rect.colliderect(self.leftPaddle.rect):
+            ball.hitPaddle(self.leftPaddle.rect.center[1])
+        elif ball.rect.colliderect(self.rightPaddle.rect):
+            ball.hitPaddle(self.rightPaddle.rect.center[1])
+
+        # If the ball hits a wall
+        if ball.rect.colliderect(self.topWall) or ball.rect.colliderect(self.bottomWall):
+            ball.hitWall()
+
+    def save(self) -> tuple:
+        # Everything step() reads or changes, load() puts it back (rollback, see rollbackSession.py)
+        ball = self.ball
+        return (self.leftPaddle.rect.y, self.rightPaddle.rect.y, ball.rect.x, ball.rect.y, ball.xVel, ball.yVel,
+                self.lScore, self.rScore, self.tick)
+
+    def load(self, saved: tuple) -> None:
+        ball = self.ball
+        (self.leftPaddle.rect.y, self.rightPaddle.rect.y, ball.rect.x, ball.rect.y, ball.xVel, ball.yVel,
+         self.lScore, self.rScore, self.tick) = saved
+
+    def state(self) -> tuple:
+        # (leftY, rightY, ballX, ballY, lScore, rScore, tick)
+        return (self.leftPaddle.rect.y, self.rightPaddle.rect.y, self.ball.rect.x, self.ball.rect.y,
+                self.lScore, self.rScore, self.tick)
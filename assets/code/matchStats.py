@@ -0,0 +1,292 @@
+# =================================================================================================
+# Purpose:                  Match results and statistics for pongServer --match-stats: every match's
+#                           score, rally lengths and hits per player, written to SQLite behind the
+#                           game's back, and the queries leaderboards need
+# =================================================================================================
+
+# pongServer gives each running room a MatchTally at START and hands it every state it broadcasts, in
+# any mode that sends snapshots. The tally works the match out from the states alone: the ball
+# crossing the middle of the court is a hit (a return) by the paddle on the half it came from, a score
+# change ends a rally, and a side reaching WINNING_SCORE ends the match. The ball spends a second or
+# so in each half, so this holds at any broadcast rate, and it is a few comparisons per broadcast
+# under the room lock. A ball that touches a paddle and still goes out was not returned, no hit.
+#
+# A finished (or abandoned) match becomes one result dict, which StatsWriter.submit() only puts on a
+# queue. Its thread takes everything queued at once and writes it to a StatsStore in one transaction,
+# so batches grow by themselves when matches end faster than the disk commits. When the queue is full
+# a result is dropped and counted, the game never waits for the database.
+#
+# Players are named by the 'NAME name;' line a client sends in answer to the server's name offer
+# (wireProtocol.NAME_FEATURE), or by their IP address. Abandoned matches are listed, only finished
+# ones count towards a player's totals.
+
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+# First to this many points wins, as in MatchSimulation and playGame
+WINNING_SCORE = 5
+
+NAME_REQUEST = 'NAME'
+PLAYER_NAME = re.compile(r'[A-Za-z0-9_.:-]{1,32}')
+
+# Results StatsWriter holds before it starts dropping them, and the most it writes in one transaction
+STATS_QUEUE = 10000
+STATS_BATCH = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    left_player TEXT,
+    right_player TEXT,
+    left_score INTEGER NOT NULL,
+    right_score INTEGER NOT NULL,
+    winner TEXT,
+    left_hits INTEGER NOT NULL,
+    right_hits INTEGER NOT NULL,
+    rallies INTEGER NOT NULL,
+    longest_rally INTEGER NOT NULL,
+    ticks INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_by_end ON matches (ended);
+CREATE INDEX IF NOT EXISTS matches_by_left ON matches (left_player, ended);
+CREATE INDEX IF NOT EXISTS matches_by_right ON matches (right_player, ended);
+CREATE TABLE IF NOT EXISTS rallies (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    number INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    winner TEXT NOT NULL,
+    sync INTEGER NOT NULL,
+    PRIMARY KEY (match_id, number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    longest_rally INTEGER NOT NULL,
+    last_played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_by_wins ON players (wins);
+CREATE INDEX IF NOT EXISTS players_by_hits ON players (hits);
+CREATE INDEX IF NOT EXISTS players_by_rally ON players (longest_rally);
+'''
+
+# top_players() orders by one of these, ties go to fewer matches played
+PLAYER_ORDERS = {
+    'wins': 'wins DESC, matches ASC',
+    'hits': 'hits DESC, matches ASC',
+    'longest_rally': 'longest_rally DESC, matches ASC',
+}
+
+
+class MatchTally:
+    # One match as pongServer broadcasts it, from START until a side wins or the room empties
+    def __init__(self, room: str, mode: str, screenWidth: int = 640) -> None:
+        self.room = room
+        self.mode = mode
+        self.middle = screenWidth / 2
+        self.started = time.time()
+
+        self.hits = {'left': 0, 'right': 0}
+        self.rallies = []           # (hits, side that won the point, sync) of every point so far
+        self.rally = 0
+        self.score = (0, 0)
+        self.sync = 0
+
+        # The half of the court the ball was last seen in, None since the serve from the middle
+        self.half = None
+
+    def observe(self, state: tuple) -> bool:
+        # state is (leftY, rightY, ballX, ballY, lScore, rScore, sync). Returns True once a side has won
+        _, _, ballX, _, lScore, rScore, sync = state
+        self.sync = sync
+
+        # A point, the ball was served from the middle again in the same state
+        if (lScore, rScore) != self.score:
+            if lScore + rScore > sum(self.score):
+                self.rallies.append((self.rally, 'left' if lScore > self.score[0] else 'right', sync))
+            self.score = (lScore, rScore)
+            self.rally = 0
+            self.half = None
+            return max(lScore, rScore) >= WINNING_SCORE
+
+        if ballX != self.middle:
+            half = 'left' if ballX < self.middle else 'right'
+            if self.half is not None and half != self.half:
+                self.hits[self.half] += 1
+                self.rally += 1
+            self.half = half
+        return False
+
+    def result(self, names: dict) -> dict:
+        # The matches row and its rallies, names maps a side to its player's name
+        lScore, rScore = self.score
+        winner = None
+        if max(lScore, rScore) >= WINNING_SCORE:
+            winner = 'left' if lScore > rScore else 'right'
+        return {
+            'room': self.room, 'mode': self.mode, 'started': self.started, 'ended': time.time(),
+            'left_player': names.get('left'), 'right_player': names.get('right'),
+            'left_score': lScore, 'right_score': rScore, 'winner': winner,
+            'left_hits': self.hits['left'], 'right_hits': self.hits['right'],
+            'rallies': list(self.rallies), 'ticks': self.sync,
+        }
+
+
+class StatsStore:
+    # One connection to the stats database, which is created if needed. Every thread or process that
+    # writes or queries opens its own
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.db = sqlite3.connect(path, timeout = timeout)
+        self.db.row_factory = sqlite3.Row
+
+        # Readers do not wait for the writer and commits do not wait for the disk (still safe in WAL)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def write(self, results: list) -> None:
+        # Every result from MatchTally.result() in one transaction, matches, rallies and player totals
+        rallies = []
+        players = {}
+        with self.db:
+            for r in results:
+                rally_hits = [hits for hits, _, _ in r['rallies']]
+                longest = max(rally_hits, default = 0)
+                match_id = self.db.execute(
+                    'INSERT INTO matches (room, mode, started, ended, left_player, right_player, left_score, '
+                    'right_score, winner, left_hits, right_hits, rallies, longest_rally, ticks) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (r['room'], r['mode'], r['started'], r['ended'], r['left_player'], r['right_player'],
+                     r['left_score'], r['right_score'], r['winner'], r['left_hits'], r['right_hits'],
+                     len(rally_hits), longest, r['ticks'])
+                ).lastrowid
+                rallies.extend((match_id, number, hits, winner, sync)
+                               for number, (hits, winner, sync) in enumerate(r['rallies'], 1))
+
+                # Totals move only with finished matches, summed per player across the batch first
+                if r['winner'] is None:
+                    continue
+                for side, points in (('left', r['left_score']), ('right', r['right_score'])):
+                    name = r[f'{side}_player']
+                    if name is None:
+                        continue
+                    total = players.setdefault(name, [0, 0, 0, 0, 0, 0.0])
+                    total[0] += 1
+                    total[1] += r['winner'] == side
+                    total[2] += points
+                    total[3] += r[f'{side}_hits']
+                    total[4] = max(total[4], longest)
+                    total[5] = max(total[5], r['ended'])
+
+            self.db.executemany('INSERT INTO rallies VALUES (?, ?, ?, ?, ?)', rallies)
+            self.db.executemany(
+                'INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+                'matches = matches + excluded.matches, wins = wins + excluded.wins, '
+                'points = points + excluded.points, hits = hits + excluded.hits, '
+                'longest_rally = max(longest_rally, excluded.longest_rally), '
+                'last_played = max(last_played, excluded.last_played)',
+                [(name, *total) for name, total in players.items()]
+            )
+
+    def top_players(self, limit: int = 10, order: str = 'wins') -> list:
+        # Leaderboard, order is a key of PLAYER_ORDERS. Raises ValueError for any other order
+        if order not in PLAYER_ORDERS:
+            raise ValueError(f"order must be one of {', '.join(PLAYER_ORDERS)}, got {order!r}")
+        rows = self.db.execute(f'SELECT * FROM players ORDER BY {PLAYER_ORDERS[order]} LIMIT ?', (limit,))
+        return [dict(row, win_rate = row['wins'] / row['matches']) for row in rows]
+
+    def recent_matches(self, limit: int = 10, player: str = None) -> list:
+        # Newest first, finished or not, only the ones player played in if given
+        if player is None:
+            rows = self.db.execute('SELECT * FROM matches ORDER BY ended DESC LIMIT ?', (limit,))
+        else:
+            rows = self.db.execute(
+                'SELECT * FROM (SELECT * FROM matches WHERE left_player = ? ORDER BY ended DESC LIMIT ?) '
+                'UNION SELECT * FROM (SELECT * FROM matches WHERE right_player = ? ORDER BY ended DESC LIMIT ?) '
+                'ORDER BY ended DESC LIMIT ?', (player, limit, player, limit, limit))
+        return [dict(row) for row in rows]
+
+    def rally_lengths(self, match_id: int) -> list:
+        # Hits in each rally of a match, in order
+        rows = self.db.execute('SELECT hits FROM rallies WHERE match_id = ? ORDER BY number', (match_id,))
+        return [hits for hits, in rows]
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class StatsWriter:
+    # Write-behind in front of a StatsStore on path: submit() never blocks, a daemon thread writes
+    def __init__(self, path: str, max_queued: int = STATS_QUEUE, batch_size: int = STATS_BATCH) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_queued)
+
+        # Counted on the writer thread, except dropped
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    def submit(self, result: dict) -> bool:
+        # Queue one MatchTally.result(), False if the queue was full and it was dropped
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self) -> None:
+        store = StatsStore(self.path)
+        while True:
+
+            # Wait for a result, then take whatever else is already queued
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            results = batch[:-1] if stop else batch
+
+            if results:
+                try:
+                    store.write(results)
+                    self.written += len(results)
+                    self.batches += 1
+                except sqlite3.Error as e:
+                    self.failed += len(results)
+                    print(f"Match stats: {len(results)} results not written to {self.path}: {e}")
+            if stop:
+                store.close()
+                return
+
+    def close(self, timeout: float = 5.0) -> None:
+        # Write everything queued so far and stop, waiting at most timeout seconds
+        try:
+            self.queue.put(None, timeout = timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+
+def parse_player_name(line: str) -> str:
+    # 'NAME name' -> name, anything else (or a name that does not fit PLAYER_NAME) -> None
+    parts = line.strip().split()
+    if len(parts) != 2 or parts[0] != NAME_REQUEST or not PLAYER_NAME.fullmatch(parts[1]):
+        return None
+    return parts[1]
@@ -0,0 +1,159 @@
+# =================================================================================================
+# Purpose:                  Client-side smoothing of server snapshots: interpolation of remote paddles
+#                           and ball keyed by the sync counter, and gradual correction of what the
+#                           client predicts locally
+# =================================================================================================
+
+import math
+import time
+from collections import deque
+
+
+class SnapshotBuffer:
+    # Keeps the last few server snapshots by sync and draws remote entities renderDelay seconds in the
+    # past, between the two snapshots on either side of that moment, so late or bunched packets do
+    # not make them teleport.
+    #
+    # There is no shared clock, so sync is mapped to local time: tickRate is measured from how fast
+    # sync advances, and clockOffset is the arrival time of the quickest snapshot in the window
+    # minus its sync time. Snapshots that arrive later than that are simply further into the delay.
+    def __init__(self, renderDelay: float = 0.05, tickRate: float = 60.0, capacity: int = 64,
+                 teleportDistance: int = 100) -> None:
+        self.renderDelay = renderDelay
+        self.tickRate = tickRate
+        self.teleportDistance = teleportDistance
+        self.snapshots = deque(maxlen = capacity)   # (sync, arrival, values)
+        self.clockOffset = None
+        self.nextEstimate = 0.0
+        self.staleSnapshots = 0
+
+        # How far behind the newest snapshot the last sample() was, in seconds. Negative means
+        # nothing new arrived in time and the newest snapshot is being held
+        self.measuredDelay = 0.0
+
+    def add(self, sync: int, values: tuple, now: float = None) -> bool:
+        # values is any tuple of numbers (or None for fields this client does not get), the same
+        # shape every time. Duplicate or out-of-order syncs are dropped
+        if now is None:
+            now = time.perf_counter()
+        if self.snapshots and sync <= self.snapshots[-1][0]:
+            self.staleSnapshots += 1
+            return False
+        self.snapshots.append((sync, now, values))
+
+        offset = now - sync / self.tickRate
+        if self.clockOffset is None or offset < self.clockOffset:
+            self.clockOffset = offset
+        if now >= self.nextEstimate:
+            self.estimateClock(now)
+        return True
+
+    def estimateClock(self, now: float) -> None:
+        # Once a second, re-measure the tick rate over the window and take the quickest arrival in
+        # it again, so the mapping follows a server whose tick rate or latency changes
+        self.nextEstimate = now + 1.0
+        firstSync, firstArrival, _ = self.snapshots[0]
+        lastSync, lastArrival, _ = self.snapshots[-1]
+        if lastArrival - firstArrival >= 0.5:
+            self.tickRate = (lastSync - firstSync) / (lastArrival - firstArrival)
+        self.clockOffset = min(arrival - sync / self.tickRate for sync, arrival, _ in self.snapshots)
+
+    def sample(self, now: float = None) -> tuple:
+        # Returns the interpolated values at now - renderDelay, or None before the first snapshot
+        if not self.snapshots:
+            return None
+        if now is None:
+            now = time.perf_counter()
+        renderSync = (now - self.clockOffset - self.renderDelay) * self.tickRate
+        newestSync, _, newestValues = self.snapshots[-1]
+        self.measuredDelay = (newestSync - renderSync) / self.tickRate
+
+        if renderSync >= newestSync:
+            return newestValues
+
+        # Walk back from the newest to the snapshot just before renderSync
+        newer = self.snapshots[-1]
+        for older in reversed(self.snapshots):
+            if older[0] <= renderSync:
+                break
+            newer = older
+        else:
+            return self.snapshots[0][2]
+
+        olderSync, _, olderValues = older
+        newerSync, _, newerValues = newer
+        t = (renderSync - olderSync) / (newerSync - olderSync)
+        values = []
+        for a, b in zip(olderValues, newerValues):
+            if a is None or b is None:
+                values.append(b)
+
+            # A ball reset or a resync is a jump, not movement, so do not sweep across the screen
+            elif abs(b - a) > self.teleportDistance:
+                values.append(a if t < 0.5 else b)
+            else:
+                values.append(round(a + (b - a) * t))
+        return tuple(values)
+
+
+class PredictionCorrector:
+    # For something the client keeps simulating itself (the ball on a client that runs the ball
+    # logic but is not its owner). Each server copy is moved forward to the client's own frame, and
+    # the difference is worked off over blendFrames frames instead of snapped, unless it is so large
+    # that the prediction is simply wrong (a point was scored, a bounce was missed).
+    def __init__(self, blendFrames: int = 5, snapDistance: int = 40, maxFramesAhead: int = 15) -> None:
+        self.blendFrames = blendFrames
+        self.snapDistance = snapDistance
+        self.maxFramesAhead = maxFramesAhead
+        self.errorX = 0.0
+        self.errorY = 0.0
+        self.lastServer = None
+
+        # Size of the last correction and a running average, in pixels
+        self.lastCorrection = 0.0
+        self.meanCorrection = 0.0
+        self.snaps = 0
+
+    def reconcile(self, ball, serverX: int, serverY: int, serverSync: int, localSync: int) -> None:
+        # The server's velocity, from two close snapshots, only matters when the prediction is wrong.
+        # A correct prediction runs a few frames ahead and may already have bounced
+        serverVelocity = None
+        if self.lastServer is not None:
+            lastX, lastY, lastSync = self.lastServer
+            ticks = serverSync - lastSync
+            if 0 < ticks <= 3 and abs(serverX - lastX) <= self.snapDistance:
+                serverVelocity = ((serverX - lastX) // ticks, (serverY - lastY) // ticks)
+        self.lastServer = (serverX, serverY, serverSync)
+
+        # Where the server's ball would be now, on this client's frame
+        ahead = max(0, min(self.maxFramesAhead, localSync - serverSync))
+        errorX = serverX + ball.xVel * ahead - ball.rect.x
+        errorY = serverY + ball.yVel * ahead - ball.rect.y
+        self.lastCorrection = math.hypot(errorX, errorY)
+        self.meanCorrection += (self.lastCorrection - self.meanCorrection) * 0.1
+
+        # Too far off to blend (a missed bounce, a point): take the server's ball and its velocity
+        if self.lastCorrection > self.snapDistance:
+            self.snaps += 1
+            if serverVelocity is not None and serverVelocity[0]:
+                ball.xVel, ball.yVel = serverVelocity
+            ball.rect.x = serverX + ball.xVel * ahead
+            ball.rect.y = serverY + ball.yVel * ahead
+            errorX = errorY = 0
+        self.errorX = errorX
+        self.errorY = errorY
+
+    def apply(self, ball) -> None:
+        # Once per frame, after the local ball logic
+        if not self.errorX and not self.errorY:
+            return
+        stepX = self.stepTowards(self.errorX)
+        stepY = self.stepTowards(self.errorY)
+        ball.rect.x += stepX
+        ball.rect.y += stepY
+        self.errorX -= stepX
+        self.errorY -= stepY
+
+    def stepTowards(self, error: float) -> int:
+        step = round(error / self.blendFrames)
+        return step if step else round(error)
@@ -0,0 +1,112 @@
+# =================================================================================================
+# Purpose:                  Per-client snapshot rates for pongServer --adaptive-rate: a ceiling and a
+#                           floor for each role, and a controller that lowers a client's rate while its
+#                           link backs up and raises it again once the link recovers
+# =================================================================================================
+
+# Every broadcast still encodes one snapshot per room, a client's RateController only decides whether
+# that snapshot is queued for it (ClientOutbox.push_snapshot). START and other control messages are
+# never held back, and a client that takes deltas gets them against the last snapshot it acknowledged,
+# so skipping snapshots needs nothing from the client.
+#
+# pongServer calls update() CONTROL_HZ times a second for every client:
+#   congested   the outbox queued BACKLOG_FRAMES snapshots or more since the last update, dropped any,
+#               the transport is holding bytes the socket would not take, or the round trip (MSG_PING,
+#               or the age of a ping still unanswered) is RTT_RISE above the lowest of the last
+#               RTT_WINDOW updates
+#   then        the rate is halved, down to the role's floor
+#   otherwise   after RECOVER_UPDATES quiet updates in a row the rate goes up by RATE_STEP, up to the
+#               role's ceiling
+# The round trip is what notices a link with a deep buffer (a hotel Wi-Fi access point), where the
+# socket keeps taking data long after the other end stopped keeping up.
+
+from collections import deque
+
+# role -> (ceiling, floor) in snapshots per second
+RATE_TIERS = {'left': (60, 15), 'right': (60, 15), 'spectator': (30, 5)}
+
+CONTROL_HZ = 4
+BACKLOG_FRAMES = 2
+RTT_RISE = 0.05
+RTT_WINDOW = 40
+RECOVER_UPDATES = 2
+RATE_STEP = 5
+
+
+class RateController:
+    # ceiling and floor come from RATE_TIERS for the client's role
+    def __init__(self, ceiling: float, floor: float) -> None:
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.rate = ceiling
+
+        # Snapshots this client may still be sent, one is added per second per Hz and one is spent
+        # per snapshot. Sending from half a snapshot on keeps a client at the broadcast rate from
+        # skipping one whenever a tick comes a little early
+        self.credit = 1.0
+        self.last_offer = None
+        self.skipped = 0
+
+        # Controller state: recent round trips, quiet updates in a row, and what was sent by the last update
+        self.rtts = deque(maxlen = RTT_WINDOW)
+        self.quiet = 0
+        self.decreases = 0
+        self.increases = 0
+        self.last_update = None
+        self.last_bytes = 0
+        self.last_dropped = 0
+        self.bytes_per_second = 0.0
+
+    def due(self, now: float) -> bool:
+        # Whether a snapshot offered now should be sent, called with the outbox's lock held
+        if self.last_offer is not None:
+            self.credit = min(1.0, self.credit + (now - self.last_offer) * self.rate)
+        self.last_offer = now
+        if self.credit < 0.5:
+            self.skipped += 1
+            return False
+        self.credit -= 1.0
+        return True
+
+    def update(self, now: float, sent_bytes: int, dropped: int, backlog: int, buffered: int, rtt) -> None:
+        # One controller step. backlog is the most snapshots queued at once since the last update,
+        # buffered the bytes the transport holds, rtt the latest round trip in seconds or None
+        if self.last_update is not None and now > self.last_update:
+            self.bytes_per_second = (sent_bytes - self.last_bytes) / (now - self.last_update)
+        self.last_update = now
+        self.last_bytes = sent_bytes
+
+        congested = backlog >= BACKLOG_FRAMES or buffered > 0 or dropped > self.last_dropped
+        self.last_dropped = dropped
+        if rtt is not None:
+            self.rtts.append(rtt)
+            congested = congested or rtt > min(self.rtts) + RTT_RISE
+
+        if congested:
+            self.quiet = 0
+            if self.rate > self.floor:
+                self.rate = max(self.floor, self.rate / 2)
+                self.decreases += 1
+        else:
+            self.quiet += 1
+            if self.quiet >= RECOVER_UPDATES and self.rate < self.ceiling:
+                self.rate = min(self.ceiling, self.rate + RATE_STEP)
+                self.increases += 1
+                self.quiet = 0
+
+
+def parse_rate_tiers(text: str) -> dict:
+    # 'left=60,right=60,spectator=20' or 'spectator=20:2' (ceiling:floor), roles not named keep
+    # RATE_TIERS. Raises ValueError if malformed
+    tiers = dict(RATE_TIERS)
+    for item in text.split(','):
+        role, _, rates = item.strip().partition('=')
+        if role not in tiers or not rates:
+            raise ValueError(f"expected ROLE=HZ[:FLOOR] with ROLE one of {', '.join(RATE_TIERS)}, got {item!r}")
+        ceiling, _, floor = rates.partition(':')
+        ceiling = float(ceiling)
+        floor = float(floor) if floor else min(tiers[role][1], ceiling)
+        if ceiling <= 0 or floor <= 0 or floor > ceiling:
+            raise ValueError(f"{role}: rates must be positive and the floor at most the ceiling")
+        tiers[role] = (ceiling, floor)
+    return tiers
@@ -0,0 +1,145 @@
+# =================================================================================================
+# Purpose:                  Rollback netcode for 'MODE rollback;' servers (pongServer --rollback): every
+#                           client runs the whole match from the paddle inputs alone, predicting the
+#                           opponent's and rolling back when its real input differs
+# =================================================================================================
+
+# Frame f of a match is: set both paddles to their input for frame f, then MatchSimulation.step().
+# Given the same inputs every client gets the same match, so only inputs travel:
+#   client -> server   MSG_INPUT       paddleY, frame          (7 bytes per frame)
+#   server -> others   MSG_PEER_INPUT  side, paddleY, frame    (9 bytes per frame, per other client)
+# The server keeps each match's inputs and sends them all to anyone who switches to bin1 once the
+# match is running, so late spectators catch up by simulating it from the start.
+#
+# A player never waits for the opponent's input: a missing one is predicted to be the last one that
+# arrived (the paddle stays where it was), and the frame is simulated at once. When the real input
+# arrives and differs, the match is loaded as it was before that frame and simulated again up to
+# the present. Inputs arrive in order over TCP, so the opponent's known inputs are a list, and a gap
+# the server skipped is filled with the last input before it. A player more than max_rollback frames
+# ahead of the opponent's last input stops advancing until it catches up (lockstep), which also slows
+# down whichever client started first.
+#
+# Spectators have no input of their own and only simulate frames whose inputs both arrived.
+
+import time
+
+from assets.code.matchSimulation import MatchSimulation
+
+# Frames a player may run ahead of the opponent's newest input, 12 is 200 ms at 60 Hz
+MAX_ROLLBACK = 12
+
+SIDES = ('left', 'right')
+
+
+class RollbackSession:
+    # side is 'left' or 'right' for a player, anything else for a spectator
+    def __init__(self, side: str, screenWidth: int = 640, screenHeight: int = 480,
+                 max_rollback: int = MAX_ROLLBACK) -> None:
+        self.side = side if side in SIDES else None
+        self.remote = [s for s in SIDES if s != self.side]
+        self.sim = MatchSimulation(screenWidth, screenHeight)
+        self.max_rollback = max_rollback
+
+        # Frames simulated so far, every side's inputs in frame order (inputs[side][f - 1] is frame f),
+        # and where paddles start before any input arrives
+        self.frame = 0
+        self.inputs = {side: [] for side in SIDES}
+        self.start = {'left': self.sim.leftPaddle.rect.y, 'right': self.sim.rightPaddle.rect.y}
+
+        # The opponent input each frame beyond its known inputs was simulated with, and the match as
+        # it was before each frame that could still be rolled back
+        self.predicted = {}
+        self.saved = {}
+        self.rollback_from = None
+
+        # Statistics: rollbacks, frames simulated again, the deepest rollback, time spent on them and
+        # ticks a player could not advance because it was too far ahead
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+        self.rollback_seconds = 0.0
+        self.stalls = 0
+
+    def confirmed(self) -> int:
+        # Newest frame every input is known for
+        return min(len(self.inputs[side]) for side in SIDES)
+
+    def can_advance(self) -> bool:
+        # A player may simulate the next frame unless it is max_rollback frames past the opponent
+        if self.side is None:
+            return self.frame < self.confirmed()
+        ahead = self.frame - len(self.inputs[self.remote[0]])
+        if ahead >= self.max_rollback:
+            self.stalls += 1
+            return False
+        return True
+
+    def add_local(self, paddleY: int) -> int:
+        # This player's input for the next frame, returns that frame's number for MSG_INPUT
+        self.inputs[self.side].append(paddleY)
+        return len(self.inputs[self.side])
+
+    def add_remote(self, side: str, paddleY: int, frame: int) -> None:
+        # An input relayed by the server. Our own side (echoed in the match history) and repeats are
+        # ignored. Frames the server skipped, inputs that never reached it, count as the last input
+        # before them (the paddle stayed where it was), so every client fills the gap the same way
+        inputs = self.inputs.get(side)
+        if side == self.side or inputs is None or frame <= len(inputs):
+            return
+        while len(inputs) + 1 < frame:
+            self._arrived(inputs, inputs[-1] if inputs else self.start[side])
+        self._arrived(inputs, paddleY)
+
+    def _arrived(self, inputs: list, paddleY: int) -> None:
+        # The next remote input is known, roll back to it if it was predicted wrong
+        inputs.append(paddleY)
+        frame = len(inputs)
+        guess = self.predicted.pop(frame, None)
+        if guess is not None and guess != paddleY and (self.rollback_from is None or frame < self.rollback_from):
+            self.rollback_from = frame
+
+    def advance(self) -> None:
+        # Simulate the next frame, after any rollback the inputs received so far call for
+        self.settle()
+        self.frame += 1
+        self.saved[self.frame] = self.sim.save()
+        self._step(self.frame)
+
+        # Frames whose inputs are all known never roll back
+        for frame in range(self.frame - len(self.saved) + 1, self.confirmed() + 1):
+            self.saved.pop(frame, None)
+
+    def advance_confirmed(self) -> int:
+        # Spectators: simulate every frame both inputs have arrived for, returns how many
+        count = 0
+        while self.frame < self.confirmed():
+            self.advance()
+            count += 1
+        return count
+
+    def settle(self) -> None:
+        # Roll back to the first frame that was predicted wrong and simulate up to the present again
+        if self.rollback_from is None:
+            return
+        started = time.perf_counter()
+        first, self.rollback_from = self.rollback_from, None
+        self.sim.load(self.saved[first])
+        for frame in range(first, self.frame + 1):
+            self.saved[frame] = self.sim.save()
+            self._step(frame)
+        depth = self.frame - first + 1
+        self.rollbacks += 1
+        self.resimulated += depth
+        self.max_depth = max(self.max_depth, depth)
+        self.rollback_seconds += time.perf_counter() - started
+
+    def _step(self, frame: int) -> None:
+        for side in SIDES:
+            inputs = self.inputs[side]
+            if frame <= len(inputs):
+                paddleY = inputs[frame - 1]
+            else:
+                paddleY = inputs[-1] if inputs else self.start[side]
+                self.predicted[frame] = paddleY
+            self.sim.set_paddle(side, paddleY)
+        self.sim.step()
@@ -0,0 +1,183 @@
+# =================================================================================================
+# Purpose:                  Optional pongServer instrumentation: room lock wait and hold times,
+#                           broadcast and update handling cost, per-client queue depth and round trip
+#                           time, served as text or JSON over a local HTTP port or printed on a timer
+# =================================================================================================
+
+# Nothing here runs unless pongServer is started with --metrics-interval or --metrics-port. Without
+# them the server keeps plain threading.Lock room locks and skips every timing call.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from assets.code.latencyHistogram import LatencyHistogram
+
+# name -> what is timed
+HISTOGRAMS = {
+    'lock_wait': "waiting to acquire a room lock",
+    'lock_hold': "holding a room lock",
+    'broadcast': "broadcast_state, encode and queue one snapshot for a room",
+    'parse': "process_client_data, decode and apply one read from a client",
+    'rtt': "ping to pong, including time queued behind snapshots",
+}
+
+
+class TimedLock:
+    # Stands in for a room's threading.Lock and records how long every acquire waited and how long
+    # the lock was then held. Only the holder writes acquired_at, so it needs no lock of its own
+    __slots__ = ('lock', 'metrics', 'acquired_at')
+
+    def __init__(self, metrics: 'ServerMetrics') -> None:
+        self.lock = threading.Lock()
+        self.metrics = metrics
+        self.acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            self.acquired_at = time.perf_counter()
+            self.metrics.record('lock_wait', self.acquired_at - start)
+        return acquired
+
+    def release(self) -> None:
+        held = time.perf_counter() - self.acquired_at
+        self.lock.release()
+        self.metrics.record('lock_hold', held)
+
+    def locked(self) -> bool:
+        return self.lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class ServerMetrics:
+    # Histograms cover everything since the server started or since the last reset, whichever is later
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms = {name: LatencyHistogram() for name in HISTOGRAMS}
+        self.since = time.time()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.histograms[name].record(seconds)
+
+    def make_lock(self) -> TimedLock:
+        return TimedLock(self)
+
+    def report(self, rooms, reset: bool = False) -> dict:
+        # rooms is the server's RoomManager. Client fields are read without their locks, a number
+        # can be a message out of date
+        with self.lock:
+            histograms = self.histograms
+            since = self.since
+            if reset:
+                self.histograms = {name: LatencyHistogram() for name in HISTOGRAMS}
+                self.since = time.time()
+
+        clients = []
+        for room in rooms.all():
+            for outbox, side in list(room.clients):
+                client = {
+                    'room': room.name, 'side': side, 'protocol': outbox.protocol,
+                    'queued': len(outbox.queue), 'sent': outbox.sent_frames, 'dropped': outbox.dropped_frames,
+                    'sent_bytes': outbox.sent_bytes,
+                    'rtt_ms': round(outbox.rtt * 1000, 3) if outbox.rtt is not None else None,
+                }
+
+                # The snapshot rate the controller chose and the bytes per second it measured (--adaptive-rate)
+                if outbox.rate is not None:
+                    client['rate_hz'] = outbox.rate.rate
+                    client['bytes_per_s'] = round(outbox.rate.bytes_per_second)
+                    client['skipped'] = outbox.rate.skipped
+                clients.append(client)
+        return {
+            'seconds': time.time() - since,
+            'histograms': {name: summarize(histogram) for name, histogram in histograms.items()},
+            'clients': clients,
+        }
+
+
+def summarize(histogram: LatencyHistogram) -> dict:
+    # Count, and p50/p99/max/mean in milliseconds
+    if not histogram.count:
+        return {'count': 0}
+    return {
+        'count': histogram.count,
+        'p50_ms': round(histogram.percentile(50) * 1000, 4),
+        'p99_ms': round(histogram.percentile(99) * 1000, 4),
+        'max_ms': round(histogram.max * 1000, 4),
+        'mean_ms': round(histogram.mean() * 1000, 4),
+    }
+
+
+def format_report(report: dict, top: int = 5) -> str:
+    # A few lines for the console: one per histogram, then the clients with the deepest queues
+    # and the slowest round trips, or with rate control the ones at the lowest rates
+    lines = [f"Metrics over {report['seconds']:.1f} s"]
+    lines.append(f"  {'':<10}{'count':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in report['histograms'].items():
+        if stats['count']:
+            lines.append(f"  {name:<10}{stats['count']:>9}{stats['p50_ms']:>10.3f}"
+                         f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+        else:
+            lines.append(f"  {name:<10}{0:>9}")
+
+    clients = report['clients']
+    rtts = [c['rtt_ms'] for c in clients if c['rtt_ms'] is not None]
+    lines.append(f"  {len(clients)} clients, {sum(c['queued'] for c in clients)} frames queued, "
+                 f"{sum(c['dropped'] for c in clients)} dropped" +
+                 (f", rtt up to {max(rtts):.1f} ms" if rtts else ""))
+    rated = [c for c in clients if 'rate_hz' in c]
+    if rated:
+        lines.append(f"  {sum(c['bytes_per_s'] for c in rated):,} bytes/s sent, rates "
+                     f"{min(c['rate_hz'] for c in rated):g} to {max(c['rate_hz'] for c in rated):g} Hz")
+        worst = sorted(rated, key = lambda c: (c['rate_hz'], -(c['rtt_ms'] or 0)))
+    else:
+        worst = sorted(clients, key = lambda c: (c['queued'], c['rtt_ms'] or 0), reverse = True)
+    for client in worst[:top]:
+        if not rated and not client['queued'] and not client['rtt_ms']:
+            break
+        rtt = f"{client['rtt_ms']:.1f} ms" if client['rtt_ms'] is not None else '-'
+        line = f"    {client['room']:<16} {client['side']:<9} queued {client['queued']:>3}   rtt {rtt}"
+        if 'rate_hz' in client:
+            line += f"   {client['rate_hz']:g} Hz   {client['bytes_per_s']:,} bytes/s"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def start_metrics_endpoint(metrics: ServerMetrics, get_rooms: Callable[[], object], port: int,
+                           host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    # Serve GET / (text) and GET /json from a daemon thread, '?reset' starts a new window after
+    # answering. Bound to localhost unless host says otherwise
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path, _, query = self.path.partition('?')
+            if path not in ('/', '/json'):
+                self.send_error(404)
+                return
+            report = metrics.report(get_rooms(), reset = 'reset' in query)
+            if path == '/json':
+                body, kind = json.dumps(report).encode(), 'application/json'
+            else:
+                body, kind = (format_report(report, top = 20) + '\n').encode(), 'text/plain'
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
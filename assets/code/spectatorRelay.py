@@ -0,0 +1,103 @@
+# =================================================================================================
+# Purpose:                  The upstream side of a spectator relay (pongServer --relay): one spectator
+#                           connection to another pongServer, or to another relay, whose snapshots the
+#                           relay re-broadcasts to its own spectators
+# =================================================================================================
+
+# The relay asks for its room with 'WATCH name;', which makes it a spectator even while the room is
+# still waiting for a player, then answers the handshake like pongClient: bin1, delta snapshots and
+# pings (so it shows up in the upstream server's round trip metrics). It stays on TCP, a relay
+# link is long lived and carries one stream for many spectators.
+#
+# UpstreamFeed does no I/O, pongServer reads the socket (from a thread or its event loop), passes
+# the bytes to feed() and sends back what it returns.
+
+from assets.code.deltaSnapshot import DeltaDecoder
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.matchRoom import WATCH_REQUEST
+from assets.code.wireProtocol import (
+    AUTHORITATIVE_MODE, BINARY_PROTOCOL, DELTA_FEATURE, MSG_DELTA, MSG_PING, MSG_PONG, MSG_START, MSG_STATE,
+    PING, PING_FEATURE, PROTOCOL_ACCEPT, encode_ping
+)
+
+# Seconds between attempts to reach the upstream server after the connection is lost
+RECONNECT_DELAY = 1.0
+
+
+class UpstreamFeed:
+    # One connection's worth of upstream protocol state. feed() returns (reply, events), events are
+    #   ('ready',)       handshake done: width, height, room and authoritative are known
+    #   ('start',)       the upstream match is running, never before 'ready'
+    #   ('state', state) a snapshot, (leftY, rightY, ballX, ballY, lScore, rScore, sync)
+    def __init__(self, room_name: str) -> None:
+        self.room_name = room_name
+        self.decoder = FrameDecoder()
+        self.deltas = DeltaDecoder()
+        self.width = None
+        self.height = None
+        self.room = None
+        self.authoritative = False
+        self.ready = False
+        self.snapshots = 0
+
+        # The upstream match was already running when we joined, its START came before the ack
+        self.early_start = False
+
+    def greeting(self) -> bytes:
+        # Sent as soon as the connection is up, the server reads it after its ROOMS offer
+        return f'{WATCH_REQUEST} {self.room_name};'.encode()
+
+    def feed(self, data: bytes) -> tuple:
+        self.decoder.feed(data)
+        reply = b''
+        events = []
+        for frame in self.decoder.frames():
+            if self.decoder.protocol == BINARY_PROTOCOL:
+                if frame[0] == MSG_STATE or frame[0] == MSG_DELTA:
+                    state = self.deltas.apply(frame)
+                    if state is not None:
+                        self.snapshots += 1
+                        events.append(('state', state))
+                elif frame[0] == MSG_START:
+                    events.append(('start',))
+                elif frame[0] == MSG_PING:
+                    reply += encode_ping(MSG_PONG, PING.unpack_from(frame)[1])
+                continue
+            reply += self.handle_line(str(frame, 'ascii').strip(), events)
+        return reply, events
+
+    def handle_line(self, msg: str, events: list) -> bytes:
+        # One handshake line, returns the answer if it needs one
+        if msg == 'START':
+            if self.ready:
+                events.append(('start',))
+            else:
+                self.early_start = True
+        elif msg.startswith('ROOM '):
+            self.room = msg.split()[1]
+        elif msg == AUTHORITATIVE_MODE.decode().rstrip(';'):
+            self.authoritative = True
+        elif msg == PING_FEATURE.decode().rstrip(';'):
+            return PING_FEATURE
+        elif msg == DELTA_FEATURE.decode().rstrip(';'):
+            return DELTA_FEATURE
+        elif msg.startswith('PROTOCOLS') and BINARY_PROTOCOL in msg.split()[1:]:
+            return PROTOCOL_ACCEPT
+        elif msg == PROTOCOL_ACCEPT.decode().rstrip(';'):
+
+            # The whole handshake, MODE included, arrived before the ack
+            self.decoder.switch_protocol(BINARY_PROTOCOL)
+            self.ready = True
+            events.append(('ready',))
+            if self.early_start:
+                events.append(('start',))
+        elif msg.count(',') == 2 and self.width is None:
+            width, height, _ = msg.split(',')
+            self.width, self.height = int(width), int(height)
+        return b''
+
+
+def parse_upstream(address: str) -> tuple:
+    # 'host:port' or 'port' -> (host, port), raises ValueError if the port is not a number
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
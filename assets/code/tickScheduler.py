@@ -0,0 +1,103 @@
+# =================================================================================================
+# Purpose:                  Fixed-rate tick scheduler used by the server to broadcast one snapshot
+#                           per tick instead of one per received packet
+# =================================================================================================
+
+import asyncio
+import time
+from typing import Callable
+
+
+class TickStats:
+    # Counters for one reporting window
+    def __init__(self) -> None:
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.max_lateness = 0.0
+        self.busy_time = 0.0
+
+    def summary(self, rate_hz: float) -> str:
+        avgCost = (self.busy_time / self.ticks * 1000) if self.ticks else 0.0
+        return (f"Tick stats @ {rate_hz:g} Hz: {self.ticks} ticks, {self.late_ticks} late, "
+                f"{self.skipped_ticks} skipped, max lateness {self.max_lateness * 1000:.2f} ms, "
+                f"avg tick cost {avgCost:.3f} ms")
+
+
+class TickScheduler:
+    # rate_hz         Ticks per second, e.g. 20, 30 or 60
+    # on_tick         Called once per tick with the tick number
+    # report_every    Seconds between printed reports, 0 disables reporting
+    # late_tolerance  Fraction of the tick interval a tick may start late before it counts as late
+    def __init__(self, rate_hz: float, on_tick: Callable[[int], None], report_every: float = 0.0,
+                 late_tolerance: float = 0.25) -> None:
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        self.rate_hz = rate_hz
+        self.interval = 1.0 / rate_hz
+        self.on_tick = on_tick
+        self.report_every = report_every
+        self.late_tolerance = late_tolerance
+        self.tick = 0
+        self.stats = TickStats()
+        self.totals = TickStats()
+        self.running = False
+        self._next_deadline = 0.0
+        self._next_report = 0.0
+
+    def _start(self) -> None:
+        now = time.monotonic()
+        self.running = True
+        self._next_deadline = now + self.interval
+        self._next_report = now + self.report_every
+
+    def _run_due_tick(self) -> None:
+        # Called once the current deadline has passed. Ticks that are a whole interval or more
+        # overdue are skipped rather than run back to back, so a stall never causes a burst
+        now = time.monotonic()
+        lateness = now - self._next_deadline
+        if lateness > self.interval * self.late_tolerance:
+            self.stats.late_ticks += 1
+            self.totals.late_ticks += 1
+        if lateness >= self.interval:
+            missed = int(lateness // self.interval)
+            self.stats.skipped_ticks += missed
+            self.totals.skipped_ticks += missed
+            self.tick += missed
+            self._next_deadline += missed * self.interval
+        self.stats.max_lateness = max(self.stats.max_lateness, lateness)
+        self.totals.max_lateness = max(self.totals.max_lateness, lateness)
+
+        self.tick += 1
+        self.on_tick(self.tick)
+        cost = time.monotonic() - now
+        self.stats.ticks += 1
+        self.totals.ticks += 1
+        self.stats.busy_time += cost
+        self.totals.busy_time += cost
+        self._next_deadline += self.interval
+
+        if self.report_every and now >= self._next_report:
+            print(self.stats.summary(self.rate_hz))
+            self.stats = TickStats()
+            self._next_report = now + self.report_every
+
+    def run_forever(self) -> None:
+        # Blocking loop, meant to run on its own (daemon) thread
+        self._start()
+        while self.running:
+            delay = self._next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._run_due_tick()
+
+    async def run_async(self) -> None:
+        # Event loop version, run as a task next to the client handlers
+        self._start()
+        while self.running:
+            delay = self._next_deadline - time.monotonic()
+            await asyncio.sleep(max(delay, 0))
+            self._run_due_tick()
+
+    def stop(self) -> None:
+        self.running = False
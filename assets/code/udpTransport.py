@@ -0,0 +1,190 @@
+# =================================================================================================
+# Purpose:                  Optional UDP transport for per-tick snapshots and client updates, so one
+#                           lost packet costs one snapshot instead of stalling every later one behind
+#                           a TCP retransmission. Shared by pongServer (--udp) and pongClient
+# =================================================================================================
+
+# Every snapshot carries the whole game state (paddles, ball, scores, sync), so nothing has to be
+# retransmitted: a lost one is replaced by the next, and one that arrives after a newer one is
+# dropped. What must arrive (handshake, START, pings) stays on the client's TCP connection.
+
+import asyncio
+import secrets
+import socket
+import threading
+from typing import Callable
+
+from assets.code.wireProtocol import (
+    CLIENT_DATAGRAM, HELLO_MESSAGE, MESSAGE_SIZES, MSG_HELLO, SERVER_DATAGRAM, UDP_OFFER
+)
+
+SEQ_MASK = 0xFFFFFFFF
+MAX_DATAGRAM = 2048
+
+
+class SequenceFilter:
+    # Accepts strictly increasing sequence numbers, allowing for wraparound, and counts what was
+    # skipped (lost, or late and then discarded) and what came too late
+    __slots__ = ('last', 'received', 'missed', 'stale')
+
+    def __init__(self) -> None:
+        self.last = None
+        self.received = 0
+        self.missed = 0
+        self.stale = 0
+
+    def accept(self, seq: int) -> bool:
+        if self.last is not None:
+            ahead = (seq - self.last) & SEQ_MASK
+            if ahead == 0 or ahead > SEQ_MASK // 2:
+                self.stale += 1
+                return False
+            self.missed += ahead - 1
+        self.last = seq
+        self.received += 1
+        return True
+
+    def loss(self) -> float:
+        # Share of the sequence numbers seen so far that never made it in order
+        total = self.received + self.missed
+        return self.missed / total if total else 0.0
+
+
+class UdpPeer:
+    # One client's side of the server's UDP socket
+    __slots__ = ('room', 'outbox', 'token', 'addr', 'seq', 'filter')
+
+    def __init__(self, room, outbox, token: int) -> None:
+        self.room = room
+        self.outbox = outbox
+        self.token = token
+        self.addr = None
+        self.seq = 0
+        self.filter = SequenceFilter()
+
+
+class UdpEndpoint:
+    # The server's UDP socket, shared by every client of the process. register() hands out the
+    # token a client puts in every datagram, receive() checks it and the sequence number, and once a
+    # client's address is known its outbox sends snapshots through send_to instead of TCP.
+    #
+    # send(data, addr) is the socket's sendto, or the datagram transport's in async mode
+    def __init__(self, port: int, send: Callable[[bytes, tuple], None]) -> None:
+        self.port = port
+        self.send = send
+        self.lock = threading.Lock()
+        self.peers = {}
+
+    def register(self, room, outbox) -> bytes:
+        # Returns the 'UDP port token;' offer for this client
+        with self.lock:
+            token = secrets.randbits(32)
+            while token in self.peers:
+                token = secrets.randbits(32)
+            self.peers[token] = UdpPeer(room, outbox, token)
+        outbox.udp_token = token
+        return f'{UDP_OFFER} {self.port} {token};'.encode()
+
+    def unregister(self, outbox) -> None:
+        with self.lock:
+            self.peers.pop(getattr(outbox, 'udp_token', None), None)
+        outbox.datagram = None
+
+    def receive(self, data: bytes, addr: tuple) -> tuple:
+        # Returns (room, outbox, message) for an update to apply, None for anything else: a hello,
+        # a stale or duplicate datagram, an unknown token or a malformed message
+        if len(data) <= CLIENT_DATAGRAM.size:
+            return None
+        token, seq = CLIENT_DATAGRAM.unpack_from(data)
+        peer = self.peers.get(token)
+        message = data[CLIENT_DATAGRAM.size:]
+        if peer is None or MESSAGE_SIZES.get(message[0]) != len(message):
+            return None
+        if not peer.filter.accept(seq):
+            return None
+
+        # The newest datagram says where the client is, also after its address changes
+        if peer.addr != addr:
+            peer.addr = addr
+            peer.outbox.datagram = lambda frame, peer = peer: self.send_to(peer, frame)
+        if message[0] == MSG_HELLO:
+            return None
+        return peer.room, peer.outbox, message
+
+    def send_to(self, peer: UdpPeer, frame: bytes) -> None:
+        # Called with the outbox's lock held, so sequence numbers go out in order
+        peer.seq = (peer.seq + 1) & SEQ_MASK
+        try:
+            self.send(SERVER_DATAGRAM.pack(peer.seq) + frame, peer.addr)
+        except OSError:
+            # A full socket buffer drops this snapshot, the next one replaces it
+            pass
+
+
+class DatagramHandler(asyncio.DatagramProtocol):
+    # Hands every datagram the event loop receives to on_datagram(data, addr)
+    def __init__(self, on_datagram: Callable[[bytes, tuple], None]) -> None:
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP port unreachable from a client that went away, nothing to do
+        pass
+
+
+class UdpLink:
+    # The client's end: a connected, non-blocking UDP socket to the server's offered port. Until the
+    # first datagram comes back, poll() keeps sending MSG_HELLO, the client's updates keep going over
+    # TCP, and established stays False
+    def __init__(self, host: str, port: int, token: int, hello_interval: float = 0.2) -> None:
+        self.token = token
+        self.hello_interval = hello_interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.filter = SequenceFilter()
+        self.established = False
+        self.next_hello = 0.0
+
+    def send(self, message: bytes) -> None:
+        self.seq = (self.seq + 1) & SEQ_MASK
+        try:
+            self.sock.send(CLIENT_DATAGRAM.pack(self.token, self.seq) + message)
+        except OSError:
+            pass
+
+    def poll(self, now: float) -> None:
+        if not self.established and now >= self.next_hello:
+            self.next_hello = now + self.hello_interval
+            self.send(HELLO_MESSAGE)
+
+    def receive(self) -> list:
+        # Every new datagram's message, oldest first, stale ones left out
+        messages = []
+        while True:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                return messages
+            except OSError:
+                # ICMP port unreachable, the server's UDP side is not there (yet)
+                continue
+            if len(data) <= SERVER_DATAGRAM.size:
+                continue
+            if self.filter.accept(SERVER_DATAGRAM.unpack_from(data)[0]):
+                self.established = True
+                messages.append(data[SERVER_DATAGRAM.size:])
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def parse_udp_offer(line: str) -> tuple:
+    # 'UDP port token' -> (port, token), None if the line is anything else
+    parts = line.split()
+    if len(parts) != 3 or parts[0] != UDP_OFFER or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return int(parts[1]), int(parts[2])
@@ -0,0 +1,189 @@
+# =================================================================================================
+# Purpose:                  Fixed-layout binary messages shared by pongClient and pongServer, and
+#                           the handshake lines used to negotiate them
+# =================================================================================================
+
+# Negotiation (the text protocol stays the default, every line below is ';' terminated text):
+#   server -> client   'width,height,side;'    unchanged handshake
+#   server -> client   'PROTOCOLS bin1;'       offer, no commas so older clients ignore it
+#   client -> server   'USE bin1;'             accept, sent from the lobby before any update
+#   server -> client   'USE bin1;'             ack, every message after it in both directions is binary
+# Older servers never offer, so newer clients keep talking text to them, and older clients never
+# answer the offer, so the server keeps talking text to them.
+
+import struct
+
+BINARY_PROTOCOL = 'bin1'
+TEXT_PROTOCOL = 'text'
+
+PROTOCOL_OFFER = f'PROTOCOLS {BINARY_PROTOCOL};'.encode()
+PROTOCOL_ACCEPT = f'USE {BINARY_PROTOCOL};'.encode()
+
+# Sent after the handshake by a server that simulates the ball itself (pongServer --authoritative).
+# Clients that understand it stop simulating the ball and only send their paddle position
+AUTHORITATIVE_MODE = b'MODE authoritative;'
+
+# Sent after the handshake instead by a server that only relays inputs (pongServer --rollback). Binary
+# clients then send MSG_INPUT for every frame and simulate the whole match themselves from both
+# players' inputs, which the server relays as MSG_PEER_INPUT, see rollbackSession.py
+ROLLBACK_MODE = b'MODE rollback;'
+
+# Round trip measurement, offered before PROTOCOLS only by a server collecting metrics. A client that
+# answers with the same line (before 'USE bin1;') gets MSG_PING after the switch to binary and sends
+# MSG_PONG back with the same id right away. Older clients ignore the offer and are never pinged
+PING_FEATURE = b'FEATURES ping;'
+
+# UDP transport, offered after PROTOCOLS only by a server started with --udp:
+#   server -> client   'UDP port token;'       the server's UDP port and this client's token
+#   client -> server   MSG_HELLO datagrams     repeated until the first snapshot arrives over UDP
+# From then on the server sends snapshots as datagrams and the client sends its updates the same
+# way. The handshake, START and pings stay on TCP. Every datagram carries a sequence number and
+# anything older than the newest one received is discarded, see udpTransport.SequenceFilter
+UDP_OFFER = 'UDP'
+
+# Delta snapshots, offered before PROTOCOLS by every server. A client that answers with the same line
+# (before 'USE bin1;') may get MSG_DELTA instead of MSG_STATE: only the fields that changed since a
+# base state the client already has, with a full MSG_STATE keyframe now and then. Over TCP the base
+# is always the previous snapshot, over UDP the newest one the client acknowledged with MSG_ACK.
+# See deltaSnapshot.py
+DELTA_FEATURE = b'FEATURES delta;'
+
+# Player names, offered before PROTOCOLS to players only by a server keeping match statistics
+# (pongServer --match-stats). A client may answer with 'NAME name;' (before 'USE bin1;'), the name its
+# results are kept under, see matchStats.py. Players that do not are known by their IP address
+NAME_FEATURE = b'FEATURES name;'
+
+# Message type is the first byte of every binary message and fixes the size of the rest
+MSG_STATE = 1       # server -> client: leftY, rightY, ballX, ballY, lScore, rScore, sync
+MSG_UPDATE = 2      # client -> server: paddleY, ballX, ballY, lScore, rScore, sync
+MSG_START = 3       # server -> client: no body
+MSG_INPUT = 4       # client -> server: paddleY, sync (authoritative mode)
+MSG_PING = 5        # server -> client: id
+MSG_PONG = 6        # client -> server: id of the MSG_PING being answered
+MSG_HELLO = 7       # client -> server over UDP: no body, tells the server where to send datagrams
+MSG_DELTA = 8       # server -> client: field mask, base sync (low 16 bits), sync advance, changed fields
+MSG_ACK = 9         # client -> server over UDP: sync of the newest snapshot applied
+MSG_PEER_INPUT = 10 # server -> client: side (0 left, 1 right), paddleY, frame (rollback mode)
+
+STATE = struct.Struct('!BhhhhBBI')
+UPDATE = struct.Struct('!BhhhBBI')
+START = struct.Struct('!B')
+INPUT = struct.Struct('!BhI')
+PING = struct.Struct('!BI')
+HELLO = struct.Struct('!B')
+ACK = struct.Struct('!BI')
+PEER_INPUT = struct.Struct('!BBhI')
+
+# A delta's header is followed by the fields whose mask bit is set, bit i for field i in STATE order
+DELTA_HEADER = struct.Struct('!BBHB')
+DELTA_FIELDS = ('h', 'h', 'h', 'h', 'B', 'B')      # leftY, rightY, ballX, ballY, lScore, rScore
+DELTA_ALL = (1 << len(DELTA_FIELDS)) - 1
+DELTA_STRUCTS = [
+    struct.Struct(DELTA_HEADER.format + ''.join(f for i, f in enumerate(DELTA_FIELDS) if mask >> i & 1))
+    for mask in range(DELTA_ALL + 1)
+]
+DELTA_SIZES = [layout.size for layout in DELTA_STRUCTS]
+MAX_DELTA_ADVANCE = 255
+
+# Datagram headers, followed by exactly one of the messages above
+SERVER_DATAGRAM = struct.Struct('!I')       # server -> client: seq
+CLIENT_DATAGRAM = struct.Struct('!II')      # client -> server: token, seq
+
+MESSAGE_SIZES = {
+    MSG_STATE: STATE.size,
+    MSG_UPDATE: UPDATE.size,
+    MSG_START: START.size,
+    MSG_INPUT: INPUT.size,
+    MSG_PING: PING.size,
+    MSG_PONG: PING.size,
+    MSG_HELLO: HELLO.size,
+    MSG_ACK: ACK.size,
+    MSG_PEER_INPUT: PEER_INPUT.size,
+}
+
+START_MESSAGE = START.pack(MSG_START)
+HELLO_MESSAGE = HELLO.pack(MSG_HELLO)
+
+
+
+def encode_state(leftY: int, rightY: int, ballX: int, ballY: int, lScore: int, rScore: int, sync: int) -> bytes:
+    # Purpose: Pack a server snapshot, players and spectators share the same layout
+    # Pre: Positions fit in a signed short, scores in a byte, sync in an unsigned int
+    # Post: Returns STATE.size bytes
+    return STATE.pack(MSG_STATE, leftY, rightY, ballX, ballY, lScore, rScore, sync & 0xFFFFFFFF)
+
+
+
+def encode_update(paddleY: int, ballX: int, ballY: int, lScore: int, rScore: int, sync: int) -> bytes:
+    # Purpose: Pack a client's per-frame update
+    # Pre: Same field ranges as encode_state
+    # Post: Returns UPDATE.size bytes
+    return UPDATE.pack(MSG_UPDATE, paddleY, ballX, ballY, lScore, rScore, sync & 0xFFFFFFFF)
+
+
+
+def encode_input(paddleY: int, sync: int) -> bytes:
+    # Purpose: Pack a client's paddle-only input for an authoritative server
+    # Pre: paddleY fits in a signed short
+    # Post: Returns INPUT.size bytes
+    return INPUT.pack(MSG_INPUT, paddleY, sync & 0xFFFFFFFF)
+
+
+
+def encode_ping(msg_type: int, ping_id: int) -> bytes:
+    # Purpose: Pack a MSG_PING, or the MSG_PONG answering it
+    # Pre: msg_type is MSG_PING or MSG_PONG
+    # Post: Returns PING.size bytes
+    return PING.pack(msg_type, ping_id & 0xFFFFFFFF)
+
+
+
+def encode_delta(base: tuple, state: tuple) -> bytes:
+    # Purpose: Pack the fields of state that differ from base
+    # Pre: base and state are (leftY, rightY, ballX, ballY, lScore, rScore, sync)
+    # Post: Returns the MSG_DELTA, or None if state is not 0 to MAX_DELTA_ADVANCE syncs after base
+    advance = state[6] - base[6]
+    if not 0 <= advance <= MAX_DELTA_ADVANCE:
+        return None
+    mask = 0
+    values = []
+    for i in range(len(DELTA_FIELDS)):
+        if state[i] != base[i]:
+            mask |= 1 << i
+            values.append(state[i])
+    return DELTA_STRUCTS[mask].pack(MSG_DELTA, mask, base[6] & 0xFFFF, advance, *values)
+
+
+
+def encode_ack(sync: int) -> bytes:
+    # Purpose: Pack a client's acknowledgement of the snapshot with this sync
+    # Pre: sync is a snapshot's sync
+    # Post: Returns ACK.size bytes
+    return ACK.pack(MSG_ACK, sync & 0xFFFFFFFF)
+
+
+
+def encode_peer_input(side: int, paddleY: int, frame: int) -> bytes:
+    # Purpose: Pack one player's input for the other clients of a rollback match
+    # Pre: side is 0 (left) or 1 (right), frame is the MSG_INPUT's sync
+    # Post: Returns PEER_INPUT.size bytes
+    return PEER_INPUT.pack(MSG_PEER_INPUT, side, paddleY, frame & 0xFFFFFFFF)
+
+
+
+def message_size(buffer, offset: int = 0) -> int:
+    # Purpose: Look up how long the binary message starting at offset is
+    # Pre: buffer[offset] is the first byte of a message
+    # Post: Returns its total size, raises ValueError for an unknown type so a corrupt stream is dropped
+
+    # A delta's size depends on its mask, until the mask is in only the header size is known
+    if buffer[offset] == MSG_DELTA:
+        if len(buffer) <= offset + 1:
+            return DELTA_HEADER.size
+        if buffer[offset + 1] > DELTA_ALL:
+            raise ValueError(f"bad delta mask {buffer[offset + 1]}")
+        return DELTA_SIZES[buffer[offset + 1]]
+    size = MESSAGE_SIZES.get(buffer[offset])
+    if size is None:
+        raise ValueError(f"unknown message type {buffer[offset]}")
+    return size
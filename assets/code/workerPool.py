@@ -0,0 +1,129 @@
+# =================================================================================================
+# Purpose:                  Hand accepted connections from the pongServer front process to the worker
+#                           process that owns their room, and collect each worker's stats
+# =================================================================================================
+
+# The front process accepts every connection and reads its room choice, then passes the socket itself
+# (SCM_RIGHTS over a SOCK_SEQPACKET socketpair, Linux/macOS) to the worker that owns the room. Every
+# client of a room lands in the same process, so a match never spans processes. On the same channel:
+#   front  -> worker   b'C' + room name + b'\n' + bytes already read from the client, with the fd
+#                      (b'W' instead of b'C' for a client that asked to watch the room, b'R' and
+#                      room name + b' ' + session token for one resuming its side)
+#   worker -> front    b'S' + JSON stats, every stats interval
+
+import json
+import os
+import socket
+import time
+import zlib
+
+from assets.code.matchRoom import DEFAULT_ROOM
+
+CHANNEL_MESSAGE_SIZE = 65536
+
+
+def owner_of(room_name: str, workers: int) -> int:
+    # Stable across runs and processes, unlike hash()
+    return zlib.crc32(room_name.encode()) % workers
+
+
+def send_connection(channel: socket.socket, client: socket.socket, room_name: str, data: bytes,
+                    spectator: bool = False, token: str = None) -> None:
+    if token is not None:
+        kind, room_name = b'R', f'{room_name} {token}'
+    else:
+        kind = b'W' if spectator else b'C'
+    socket.send_fds(channel, [kind + room_name.encode() + b'\n' + data], [client.fileno()])
+
+
+def receive_connection(channel: socket.socket) -> tuple:
+    # Returns (socket, room name, bytes already read, spectator, session token or None), (None, None,
+    # stats, False, None) for a stats message, or None once the other end has gone away
+    message, fds, _, _ = socket.recv_fds(channel, CHANNEL_MESSAGE_SIZE, 1)
+    if not message:
+        return None
+    if message[:1] == b'S':
+        return None, None, json.loads(message[1:]), False, None
+    room_name, _, data = message[1:].partition(b'\n')
+    room_name, _, token = room_name.decode().partition(' ')
+    return socket.socket(fileno = fds[0]), room_name, data, message[:1] == b'W', token or None
+
+
+def send_stats(channel: socket.socket, stats: dict) -> None:
+    channel.send(b'S' + json.dumps(stats).encode())
+
+
+class WorkerRouter:
+    # Front process side: which worker gets a connection, and the latest stats from each one
+    def __init__(self, channels: list) -> None:
+        self.channels = channels
+        self.routed = [0] * len(channels)
+        self.stats = [None] * len(channels)
+        self.previous = [None] * len(channels)
+        self.pending_auto_room = None
+        self.auto_rooms = 0
+
+    def room_for(self, room_name: str) -> str:
+        # Turn a room choice into a concrete name. 'ROOM;' clients are paired two by two into new
+        # rooms here, since no single worker sees every waiting room
+        if room_name is None:
+            return DEFAULT_ROOM
+        if room_name:
+            return room_name
+        if self.pending_auto_room is not None:
+            room_name, self.pending_auto_room = self.pending_auto_room, None
+            return room_name
+        self.auto_rooms += 1
+        self.pending_auto_room = f'room-{self.auto_rooms}'
+        return self.pending_auto_room
+
+    def hand_off(self, client: socket.socket, room_name: str, data: bytes, spectator: bool = False,
+                 token: str = None) -> int:
+        index = owner_of(room_name, len(self.channels))
+        send_connection(self.channels[index], client, room_name, data, spectator, token)
+        self.routed[index] += 1
+        return index
+
+    def update_stats(self, index: int, stats: dict) -> None:
+        self.previous[index] = self.stats[index]
+        self.stats[index] = stats
+
+    def listing(self) -> bytes:
+        # The ROOMS offer, from the waiting rooms the workers last reported
+        waiting = [name for stats in self.stats if stats for name in stats['waiting']]
+        return ' '.join(['ROOMS', *waiting[:20]]).encode() + b';'
+
+    def summary(self) -> str:
+        # One line per worker and a total, rates are since each worker's previous report
+        lines = [f"{'worker':<8}{'pid':>8}{'rooms':>7}{'clients':>9}{'routed':>8}{'frames/s':>10}{'cpu %':>7}"]
+        totals = [0, 0, 0, 0.0, 0.0]
+        for index, (stats, previous) in enumerate(zip(self.stats, self.previous)):
+            if stats is None:
+                lines.append(f"{index:<8}{'-':>8}")
+                continue
+            frameRate = cpu = 0.0
+            if previous is not None and stats['time'] > previous['time']:
+                elapsed = stats['time'] - previous['time']
+                frameRate = max(0, stats['frames'] - previous['frames']) / elapsed
+                cpu = 100 * (stats['cpu'] - previous['cpu']) / elapsed
+            lines.append(f"{index:<8}{stats['pid']:>8}{stats['rooms']:>7}{stats['clients']:>9}"
+                         f"{self.routed[index]:>8}{frameRate:>10,.0f}{cpu:>7.1f}")
+            for i, value in enumerate((stats['rooms'], stats['clients'], self.routed[index], frameRate, cpu)):
+                totals[i] += value
+        lines.append(f"{'total':<8}{'':>8}{totals[0]:>7}{totals[1]:>9}{totals[2]:>8}{totals[3]:>10,.0f}{totals[4]:>7.1f}")
+        return '\n'.join(lines)
+
+
+def worker_stats(rooms) -> dict:
+    # What a worker reports about itself, rooms is its RoomManager
+    active = rooms.all()
+    clients = [outbox for room in active for outbox, _ in list(room.clients)]
+    return {
+        'pid': os.getpid(),
+        'time': time.monotonic(),
+        'cpu': time.process_time(),
+        'rooms': len(active),
+        'clients': len(clients),
+        'frames': sum(outbox.sent_frames for outbox in clients),
+        'waiting': [f'{room.name}:{len(room.clients)}' for room in active if room.waiting()][:20],
+    }
@@ -0,0 +1,161 @@
+# =================================================================================================
+# Purpose:                  What a spectator on a slow link gets with and without pongServer
+#                           --adaptive-rate, while its link slows down and recovers
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/adaptiveRate.py --bandwidth 150 --phases 5 10 10 --spectators 4
+#
+# An authoritative server runs one room with two bot players and --spectators spectators, all
+# connected directly, plus one spectator behind lossShim. The shim's link is unlimited for the first
+# phase, --bandwidth bytes per second for the second and unlimited again for the third. Everything
+# the slow link cannot carry waits in the shim, as in the buffer of a crowded access point. This runs
+# once on a plain server and once with --adaptive-rate. Per phase, for the slow spectator:
+#   Hz         snapshots received per second
+#   delay      how late each snapshot arrived, relative to the quickest one, p50 and p99
+# and twice a second the server's /json metrics: the rate the controller chose for the slow spectator
+# (the spectator with the slowest round trip), its bytes per second and round trip, and the lowest
+# rate of every other client.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.lossShim import LinkModel, LossShim
+from benchmarks.serverCapacity import launch_server
+from benchmarks.udpLoss import TICK_RATE, Client, run_client
+
+PHASES = ('fast', 'slow', 'recovered')
+
+
+
+# Read the server's metrics
+def fetch_clients(metrics_port: int) -> list:
+    # Purpose: GET /json from the metrics endpoint
+    # Pre: The server runs with --metrics-port metrics_port
+    # Post: Returns the report's client list
+    with urllib.request.urlopen(f'http://127.0.0.1:{metrics_port}/json', timeout = 2) as response:
+        return json.load(response)['clients']
+
+
+
+# One run against one server
+async def measure(port: int, metrics_port: int, spectators: int, bandwidth: float, phases: list) -> tuple:
+    # Purpose: Connect everyone, change the slow link's bandwidth at every phase and sample the metrics
+    # Pre: An authoritative server with --metrics-port listens on port
+    # Post: Returns (the slow spectator's arrivals, phase start times, samples), every connection is closed
+
+    loop = asyncio.get_running_loop()
+    model = LinkModel()
+    shim = LossShim('127.0.0.1', port, model)
+    await shim.start()
+
+    players = [Client('rate'), Client('rate')]
+    watchers = [Client('rate') for _ in range(spectators)]
+    slow = Client('rate')
+    tasks = [loop.create_task(run_client(client, '127.0.0.1', port)) for client in players + watchers]
+    await asyncio.sleep(0.3)
+    tasks.append(loop.create_task(run_client(slow, '127.0.0.1', shim.listen_port)))
+    await asyncio.wait_for(slow.started.wait(), 5)
+    slow.arrivals.clear()
+
+    starts = []
+    samples = []
+    for phase, seconds in zip(PHASES, phases):
+        model.bandwidth = bandwidth if phase == 'slow' else 0
+        starts.append(time.perf_counter())
+        end = starts[-1] + seconds
+        while time.perf_counter() < end:
+            await asyncio.sleep(0.5)
+            clients = await asyncio.to_thread(fetch_clients, metrics_port)
+            samples.append((time.perf_counter() - starts[0], phase, clients))
+    starts.append(time.perf_counter())
+
+    for client in players + watchers + [slow]:
+        client.writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+    shim.close()
+    return list(slow.arrivals), starts, samples
+
+
+
+# Per phase numbers for the slow spectator
+def phase_summary(arrivals: list, starts: list) -> list:
+    # Purpose: Snapshots per second and delay percentiles within each phase
+    # Pre: arrivals are (arrival time, sync) in arrival order, starts has one more entry than PHASES
+    # Post: Returns one (phase, Hz, delay p50 ms, delay p99 ms) per phase
+
+    if not arrivals:
+        return [(phase, 0.0, None, None) for phase in PHASES]
+    offset = min(t - sync / TICK_RATE for t, sync in arrivals)
+    result = []
+    for phase, start, end in zip(PHASES, starts, starts[1:]):
+        delays = sorted((t - sync / TICK_RATE - offset) * 1000 for t, sync in arrivals if start <= t < end)
+        if not delays:
+            result.append((phase, 0.0, None, None))
+            continue
+        result.append((phase, len(delays) / (end - start), delays[len(delays) // 2],
+                       delays[min(len(delays) - 1, int(len(delays) * 0.99))]))
+    return result
+
+
+
+# Print the metrics timeline of an adaptive run
+def print_samples(samples: list) -> None:
+    # Purpose: One line per sample, the slow spectator against everyone else
+    # Pre: samples come from measure() on a server with --adaptive-rate
+    # Post: Printed
+
+    print(f"  {'t s':>5}  {'phase':<10}{'slow Hz':>8}{'bytes/s':>9}{'rtt ms':>9}{'others Hz':>11}")
+    for elapsed, phase, clients in samples:
+        watching = [c for c in clients if c['side'] == 'spectator' and 'rate_hz' in c]
+        if not watching:
+            continue
+        slow = max(watching, key = lambda c: c['rtt_ms'] or 0)
+        others = [c['rate_hz'] for c in clients if c is not slow and 'rate_hz' in c]
+        rtt = f"{slow['rtt_ms']:.0f}" if slow['rtt_ms'] is not None else '-'
+        print(f"  {elapsed:>5.1f}  {phase:<10}{slow['rate_hz']:>8g}{slow['bytes_per_s']:>9,}{rtt:>9}"
+              f"{min(others) if others else 0:>11g}")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Snapshot rate and delay on a link that slows down, with and without --adaptive-rate")
+    parser.add_argument('--mode', choices = ['threaded', 'async'], default = 'async')
+    parser.add_argument('--port', type = int, default = 5761)
+    parser.add_argument('--bandwidth', type = float, default = 150, help = "Slow phase bytes per second")
+    parser.add_argument('--phases', type = float, nargs = 3, default = [5, 10, 10], metavar = 'SECONDS',
+                        help = "Length of the fast, slow and recovered phases")
+    parser.add_argument('--spectators', type = int, default = 4, help = "Spectators on fast links")
+    parser.add_argument('--rate-tiers', help = "Passed on to the server")
+    args = parser.parse_args()
+
+    runs = [('every snapshot', []), ('--adaptive-rate', ['--adaptive-rate'])]
+    if args.rate_tiers:
+        runs[1][1].extend(['--rate-tiers', args.rate_tiers])
+    print(f"Slow spectator: unlimited for {args.phases[0]:g} s, {args.bandwidth:g} bytes/s for {args.phases[1]:g} s, "
+          f"unlimited for {args.phases[2]:g} s ({args.mode} server, 60 Hz authoritative)")
+    for index, (label, extra) in enumerate(runs):
+        port = args.port + 2 * index
+        server = launch_server(args.mode, port, ['--authoritative', '--metrics-port', str(port + 1), *extra])
+        try:
+            arrivals, starts, samples = asyncio.run(measure(port, port + 1, args.spectators, args.bandwidth, args.phases))
+        finally:
+            server.kill()
+            server.wait()
+
+        print(f"\n{label}")
+        print(f"  {'phase':<10}{'Hz':>7}{'delay p50 ms':>14}{'p99 ms':>10}")
+        for phase, hz, p50, p99 in phase_summary(arrivals, starts):
+            delay = f"{p50:>14.0f}{p99:>10.0f}" if p50 is not None else f"{'-':>14}{'-':>10}"
+            print(f"  {phase:<10}{hz:>7.1f}{delay}")
+        if extra:
+            print_samples(samples)
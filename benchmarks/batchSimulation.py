@@ -0,0 +1,208 @@
+# =================================================================================================
+# Purpose:                  Checks that BatchSimulation plays exactly like MatchSimulation, then
+#                           measures how many match steps per second it sustains at each batch size
+# =================================================================================================
+
+# Usage (from the repository root, needs numpy):
+#   python benchmarks/batchSimulation.py --check-matches 300 --check-steps 5000
+#   python benchmarks/batchSimulation.py --skip-check --sizes 1 100 1000 10000 100000 --seconds 2
+#
+# Equivalence: --check-matches matches run side by side in one BatchSimulation and in as many
+# MatchSimulations for --check-steps steps, and all 7 state fields are compared after every step.
+# Every match gets its own inputs so hits, walls, points and game over all come up:
+#   track     set_paddles with both paddles chasing the ball, off centre and at their own speeds
+#   jump      set_paddles with random positions, also far outside the court so clamping is used
+#   move      move_paddles with random up/down/stay, against playGame's movement rule on Paddle
+# A match that is over is reset in both. The first mismatch is printed and the exit status is 1.
+#
+# Throughput: matches x steps per second for MatchSimulation (one match at a time, what the server
+# does) and BatchSimulation at every --sizes, both with ball-tracking paddles and finished matches reset.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from assets.code.batchSimulation import WALL_HEIGHT, BatchSimulation
+from assets.code.matchSimulation import PADDLE_HEIGHT, MatchSimulation
+
+POLICIES = ('track', 'jump', 'move')
+
+
+
+# Inputs for one match and one step
+def choose_inputs(policy: str, sim: MatchSimulation, rng: random.Random, aim: tuple) -> tuple:
+    # Purpose: What the match's two players do this step
+    # Pre: policy is one of POLICIES, aim is this match's ((offset, speed), (offset, speed))
+    # Post: Returns (left, right), paddle positions for track and jump, directions for move
+
+    if policy == 'track':
+        ballY = sim.ball.rect.y
+        return tuple(paddle.rect.y + max(-speed, min(speed, ballY + offset - paddle.rect.centery))
+                     for paddle, (offset, speed) in zip((sim.leftPaddle, sim.rightPaddle), aim))
+    if policy == 'jump':
+        return rng.randint(-100, sim.screenHeight + 100), rng.randint(-100, sim.screenHeight + 100)
+    return rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1))
+
+
+
+# playGame's paddle movement on a MatchSimulation
+def move_paddle(sim: MatchSimulation, paddle, moving: int) -> None:
+    # Purpose: The reference for BatchSimulation.move_paddles, written the way playGame moves a Paddle
+    # Pre: moving is -1 (up), 0 or 1 (down)
+    # Post: paddle.rect has moved by at most paddle.speed
+
+    if moving > 0:
+        if paddle.rect.bottomleft[1] < sim.screenHeight - WALL_HEIGHT:
+            paddle.rect.y += paddle.speed
+    elif moving < 0:
+        if paddle.rect.topleft[1] > WALL_HEIGHT:
+            paddle.rect.y -= paddle.speed
+
+
+
+# Run both engines side by side
+def check(matches: int, steps: int, width: int, height: int, seed: int) -> bool:
+    # Purpose: Compare BatchSimulation with MatchSimulation after every step
+    # Pre: matches >= len(POLICIES)
+    # Post: Returns True if every state matched, prints what happened either way
+
+    rng = random.Random(seed)
+    sims = [MatchSimulation(width, height) for _ in range(matches)]
+    policies = [POLICIES[i % len(POLICIES)] for i in range(matches)]
+    aims = [((rng.randint(-25, 25), rng.randint(1, 8)), (rng.randint(-25, 25), rng.randint(1, 8)))
+            for _ in range(matches)]
+    batch = BatchSimulation(matches, width, height)
+    points = hits = finished = 0
+
+    for step in range(steps):
+        inputs = [choose_inputs(p, sim, rng, aim) for p, sim, aim in zip(policies, sims, aims)]
+        moving = np.array([p == 'move' for p in policies])
+
+        # Positions for the set_paddles matches, the others keep theirs and move
+        positions = np.array([inp if p != 'move' else (sim.leftPaddle.rect.y, sim.rightPaddle.rect.y)
+                              for p, inp, sim in zip(policies, inputs, sims)])
+        batch.set_paddles(np.where(moving, batch.leftY, positions[:, 0]), np.where(moving, batch.rightY, positions[:, 1]))
+        directions = np.array([inp if p == 'move' else (0, 0) for p, inp in zip(policies, inputs)])
+        batch.move_paddles(directions[:, 0], directions[:, 1])
+        batch.step()
+
+        for sim, policy, (left, right) in zip(sims, policies, inputs):
+            if policy == 'move':
+                move_paddle(sim, sim.leftPaddle, left)
+                move_paddle(sim, sim.rightPaddle, right)
+            else:
+                sim.set_paddle('left', left)
+                sim.set_paddle('right', right)
+            xVel, score = sim.ball.xVel, sim.lScore + sim.rScore
+            sim.step()
+            hits += sim.ball.xVel == -xVel and sim.lScore + sim.rScore == score
+            points += sim.lScore + sim.rScore - score
+
+        expected = np.array([sim.state() for sim in sims])
+        actual = batch.states()
+        wrong = np.nonzero((expected != actual).any(axis = 1))[0]
+        if len(wrong):
+            i = wrong[0]
+            print(f"MISMATCH at step {step + 1}, match {i} ({policies[i]}): MatchSimulation {tuple(expected[i])} "
+                  f"BatchSimulation {tuple(actual[i])}, {len(wrong)} matches differ")
+            return False
+
+        # Finished matches start over in both
+        over = np.array([sim.game_over for sim in sims])
+        if over.any():
+            finished += int(over.sum())
+            for sim in np.array(sims)[over]:
+                sim.reset_match()
+            batch.reset_matches(over)
+
+    print(f"check    {matches} matches x {steps} steps on a {width}x{height} court: identical "
+          f"({hits:,} paddle hits, {points:,} points, {finished} matches finished)")
+    return True
+
+
+
+# Ball-tracking paddles for every match of a batch
+def track_ball(batch: BatchSimulation) -> None:
+    # Purpose: The simulationTicks bots, vectorized: left aims 18 px off centre at 5 px, right at 3 px
+    # Pre: None
+    # Post: Paddles are set for the next step
+
+    center = PADDLE_HEIGHT // 2
+    batch.set_paddles(batch.leftY + np.clip(batch.ballY + 18 - batch.leftY - center, -5, 5),
+                      batch.rightY + np.clip(batch.ballY - batch.rightY - center, -3, 3))
+
+
+
+# Steps per second of the existing engine
+def scalar_rate(seconds: float) -> float:
+    # Purpose: benchmarks/simulationTicks.py's loop, for comparison
+    # Pre: seconds > 0
+    # Post: Returns match steps per second
+
+    sim = MatchSimulation()
+    steps = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _ in range(1000):
+            ballY = sim.ball.rect.y
+            for side, paddle, aim, speed in (('left', sim.leftPaddle, 18, 5), ('right', sim.rightPaddle, 0, 3)):
+                sim.set_paddle(side, paddle.rect.y + max(-speed, min(speed, ballY + aim - paddle.rect.centery)))
+            sim.step()
+            if sim.game_over:
+                sim.reset_match()
+        steps += 1000
+    return steps / (time.perf_counter() - started)
+
+
+
+# Steps per second of a batch
+def batch_rate(size: int, seconds: float) -> float:
+    # Purpose: Step size matches with tracking paddles, resetting the finished ones, for seconds
+    # Pre: size > 0
+    # Post: Returns matches x steps per second
+
+    batch = BatchSimulation(size)
+    steps = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _ in range(10):
+            track_ball(batch)
+            batch.step()
+            over = batch.game_over
+            if over.any():
+                batch.reset_matches(over)
+        steps += 10
+    return size * steps / (time.perf_counter() - started)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "BatchSimulation equivalence and throughput")
+    parser.add_argument('--check-matches', type = int, default = 300)
+    parser.add_argument('--check-steps', type = int, default = 5000)
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--skip-check', action = 'store_true')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1, 100, 1000, 10000, 100000])
+    parser.add_argument('--seconds', type = float, default = 2.0, help = "Per throughput measurement")
+    args = parser.parse_args()
+
+    if not args.skip_check:
+
+        # The usual court, and an odd-sized one where the halves pygame truncates are not whole
+        ok = check(args.check_matches, args.check_steps, 640, 480, args.seed)
+        ok = ok and check(max(len(POLICIES), args.check_matches // 3), args.check_steps, 501, 377, args.seed + 1)
+        if not ok:
+            sys.exit(1)
+
+    scalar = scalar_rate(args.seconds)
+    print(f"{'engine':<26}{'match steps/s':>16}{'vs MatchSimulation':>20}{'60 Hz matches':>16}")
+    print(f"{'MatchSimulation':<26}{scalar:>16,.0f}{1:>19.1f}x{scalar / 60:>16,.0f}", flush = True)
+    for size in args.sizes:
+        rate = batch_rate(size, args.seconds)
+        print(f"{f'BatchSimulation x {size:,}':<26}{rate:>16,.0f}{rate / scalar:>19.1f}x{rate / 60:>16,.0f}", flush = True)
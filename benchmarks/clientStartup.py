@@ -0,0 +1,164 @@
+# =================================================================================================
+# Purpose:                  How fast pongClient gets from starting (or from START) to its first frame,
+#                           and how much CPU it burns while waiting in the lobby
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/clientStartup.py --trials 5 --lobby-seconds 5
+#
+# Every client runs as its own process through the command line entry point (--server), so tkinter
+# never loads. 'window' draws into a pygame window (SDL's dummy video driver here, so it also runs
+# without a display), 'headless' is --headless, which opens no window at all. Each runs with the lobby
+# preloading pygame, fonts and sounds and with --no-preload. The opponent is a headless client.
+#   opponent waiting   the opponent is in the room first, START follows the join straight away. From
+#                      starting the process to the first frame
+#   opponent later     the opponent joins a second after the client. From START to the first frame,
+#                      as pongClient prints it when PONG_PROFILE is set (here to a CSV on the null
+#                      device, no overlay) or headless
+# Lobby: a client alone in its room, CPU time it uses per second of waiting (from /proc, Linux only),
+# then how long it takes to exit once the server goes away.
+#
+# The Tk start screen waits in the same LobbyHandshake from Tk's event loop, every LOBBY_POLL_MS. It
+# needs a display and is not run here.
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.serverCapacity import REPO_ROOT, launch_server
+
+KINDS = {'window': [], 'headless': ['--headless']}
+
+
+
+# One pongClient process and every line it prints, with the time it arrived
+class ClientProcess:
+    def __init__(self, port: int, room: str, extra_args: list) -> None:
+        # pongClient prints the time from START to its first frame when profiling, the per-frame CSV
+        # goes nowhere and there is no overlay to draw
+        env = dict(os.environ, SDL_VIDEODRIVER = 'dummy', SDL_AUDIODRIVER = 'dummy', PONG_PROFILE = f'csv={os.devnull}')
+        self.began = time.perf_counter()
+        self.proc = subprocess.Popen(
+            [sys.executable, '-u', os.path.join(REPO_ROOT, 'pongClient.py'), '--server', f'127.0.0.1:{port}',
+             '--room', room, *extra_args],
+            cwd = REPO_ROOT, env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True
+        )
+        self.lines = []
+        self.seen = threading.Condition()
+        threading.Thread(target = self._read, daemon = True).start()
+
+    def _read(self) -> None:
+        for line in self.proc.stdout:
+            with self.seen:
+                self.lines.append((time.perf_counter(), line.strip()))
+                self.seen.notify_all()
+
+    def wait_for(self, prefix: str, timeout: float = 30.0) -> tuple:
+        # (arrival time, line) of the first line starting with prefix, raises TimeoutError
+        with self.seen:
+            found = self.seen.wait_for(lambda: next((l for l in self.lines if l[1].startswith(prefix)), None), timeout)
+        if found is None:
+            raise TimeoutError(f"the client never printed {prefix!r}: {[line for _, line in self.lines]}")
+        return found
+
+    def cpu_seconds(self) -> float:
+        # User and system time so far, from /proc/<pid>/stat
+        with open(f'/proc/{self.proc.pid}/stat') as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    def stop(self) -> None:
+        self.proc.kill()
+        self.proc.wait()
+
+
+
+# One client's way to its first frame
+def first_frame(port: int, room: str, extra_args: list, opponent_first: bool) -> dict:
+    # Purpose: Start the client and a headless opponent in room, in the order opponent_first says
+    # Pre: A server listens on port, room is new
+    # Post: Returns seconds from starting the client to its first frame and from START to it
+
+    opponent = None
+    if opponent_first:
+        opponent = ClientProcess(port, room, KINDS['headless'])
+        opponent.wait_for("Connected")
+        time.sleep(0.3)
+    client = ClientProcess(port, room, extra_args)
+    try:
+        if not opponent_first:
+            client.wait_for("Connected")
+            time.sleep(1.0)
+            opponent = ClientProcess(port, room, KINDS['headless'])
+        arrived, line = client.wait_for("First frame")
+        return {'first_frame': arrived - client.began, 'after_start': float(line.split()[2]) / 1000}
+    finally:
+        client.stop()
+        opponent.stop()
+
+
+
+# CPU in the lobby, then the server goes away
+def lobby(mode: str, port: int, extra_args: list, seconds: float) -> dict:
+    # Purpose: Wait alone in a room of a server of our own, then kill the server
+    # Pre: port is free
+    # Post: Returns CPU seconds per second of waiting, seconds until the client exited after the
+    #       server died and its exit status
+
+    server = launch_server(mode, port)
+    client = ClientProcess(port, 'lobby', extra_args)
+    try:
+        client.wait_for("Connected")
+        time.sleep(1.0)
+        used = client.cpu_seconds()
+        time.sleep(seconds)
+        cpu = (client.cpu_seconds() - used) / seconds
+        server.kill()
+        server.wait()
+        killed = time.perf_counter()
+        status = client.proc.wait(timeout = 30)
+        return {'cpu': cpu, 'exit_after': time.perf_counter() - killed, 'status': status}
+    finally:
+        client.stop()
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "pongClient startup-to-first-frame and lobby CPU")
+    parser.add_argument('--mode', choices = ['threaded', 'async'], default = 'threaded')
+    parser.add_argument('--port', type = int, default = 5781)
+    parser.add_argument('--trials', type = int, default = 5, help = "Runs per kind and scenario")
+    parser.add_argument('--lobby-seconds', type = float, default = 5.0)
+    args = parser.parse_args()
+
+    pick = lambda values, pct: sorted(values)[min(len(values) - 1, int(len(values) * pct / 100))]
+    server = launch_server(args.mode, args.port)
+    try:
+        print(f"{args.mode} server, {args.trials} trials each, times in ms")
+        print(f"  {'client':<10}{'preload':<9}{'start to frame p50':>20}{'max':>8}{'START to frame p50':>20}{'max':>8}")
+        for kind, extra_args in KINDS.items():
+            for preload in (True, False):
+                flags = extra_args if preload else extra_args + ['--no-preload']
+                waiting = [first_frame(args.port, f'{kind}-{preload}-w{trial}', flags, True)['first_frame']
+                           for trial in range(args.trials)]
+                later = [first_frame(args.port, f'{kind}-{preload}-l{trial}', flags, False)['after_start']
+                         for trial in range(args.trials)]
+                print(f"  {kind:<10}{'yes' if preload else 'no':<9}{pick(waiting, 50) * 1000:>20.1f}"
+                      f"{max(waiting) * 1000:>8.1f}{pick(later, 50) * 1000:>20.1f}{max(later) * 1000:>8.1f}", flush = True)
+    finally:
+        server.kill()
+        server.wait()
+
+    print(f"\nLobby, alone in a room for {args.lobby_seconds:g} s, then the server is killed")
+    print(f"  {'client':<10}{'CPU %':>7}{'exit after ms':>15}{'status':>8}")
+    for index, (kind, extra_args) in enumerate(KINDS.items()):
+        r = lobby(args.mode, args.port + 1 + index, extra_args, args.lobby_seconds)
+        print(f"  {kind:<10}{r['cpu'] * 100:>7.2f}{r['exit_after'] * 1000:>15.1f}{r['status']:>8}")
@@ -0,0 +1,133 @@
+# =================================================================================================
+# Purpose:                  Throughput of FrameDecoder on large bursts and fragmented input, checked
+#                           against the expected messages, next to the old string-splitting loop
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/frameDecoder.py --messages 20000 50000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.wireProtocol import BINARY_PROTOCOL, STATE, TEXT_PROTOCOL, encode_state
+
+
+
+# Build a stream of N snapshots in either protocol
+def make_stream(protocol: str, count: int) -> tuple:
+    # Purpose: Generate the bytes a backlogged client would find in its socket
+    # Pre: protocol is TEXT_PROTOCOL or BINARY_PROTOCOL
+    # Post: Returns (stream bytes, list of the sync values in order)
+
+    syncs = list(range(count))
+    if protocol == TEXT_PROTOCOL:
+        stream = b''.join(f'215,187,{i % 640},{i % 480},0,0,{i};'.encode() for i in syncs)
+    else:
+        stream = b''.join(encode_state(215, 187, i % 640, i % 480, 0, 0, i) for i in syncs)
+    return stream, syncs
+
+
+
+# Decode a list of chunks with FrameDecoder
+def decode_with_decoder(protocol: str, chunks: list) -> list:
+    # Purpose: The code path pongClient and pongServer now use
+    # Pre: chunks concatenate to a stream from make_stream
+    # Post: Returns the decoded sync values
+
+    decoder = FrameDecoder(protocol)
+    syncs = []
+    for chunk in chunks:
+        decoder.feed(chunk)
+        for frame in decoder.frames():
+            if protocol == TEXT_PROTOCOL:
+                syncs.append(int(str(frame, 'ascii').rsplit(',', 1)[1]))
+            else:
+                syncs.append(STATE.unpack_from(frame)[7])
+    return syncs
+
+
+
+# Decode a list of chunks the way playGame used to
+def decode_with_string_split(protocol: str, chunks: list) -> list:
+    # Purpose: Baseline, repeated concatenation and split/slice of an immutable buffer
+    # Pre: chunks concatenate to a stream from make_stream
+    # Post: Returns the decoded sync values
+
+    syncs = []
+    if protocol == TEXT_PROTOCOL:
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk.decode()
+            while ';' in buffer:
+                msg, buffer = buffer.split(';', 1)
+                syncs.append(int(msg.rsplit(',', 1)[1]))
+    else:
+        buffer = b''
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= STATE.size:
+                syncs.append(STATE.unpack_from(buffer)[7])
+                buffer = buffer[STATE.size:]
+    return syncs
+
+
+
+# Split a stream into chunks
+def fragment(protocol: str, stream: bytes, sizes: str) -> list:
+    # Purpose: burst = one read, recv = 4096 byte reads, message = one message per read (what a server
+    #          reads from a client), random = 1..37 bytes per read, bytes = 1 byte per read
+    # Pre: stream comes from make_stream(protocol), sizes is 'burst', 'recv', 'message', 'random' or 'bytes'
+    # Post: Returns the list of chunks
+
+    if sizes == 'burst':
+        return [stream]
+    if sizes == 'recv':
+        return [stream[i:i + 4096] for i in range(0, len(stream), 4096)]
+    if sizes == 'message' and protocol == TEXT_PROTOCOL:
+        return [message + b';' for message in stream.split(b';')[:-1]]
+    if sizes == 'message':
+        return [stream[i:i + STATE.size] for i in range(0, len(stream), STATE.size)]
+    if sizes == 'bytes':
+        return [stream[i:i + 1] for i in range(len(stream))]
+    rng = random.Random(5555)
+    chunks = []
+    offset = 0
+    while offset < len(stream):
+        step = rng.randint(1, 37)
+        chunks.append(stream[offset:offset + step])
+        offset += step
+    return chunks
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "FrameDecoder throughput benchmark")
+    parser.add_argument('--messages', type = int, nargs = '+', default = [10000, 40000])
+    parser.add_argument('--skip-baseline', action = 'store_true', help = "Only time FrameDecoder")
+    args = parser.parse_args()
+
+    print(f"{'protocol':<10}{'input':<8}{'msgs':>8}{'decoder msg/s':>16}{'split msg/s':>14}")
+    for protocol in (TEXT_PROTOCOL, BINARY_PROTOCOL):
+        for count in args.messages:
+            stream, expected = make_stream(protocol, count)
+            for sizes in ('burst', 'recv', 'message', 'random', 'bytes'):
+                chunks = fragment(protocol, stream, sizes)
+
+                start = time.perf_counter()
+                decoded = decode_with_decoder(protocol, chunks)
+                decoderRate = count / (time.perf_counter() - start)
+                assert decoded == expected, f"{protocol}/{sizes}: decoded messages do not match"
+
+                baseline = '-'
+                if not args.skip_baseline:
+                    start = time.perf_counter()
+                    assert decode_with_string_split(protocol, chunks) == expected
+                    baseline = f"{count / (time.perf_counter() - start):,.0f}"
+
+                print(f"{protocol:<10}{sizes:<8}{count:>8}{decoderRate:>16,.0f}{baseline:>14}")
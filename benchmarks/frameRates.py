@@ -0,0 +1,57 @@
+# =================================================================================================
+# Purpose:                  How fast the game runs on a client drawing at a given frame rate, stepping
+#                           once per frame (the old game loop) against FixedTimestep
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/frameRates.py --fps 20 30 60 144 --seconds 3
+# Frames are stood in for by sleeping, --jitter adds a random extra delay to each one. A correct
+# client simulates 60 ticks per second at every frame rate.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.fixedTimestep import FixedTimestep
+
+TICK_RATE = 60
+
+
+
+# Draw frames at fps for some seconds and count simulation ticks
+def run(fps: float, seconds: float, jitter: float, fixed: bool) -> tuple:
+    # Purpose: One tick per frame when fixed is False, the accumulator's count otherwise
+    # Pre: fps > 0, seconds > 0
+    # Post: Returns (frames per second, ticks per second)
+
+    timestep = FixedTimestep(TICK_RATE)
+    frames = 0
+    ticks = 0
+    start = time.perf_counter()
+    nextFrame = start
+    while time.perf_counter() - start < seconds:
+        ticks += timestep.advance() if fixed else 1
+        frames += 1
+        nextFrame += 1 / fps
+        time.sleep(max(0.0, nextFrame - time.perf_counter()) + random.uniform(0, jitter))
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, ticks / elapsed
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Simulation speed at different frame rates")
+    parser.add_argument('--fps', type = float, nargs = '+', default = [20, 30, 60, 144])
+    parser.add_argument('--seconds', type = float, default = 3.0)
+    parser.add_argument('--jitter-ms', type = float, default = 2.0, help = "Up to this much extra per frame")
+    args = parser.parse_args()
+
+    print(f"{'fps':>6}{'drawn':>9}{'per-frame ticks/s':>20}{'fixed ticks/s':>16}   target {TICK_RATE}")
+    for fps in args.fps:
+        drawn, perFrame = run(fps, args.seconds, args.jitter_ms / 1000, fixed = False)
+        _, fixed = run(fps, args.seconds, args.jitter_ms / 1000, fixed = True)
+        print(f"{fps:>6.0f}{drawn:>9.1f}{perFrame:>20.1f}{fixed:>16.1f}")
@@ -0,0 +1,50 @@
+# =================================================================================================
+# Purpose:                  Summarize a pongClient frame trace (PONG_PROFILE=csv=...): percentiles per
+#                           phase and the slowest frames with the phase that took longest in each
+# =================================================================================================
+
+# Usage (from the repository root):
+#   PONG_PROFILE=overlay,csv=frames.csv python pongClient.py
+#   python benchmarks/frameTrace.py frames.csv --hitch-ms 33 --top 10
+
+import argparse
+import csv
+
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(ordered: list, pct: float) -> float:
+    # Purpose: Same rule as the overlay, so the numbers match
+    # Pre: ordered is sorted and not empty
+    # Post: Returns the pct-th percentile
+
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Summarize a pongClient frame trace")
+    parser.add_argument('trace', help = "CSV written with PONG_PROFILE=csv=PATH")
+    parser.add_argument('--hitch-ms', type = float, default = 1000 / 30, help = "Frames longer than this are hitches")
+    parser.add_argument('--top', type = int, default = 10, help = "Slowest frames to list")
+    args = parser.parse_args()
+
+    with open(args.trace, newline = '') as traceFile:
+        rows = list(csv.DictReader(traceFile))
+    if not rows:
+        raise SystemExit("empty trace")
+    phases = [column for column in rows[0] if column.endswith('_ms')]
+
+    print(f"{len(rows)} frames")
+    print(f"{'phase':<10}{'mean':>8}{'p50':>8}{'p99':>8}{'max':>8}   ms")
+    for column in phases:
+        values = sorted(float(row[column]) for row in rows)
+        print(f"{column[:-3]:<10}{sum(values) / len(values):>8.3f}{percentile(values, 50):>8.3f}"
+              f"{percentile(values, 99):>8.3f}{values[-1]:>8.3f}")
+
+    # Where the time of every slow frame went
+    hitches = [row for row in rows if float(row['total_ms']) > args.hitch_ms]
+    print(f"\n{len(hitches)} frames over {args.hitch_ms:.1f} ms")
+    for row in sorted(hitches, key = lambda r: float(r['total_ms']), reverse = True)[:args.top]:
+        worst = max((column for column in phases if column != 'total_ms'), key = lambda c: float(row[c]))
+        print(f"  frame {row['frame']:>6}  {float(row['total_ms']):>8.2f} ms   {worst[:-3]} {float(row[worst]):.2f} ms")
@@ -0,0 +1,130 @@
+# =================================================================================================
+# Purpose:                  Checks that a client from before the ';' terminator keeps its connection
+#                           when TCP delivers two of its updates in one read
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/legacyUpdates.py --mode threaded async
+#
+# Two clients that speak like the original pongClient (no room choice, no bin1, updates without a
+# terminator) join a server. The left one sends an update, then two updates in one send, which the
+# server reads as one run-together packet, then one more update. The right one must see the left
+# paddle at the last update's position, and the server must not have dropped the left client. Any
+# failure is printed and the exit status is 1.
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.frameDecoder import FrameDecoder
+from benchmarks.serverCapacity import launch_server
+
+
+
+# Read like the original client until a message that done accepts
+def read_until(client: socket.socket, decoder: FrameDecoder, done) -> str:
+    # Purpose: Ignore every offer and every message before the one wanted
+    # Pre: client is connected, decoder holds what was read from it so far
+    # Post: Returns the first message done(message) is True for, the decoder keeps what followed it
+
+    while True:
+        for frame in decoder.frames():
+            msg = str(frame, 'ascii').strip()
+            if done(msg):
+                return msg
+        data = client.recv(1024)
+        if not data:
+            raise ConnectionError("server closed the connection during the handshake")
+        decoder.feed(data)
+
+
+
+# The run-together updates against one server
+def check(port: int) -> list:
+    # Purpose: Play the updates described in the header comment
+    # Pre: A peer mode server listens on port
+    # Post: Returns the failures as printable lines, empty if none
+
+    # Sides first, START only comes once both players are in
+    sides = []
+    for _ in range(2):
+        client = socket.create_connection(('127.0.0.1', port), timeout = 5)
+        decoder = FrameDecoder()
+        handshake = read_until(client, decoder, lambda msg: msg.count(',') == 2)
+        sides.append((client, decoder, handshake.split(',')[2]))
+    if [side for _, _, side in sides] != ['left', 'right']:
+        return [f"expected left and right, got {[side for _, _, side in sides]}"]
+    for client, decoder, _ in sides:
+        read_until(client, decoder, lambda msg: msg == 'START')
+    (left, _, _), (right, decoder, _) = sides
+
+    left.sendall(b'215,320,240,0,0,1')
+    time.sleep(0.1)
+    left.sendall(b'220,325,240,0,0,2' + b'225,330,240,0,0,3')
+    time.sleep(0.1)
+    left.sendall(b'230,335,240,0,0,4')
+
+    # Players get the other paddle first: 'leftY,ballX,ballY,lScore,rScore,sync'
+    failures = []
+    seen = None
+    deadline = time.monotonic() + 3
+    while seen != 230 and time.monotonic() < deadline:
+        try:
+            data = right.recv(4096)
+        except socket.timeout:
+            break
+        if not data:
+            break
+        decoder.feed(data)
+        for frame in decoder.frames():
+            fields = str(frame, 'ascii').strip().split(',')
+            if len(fields) == 6:
+                seen = int(fields[0])
+    if seen != 230:
+        failures.append(f"the right client last saw the left paddle at {seen}, not 230")
+
+    # The server closes a client it gave up on, a live one keeps getting states
+    left.settimeout(1)
+    try:
+        if not left.recv(4096):
+            failures.append("the server closed the left client's connection")
+    except OSError as e:
+        failures.append(f"the left client's connection failed: {e}")
+    left.close()
+    right.close()
+    return failures
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run-together updates from clients without the ';' terminator")
+    parser.add_argument('--mode', choices = ['threaded', 'async'], nargs = '+', default = ['threaded', 'async'])
+    parser.add_argument('--port', type = int, default = 5791)
+    args = parser.parse_args()
+
+    failed = False
+    for index, mode in enumerate(args.mode):
+        with tempfile.TemporaryFile('w+') as output:
+            server = launch_server(mode, args.port + index, [], output)
+            try:
+                failures = check(args.port + index)
+            finally:
+                server.kill()
+                server.wait()
+
+            # launch_server's probe connects and leaves before choosing a room, only the players count
+            output.seek(0)
+            failures += [line.strip() for line in output
+                         if line.startswith(('Error handling client left', 'Error handling client right'))]
+        print(f"{mode} server: {'updates applied, connection kept' if not failures else 'FAILED'}")
+        for line in failures:
+            print(f"  {line}")
+        failed = failed or bool(failures)
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,389 @@
+# =================================================================================================
+# Purpose:                  Headless bot clients that speak the pongClient protocol (room choice,
+#                           handshake, bin1 negotiation, updates), to load a pongServer with thousands
+#                           of players and spectators and report throughput and end-to-end latency
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/loadGenerator.py --launch async --rooms 50 --spectators 10 --seconds 10
+#   python benchmarks/loadGenerator.py --host 10.0.0.5 --port 5555 --rooms 500 --processes 4 --json
+#   python benchmarks/loadGenerator.py --launch async --server-args=--authoritative --rooms 20 --max-p99-ms 50
+#       (exits with status 1 when the p99 latency is above 50 ms)
+#   python benchmarks/loadGenerator.py --launch async --server-args=--authoritative --rooms 1 --spectators 1000 --deltas
+#       (bin1 bots take the delta snapshot offer, compare the received KiB/s with and without it)
+#
+# Every room gets two players and --spectators spectators. Both players send an update at --rate Hz,
+# the left player's paddle position doubles as a marker: the right player and the spectators note
+# when the server's snapshot first shows each new left paddle position, and the time since the left
+# player sent it is the update latency. All bots of a room run in the same process, so the send and
+# receive times come from the same clock.
+#
+#   connect    TCP connect until the handshake (and the bin1 ack, with --protocol bin1) is in
+#   updates/s  snapshots received by all bots, per second
+#   latency    left player's update -> snapshot showing it at the other bots of the room
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.deltaSnapshot import DeltaDecoder
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.latencyHistogram import LatencyHistogram
+from assets.code.wireProtocol import (
+    BINARY_PROTOCOL, DELTA_FEATURE, MSG_DELTA, MSG_PING, MSG_PONG, MSG_STATE, PING, PING_FEATURE, PROTOCOL_ACCEPT,
+    STATE, TEXT_PROTOCOL, encode_input, encode_ping, encode_update,
+)
+from benchmarks.serverCapacity import launch_server
+
+# Left paddle positions used as markers, cycled so every update is distinguishable for a few seconds
+MARKER_BASE = 10
+MARKER_SPAN = 400
+RIGHT_PADDLE_Y = 215
+
+
+# One simulated client
+class Bot:
+    def __init__(self, room: str, deltas: bool = False) -> None:
+        self.room = room
+
+        # Rebuilds snapshots when the bot accepts delta snapshots, None leaves the offer unanswered
+        self.deltas = DeltaDecoder() if deltas else None
+        self.side = None
+        self.writer = None
+        self.authoritative = False
+        self.protocol = TEXT_PROTOCOL
+
+        # Set once START is in and, like pongClient, any 'USE bin1;' we sent has been acknowledged
+        self.started = False
+        self.negotiating = False
+        self.ready = asyncio.Event()
+        self.lastLeftY = None
+
+
+# Counters for one load generator process
+class LoadStats:
+    def __init__(self, clients: int) -> None:
+        self.clients = clients
+        self.connected = 0
+        self.failed = 0
+        self.started = 0
+        self.dropped = 0
+        self.updates_sent = 0
+        self.snapshots = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.setup = LatencyHistogram()
+        self.latency = LatencyHistogram()
+
+    def to_dict(self, seconds: float) -> dict:
+        return {
+            'clients': self.clients, 'connected': self.connected, 'failed': self.failed, 'started': self.started,
+            'dropped': self.dropped, 'seconds': seconds, 'updates_sent': self.updates_sent,
+            'snapshots': self.snapshots, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+            'setup': self.setup.to_dict(), 'latency': self.latency.to_dict(),
+        }
+
+
+
+# Connect one bot and play until cancelled
+async def run_bot(bot: Bot, host: str, port: int, protocol: str, stats: LoadStats, window: dict,
+                  markers: dict, connecting: asyncio.Semaphore) -> None:
+    # Purpose: Choose the room, read the handshake, negotiate the protocol like pongClient's lobby
+    #          does, then count every snapshot and time the left paddle markers
+    # Pre: markers[bot.room] is the dict the left player of the room writes its send times into
+    # Post: bot.ready is set once START arrives, stats are updated until the task is cancelled or
+    #       the server closes the connection
+
+    async with connecting:
+        connectStart = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+        except (OSError, asyncio.TimeoutError):
+            stats.failed += 1
+            return
+    writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    bot.writer = writer
+    decoder = FrameDecoder()
+    roomMarkers = markers[bot.room]
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            now = time.perf_counter()
+            measuring = window['start'] <= now < window['end']
+            if measuring:
+                stats.bytes_in += len(data)
+            decoder.feed(data)
+            for frame in decoder.frames():
+
+                if decoder.protocol == BINARY_PROTOCOL:
+                    if frame[0] == MSG_PING:
+                        writer.write(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
+                        continue
+                    if frame[0] != MSG_STATE and frame[0] != MSG_DELTA:
+                        bot.ready.set()
+                        continue
+                    if bot.deltas is None:
+                        leftY = STATE.unpack_from(frame)[1]
+                    else:
+                        state = bot.deltas.apply(frame)
+                        if state is None:
+                            continue
+                        leftY = state[0]
+                else:
+                    msg = str(frame, 'ascii').strip()
+                    if bot.side is None or ',' not in msg:
+                        handle_handshake_line(bot, msg, protocol, decoder, stats, connectStart)
+                        continue
+
+                    # Players get the opponent's paddle first, spectators the left paddle first
+                    fields = msg.split(',')
+                    leftY = int(fields[0]) if bot.side != 'left' else None
+
+                if not measuring:
+                    continue
+                stats.snapshots += 1
+
+                # The first snapshot showing a new left paddle position ends that update's trip
+                if leftY is not None and leftY != bot.lastLeftY:
+                    bot.lastLeftY = leftY
+                    sentAt = roomMarkers.get(leftY)
+                    if sentAt is not None:
+                        stats.latency.record(now - sentAt)
+    except (OSError, ValueError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        if window['start'] <= time.perf_counter() < window['end']:
+            stats.dropped += 1
+        bot.writer = None
+        writer.close()
+
+
+
+# Handle one text line that is not a snapshot
+def handle_handshake_line(bot: Bot, msg: str, protocol: str, decoder: FrameDecoder, stats: LoadStats,
+                          connectStart: float) -> None:
+    # Purpose: Answer the ROOMS offer, read the side, accept bin1 if asked to, and note when the
+    #          connection is fully set up
+    # Pre: msg is one ';' terminated line from the server, without the ';'
+    # Post: bot and stats are updated, the decoder is switched to binary at the bin1 ack
+
+    if msg.startswith('ROOMS'):
+        bot.writer.write(f'ROOM {bot.room};'.encode())
+
+    elif ',' in msg and bot.side is None:
+        bot.side = msg.split(',')[2]
+        stats.connected += 1
+
+    elif msg == 'MODE authoritative':
+        bot.authoritative = True
+
+    # A server collecting metrics pings bin1 clients that answer this, like pongClient does
+    elif msg == PING_FEATURE.decode().rstrip(';') and protocol == BINARY_PROTOCOL:
+        bot.writer.write(PING_FEATURE)
+
+    elif msg == DELTA_FEATURE.decode().rstrip(';') and protocol == BINARY_PROTOCOL and bot.deltas is not None:
+        bot.writer.write(DELTA_FEATURE)
+
+    # Without bin1 the connection counts as set up at the offer, with it at the ack
+    elif msg.startswith('PROTOCOLS'):
+        if protocol == BINARY_PROTOCOL and BINARY_PROTOCOL in msg.split()[1:]:
+            bot.writer.write(PROTOCOL_ACCEPT)
+            bot.negotiating = True
+        else:
+            stats.setup.record(time.perf_counter() - connectStart)
+
+    elif msg == f'USE {BINARY_PROTOCOL}':
+        bot.protocol = BINARY_PROTOCOL
+        decoder.switch_protocol(BINARY_PROTOCOL)
+        stats.setup.record(time.perf_counter() - connectStart)
+        bot.negotiating = False
+
+    elif msg == 'START':
+        bot.started = True
+
+    if bot.started and not bot.negotiating:
+        bot.ready.set()
+
+
+
+# Send every player's update, --rate times a second
+async def send_updates(bots: list, rate: float, stats: LoadStats, window: dict, markers: dict) -> None:
+    # Purpose: One timer for all players of this process instead of one per bot
+    # Pre: bots have been started, window['end'] is set
+    # Post: Left players write marker paddle positions and record when they sent them
+
+    syncNum = 0
+    nextSend = time.perf_counter()
+    while time.perf_counter() < window['end']:
+        syncNum += 1
+        marker = MARKER_BASE + syncNum % MARKER_SPAN
+        for bot in bots:
+            if bot.writer is None or bot.side not in ('left', 'right') or not bot.ready.is_set():
+                continue
+            paddleY = marker if bot.side == 'left' else RIGHT_PADDLE_Y
+            if bot.protocol == BINARY_PROTOCOL:
+                message = encode_input(paddleY, syncNum) if bot.authoritative else \
+                    encode_update(paddleY, 320, 240, 0, 0, syncNum)
+            else:
+                message = f'{paddleY},320,240,0,0,{syncNum};'.encode()
+            if bot.side == 'left':
+                markers[bot.room][marker] = time.perf_counter()
+            bot.writer.write(message)
+            if window['start'] <= time.perf_counter():
+                stats.updates_sent += 1
+                stats.bytes_out += len(message)
+        nextSend += 1 / rate
+        await asyncio.sleep(max(0, nextSend - time.perf_counter()))
+
+
+
+# Everything one load generator process does
+async def generate_load(host: str, port: int, roomNames: list, spectators: int, protocol: str, rate: float,
+                        seconds: float, warmup: float, concurrency: int, deltas: bool = False) -> dict:
+    # Purpose: Connect two players and the spectators of every room, wait for START, then measure
+    # Pre: Server is listening on host:port
+    # Post: Returns LoadStats.to_dict() for the measured window, every connection is closed
+
+    stats = LoadStats(len(roomNames) * (2 + spectators))
+    window = {'start': float('inf'), 'end': float('inf')}
+    markers = {name: {} for name in roomNames}
+    connecting = asyncio.Semaphore(concurrency)
+    bots = [Bot(name, deltas) for name in roomNames for _ in range(2 + spectators)]
+    tasks = [asyncio.ensure_future(run_bot(bot, host, port, protocol, stats, window, markers, connecting))
+             for bot in bots]
+
+    # Wait until every bot that connected has seen START, or give up after the warmup
+    try:
+        await asyncio.wait_for(asyncio.gather(*(bot.ready.wait() for bot in bots)), warmup)
+    except asyncio.TimeoutError:
+        pass
+    stats.started = sum(bot.ready.is_set() for bot in bots)
+
+    window['start'] = time.perf_counter() + 0.5
+    window['end'] = window['start'] + seconds
+    await send_updates(bots, rate, stats, window, markers)
+
+    # Let the last updates arrive before stopping
+    await asyncio.sleep(0.2)
+    window['end'] = 0
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+    return stats.to_dict(seconds)
+
+
+
+# Entry point of one load generator process
+def load_process(host: str, port: int, roomNames: list, options: dict, results: multiprocessing.Queue) -> None:
+    # Purpose: Raise the open file limit as far as allowed, then run generate_load on its own event loop
+    # Pre: options holds the generate_load keyword arguments
+    # Post: Puts the process's stats dict on results
+
+    try:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    results.put(asyncio.run(generate_load(host, port, roomNames, **options)))
+
+
+
+# Add up what every process measured
+def combine(results: list) -> dict:
+    # Purpose: Sum the counters, merge the histograms, and turn them into rates and percentiles
+    # Pre: results are LoadStats.to_dict() dicts
+    # Post: Returns the report, rates are per second of the measured window
+
+    setup = LatencyHistogram()
+    latency = LatencyHistogram()
+    totals = {key: sum(r[key] for r in results) for key in
+              ('clients', 'connected', 'failed', 'started', 'dropped', 'updates_sent', 'snapshots', 'bytes_in', 'bytes_out')}
+    for r in results:
+        setup.merge(LatencyHistogram.from_dict(r['setup']))
+        latency.merge(LatencyHistogram.from_dict(r['latency']))
+    seconds = max(r['seconds'] for r in results)
+    return {
+        **totals,
+        'pending': totals['clients'] - totals['connected'] - totals['failed'],
+        'updates_sent_s': totals['updates_sent'] / seconds,
+        'snapshots_s': totals['snapshots'] / seconds,
+        'bytes_in_s': totals['bytes_in'] / seconds,
+        'bytes_out_s': totals['bytes_out'] / seconds,
+        'connect_p50_ms': setup.percentile(50) * 1000,
+        'connect_p99_ms': setup.percentile(99) * 1000,
+        'latency_samples': latency.count,
+        'latency_p50_ms': latency.percentile(50) * 1000,
+        'latency_p99_ms': latency.percentile(99) * 1000,
+        'latency_max_ms': latency.max * 1000,
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Headless pongServer load generator")
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 5555)
+    parser.add_argument('--launch', choices = ['threaded', 'async'],
+                        help = "Start a local pongServer in this mode on --port instead of using a running one")
+    parser.add_argument('--server-args', default = '', help = "Extra pongServer.py arguments with --launch")
+    parser.add_argument('--rooms', type = int, default = 10)
+    parser.add_argument('--spectators', type = int, default = 0, help = "Spectators per room")
+    parser.add_argument('--room-prefix', default = 'load')
+    parser.add_argument('--protocol', choices = [TEXT_PROTOCOL, BINARY_PROTOCOL], default = BINARY_PROTOCOL)
+    parser.add_argument('--deltas', action = 'store_true', help = "Accept delta snapshots (bin1 only)")
+    parser.add_argument('--rate', type = float, default = 60, help = "Updates per second per player")
+    parser.add_argument('--seconds', type = float, default = 10)
+    parser.add_argument('--warmup', type = float, default = 10, help = "Longest wait for every room to start")
+    parser.add_argument('--processes', type = int, default = 1, help = "Load generator processes")
+    parser.add_argument('--concurrency', type = int, default = 64, help = "Connects in flight per process")
+    parser.add_argument('--json', action = 'store_true', help = "Print the report as one JSON object")
+    parser.add_argument('--max-p99-ms', type = float, help = "Exit with status 1 if the p99 latency is above this")
+    args = parser.parse_args()
+
+    proc = launch_server(args.launch, args.port, args.server_args.split()) if args.launch else None
+    try:
+        names = [f'{args.room_prefix}-{i}' for i in range(args.rooms)]
+        options = {'spectators': args.spectators, 'protocol': args.protocol, 'rate': args.rate,
+                   'seconds': args.seconds, 'warmup': args.warmup, 'concurrency': args.concurrency,
+                   'deltas': args.deltas}
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target = load_process,
+                                    args = (args.host, args.port, names[i::args.processes], options, results))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        report = combine([results.get() for _ in processes])
+        for process in processes:
+            process.join()
+    finally:
+        if proc is not None:
+            proc.kill()
+            proc.wait()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        deltas = ", delta snapshots" if args.deltas else ""
+        print(f"{report['clients']} clients in {args.rooms} rooms, {args.protocol}{deltas}, {args.rate:g} updates/s per player")
+        print(f"  connected {report['connected']}, failed {report['failed']}, no handshake yet {report['pending']}, "
+              f"started {report['started']}, dropped during run {report['dropped']}")
+        print(f"  connect      p50 {report['connect_p50_ms']:.2f} ms   p99 {report['connect_p99_ms']:.2f} ms")
+        print(f"  sent         {report['updates_sent_s']:,.0f} updates/s   {report['bytes_out_s'] / 1024:,.1f} KiB/s")
+        print(f"  received     {report['snapshots_s']:,.0f} updates/s   {report['bytes_in_s'] / 1024:,.1f} KiB/s")
+        print(f"  latency      p50 {report['latency_p50_ms']:.2f} ms   p99 {report['latency_p99_ms']:.2f} ms   "
+              f"max {report['latency_max_ms']:.2f} ms   ({report['latency_samples']:,} samples)")
+
+    if args.max_p99_ms is not None and not report['latency_p99_ms'] <= args.max_p99_ms:
+        sys.exit(1)
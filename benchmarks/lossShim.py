@@ -0,0 +1,225 @@
+# =================================================================================================
+# Purpose:                  Local relay between clients and pongServer that adds latency, jitter and
+#                           packet loss to TCP and UDP traffic, for trying the game on a bad network
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python pongServer.py --port 5555 --authoritative --udp
+#   python benchmarks/lossShim.py --listen 6000 --server 127.0.0.1:5555 --loss 0.05 --latency-ms 40
+# then point pongClient at port 6000.
+#
+# A relay cannot drop part of a TCP stream, so TCP loss is modelled by what it costs: the lost read
+# arrives a retransmission timeout later and everything behind it waits (head-of-line blocking).
+# UDP datagrams are dropped, and jitter can reorder them. The 'UDP port token;' offer is rewritten
+# to point at the relay, which forwards each client's datagrams to the port the server offered.
+
+import argparse
+import asyncio
+import random
+import re
+import time
+
+UDP_OFFER_LINE = re.compile(rb'UDP (\d+) (\d+);')
+
+
+
+class LinkModel:
+    # loss     Chance a read (TCP) or datagram (UDP) is lost, per direction
+    # latency  One way delay in seconds, plus up to jitter more
+    # rto        Extra delay of a lost TCP read, Linux never retransmits sooner than 200 ms
+    # bandwidth  TCP bytes per second per direction of each connection, 0 for no limit. What does not
+    #            fit waits in the relay, like in the buffer of a slow access point
+    def __init__(self, loss: float = 0.0, latency: float = 0.0, jitter: float = 0.0, rto: float = 0.2,
+                 seed: int = None, bandwidth: float = 0) -> None:
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.rto = rto
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.forwarded = 0
+        self.lost = 0
+
+    def delay(self) -> float:
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def tcp_release(self, now: float, previous: float, size: int = 0) -> float:
+        # When a read of size bytes received now is delivered, never before the one received before
+        # it has gone through, and with a bandwidth limit not before this one has too
+        release = now + self.delay()
+        if self.random.random() < self.loss:
+            self.lost += 1
+            release += self.rto
+        self.forwarded += 1
+        if self.bandwidth:
+            return max(release, previous + size / self.bandwidth)
+        return max(release, previous)
+
+    def udp_delay(self) -> float:
+        # Seconds until the datagram is delivered, None if it is lost
+        if self.random.random() < self.loss:
+            self.lost += 1
+            return None
+        self.forwarded += 1
+        return self.delay()
+
+
+class DatagramRelay(asyncio.DatagramProtocol):
+    # A socket of the relay, passes what it receives to on_datagram(data, addr)
+    def __init__(self, on_datagram) -> None:
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+
+class LossShim:
+    # Relays TCP connections from listen_port to server_port, and datagrams from listen_port (UDP)
+    # to the UDP port the server offered each client
+    def __init__(self, server_host: str, server_port: int, model: LinkModel, listen_host: str = '127.0.0.1',
+                 listen_port: int = 0) -> None:
+        self.server_host = server_host
+        self.server_port = server_port
+        self.model = model
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.udp_ports = {}          # token -> server UDP port
+        self.upstreams = {}          # client address -> datagram transport towards the server
+        self.udp_transport = None
+        self.tcp_server = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.tcp_server = await asyncio.start_server(self.relay_connection, self.listen_host, self.listen_port)
+        self.listen_port = self.tcp_server.sockets[0].getsockname()[1]
+        self.udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramRelay(self.from_client), local_addr = (self.listen_host, self.listen_port)
+        )
+
+    async def relay_connection(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.server_host, self.server_port)
+        except OSError:
+            client_writer.close()
+            return
+        try:
+            await asyncio.gather(self.pump(client_reader, server_writer, False),
+                                 self.pump(server_reader, client_writer, True), return_exceptions = True)
+        except asyncio.CancelledError:
+            # The event loop is shutting down with the connection still open
+            client_writer.close()
+            server_writer.close()
+
+    async def pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, from_server: bool) -> None:
+        # Reads go into a queue with their release times, a second task writes them out in order
+        queue = asyncio.Queue()
+        previous = 0.0
+
+        async def deliver() -> None:
+            while True:
+                release, data = await queue.get()
+                if data is None:
+                    break
+                await asyncio.sleep(max(0.0, release - time.perf_counter()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        delivering = asyncio.get_running_loop().create_task(deliver())
+        handshake = 4096 if from_server else 0
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                # The offer is in the server's first few lines, before anything binary
+                if handshake > 0:
+                    handshake -= len(data)
+                    data = UDP_OFFER_LINE.sub(self.rewrite_offer, data)
+                previous = self.model.tcp_release(time.perf_counter(), previous, len(data))
+                queue.put_nowait((previous, data))
+        finally:
+            queue.put_nowait((0.0, None))
+            await delivering
+
+    def rewrite_offer(self, match: re.Match) -> bytes:
+        self.udp_ports[int(match.group(2))] = int(match.group(1))
+        return b'UDP %d %s;' % (self.listen_port, match.group(2))
+
+    def from_client(self, data: bytes, addr: tuple) -> None:
+        upstream = self.upstreams.get(addr)
+        if upstream is None:
+            if len(data) < 4:
+                return
+            server_port = self.udp_ports.get(int.from_bytes(data[:4], 'big'))
+            if server_port is None:
+                return
+
+            # One socket per client towards the server, so the server sees one address per client
+            self.upstreams[addr] = upstream = []
+            asyncio.get_running_loop().create_task(self.open_upstream(addr, server_port, data))
+            return
+        self.forward(upstream, data)
+
+    async def open_upstream(self, addr: tuple, server_port: int, first: bytes) -> None:
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DatagramRelay(lambda data, _: self.forward(self.udp_transport, data, addr)),
+            remote_addr = (self.server_host, server_port)
+        )
+        pending = self.upstreams[addr]
+        self.upstreams[addr] = transport
+        for data in [first] + pending:
+            self.forward(transport, data)
+
+    def forward(self, transport, data: bytes, addr: tuple = None) -> None:
+        # Towards the server transport is connected, towards a client addr says where
+        if isinstance(transport, list):
+            transport.append(data)
+            return
+        delay = self.model.udp_delay()
+        if delay is not None:
+            asyncio.get_running_loop().call_later(delay, self.deliver, transport, data, addr)
+
+    def deliver(self, transport, data: bytes, addr: tuple) -> None:
+        # The relay or the client may have gone away while the datagram was delayed
+        if not transport.is_closing():
+            transport.sendto(data, addr)
+
+    def close(self) -> None:
+        self.tcp_server.close()
+        self.udp_transport.close()
+        for upstream in self.upstreams.values():
+            if not isinstance(upstream, list):
+                upstream.close()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Add latency, jitter and loss between pong clients and the server")
+    parser.add_argument('--listen', type = int, default = 6000, help = "Port clients connect to (TCP and UDP)")
+    parser.add_argument('--server', default = '127.0.0.1:5555', help = "host:port of pongServer")
+    parser.add_argument('--loss', type = float, default = 0.02, help = "Chance each read or datagram is lost")
+    parser.add_argument('--latency-ms', type = float, default = 30)
+    parser.add_argument('--jitter-ms', type = float, default = 10)
+    parser.add_argument('--rto-ms', type = float, default = 200, help = "Delay of a lost TCP read")
+    parser.add_argument('--bandwidth', type = float, default = 0, help = "TCP bytes per second each way, 0 for no limit")
+    args = parser.parse_args()
+
+    host, _, port = args.server.rpartition(':')
+    model = LinkModel(args.loss, args.latency_ms / 1000, args.jitter_ms / 1000, args.rto_ms / 1000,
+                      bandwidth = args.bandwidth)
+
+    async def main() -> None:
+        shim = LossShim(host, int(port), model, '0.0.0.0', args.listen)
+        await shim.start()
+        print(f"Relaying port {shim.listen_port} to {args.server}: loss {args.loss:.1%}, "
+              f"latency {args.latency_ms:.0f} ms + up to {args.jitter_ms:.0f} ms")
+        while True:
+            await asyncio.sleep(5)
+            print(f"forwarded {model.forwarded}, lost {model.lost}", flush = True)
+
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+# =================================================================================================
+# Purpose:                  Size and speed of match recordings (pongServer --record / --replay): what
+#                           recording costs a broadcast, how fast a recording opens and seeks, and
+#                           how many times faster than real time it can be decoded
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/matchReplay.py --minutes 60 --seeks 1000
+#
+# A MatchSimulation with two ball-chasing paddles is stepped --minutes at 60 Hz and every state is
+# appended to a MatchRecorder, on a simulated clock so the recording has real gaps. The scores are
+# reset instead of the match so the sync keeps counting, like one long session. Then:
+#   record     time per MatchRecorder.append, the part of broadcast_state a recording adds
+#   size       bytes per state, against 17 for a time stamp plus a full MSG_STATE
+#   open       Recording() with the index, and again on a copy cut short, which has to be scanned
+#   seek       ReplayPlayer at a random sync until its first state is decoded, p50 and p99
+#   decode     every state in the file decoded, in states per second and times real time
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.deltaSnapshot import DeltaDecoder
+from assets.code.matchRecording import MatchRecorder, Recording, ReplayPlayer
+from assets.code.matchSimulation import MatchSimulation
+from assets.code.wireProtocol import MSG_STATE, STATE
+
+TICK_RATE = 60
+
+
+
+# The states of a long match
+def simulate(states: int) -> list:
+    # Purpose: Step the match with the simulationTicks bots and keep every state
+    # Pre: states > 0
+    # Post: Returns the (leftY, rightY, ballX, ballY, lScore, rScore, sync) tuples in order
+
+    sim = MatchSimulation()
+    result = []
+    for _ in range(states):
+        ballY = sim.ball.rect.y
+        for side, paddle, aim, speed in (('left', sim.leftPaddle, 18, 5), ('right', sim.rightPaddle, 0, 3)):
+            offset = ballY + aim - paddle.rect.centery
+            sim.set_paddle(side, paddle.rect.y + max(-speed, min(speed, offset)))
+        sim.step()
+        if sim.game_over:
+            sim.lScore = sim.rScore = 0
+        result.append(sim.state())
+    return result
+
+
+
+# Write the states the way broadcast_state does
+def record(path: str, states: list) -> float:
+    # Purpose: Time MatchRecorder.append for every state, the clock advancing one tick per state
+    # Pre: path does not exist
+    # Post: Returns seconds spent in append, the recording is closed
+
+    now = [0.0]
+    recorder = MatchRecorder(path, 640, 480, True, 'bench', clock = lambda: now[0])
+    recorder.start()
+    keyframes = [STATE.pack(MSG_STATE, *state) for state in states]
+    started = time.perf_counter()
+    for state, keyframe in zip(states, keyframes):
+        now[0] += 1 / TICK_RATE
+        recorder.append(state, keyframe)
+    elapsed = time.perf_counter() - started
+    recorder.close()
+    return elapsed
+
+
+
+# Seek to random syncs
+def seek_times(recording: Recording, last_sync: int, seeks: int) -> list:
+    # Purpose: Time a ReplayPlayer from construction to its first decoded state
+    # Pre: recording holds syncs 1 to last_sync
+    # Post: Returns the sorted times in microseconds
+
+    times = []
+    for _ in range(seeks):
+        sync = random.randint(1, last_sync)
+        started = time.perf_counter()
+        events = ReplayPlayer(recording, from_sync = sync).due(0.0)
+        times.append((time.perf_counter() - started) * 1e6)
+        assert events[1][1][6] == sync
+    return sorted(times)
+
+
+
+# Decode the whole recording
+def decode_all(recording: Recording) -> tuple:
+    # Purpose: Rebuild every state from the records, as a replay at any speed would
+    # Pre: recording is open
+    # Post: Returns (states decoded, seconds)
+
+    decoder = DeltaDecoder()
+    count = 0
+    started = time.perf_counter()
+    for _, frame, _ in recording.records():
+        if decoder.apply(frame) is not None:
+            count += 1
+    return count, time.perf_counter() - started
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Match recording size, seek and decode speed")
+    parser.add_argument('--minutes', type = float, default = 60)
+    parser.add_argument('--seeks', type = int, default = 1000)
+    args = parser.parse_args()
+
+    states = simulate(int(args.minutes * 60 * TICK_RATE))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.pongrec')
+        elapsed = record(path, states)
+        size = os.path.getsize(path)
+        print(f"{len(states):,} states ({args.minutes:g} min at {TICK_RATE} Hz), {size / 1024:,.0f} KiB")
+        print(f"record   {elapsed / len(states) * 1e6:.2f} us per state")
+        print(f"size     {size / len(states):.1f} bytes per state (17.0 for a time stamp and a full MSG_STATE)")
+
+        started = time.perf_counter()
+        recording = Recording(path)
+        opened = time.perf_counter() - started
+
+        # Without the index and footer, the way a killed server leaves its recording
+        cut = os.path.join(directory, 'cut.pongrec')
+        with open(path, 'rb') as source, open(cut, 'wb') as target:
+            target.write(source.read(recording.end))
+        started = time.perf_counter()
+        scanned = Recording(cut)
+        rescanned = time.perf_counter() - started
+        print(f"open     {opened * 1000:.2f} ms with the index ({len(recording.syncs):,} entries), "
+              f"{rescanned * 1000:.0f} ms scanning a recording without one")
+
+        times = seek_times(recording, states[-1][6], args.seeks)
+        print(f"seek     p50 {times[len(times) // 2]:.0f} us   p99 {times[int(len(times) * 0.99)]:.0f} us   "
+              f"({args.seeks} random syncs)")
+
+        count, elapsed = decode_all(recording)
+        print(f"decode   {count / elapsed:,.0f} states/s = {count / elapsed / TICK_RATE:,.0f}x real time")
+        del recording, scanned
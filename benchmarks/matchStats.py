@@ -0,0 +1,256 @@
+# =================================================================================================
+# Purpose:                  Checks that MatchTally counts the hits and rallies MatchSimulation plays,
+#                           then measures what pongServer --match-stats costs the game and how many
+#                           match results StatsWriter sustains with many matches ending at once
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/matchStats.py --check-matches 200 --producers 1 16 256 --seconds 5
+#
+# Check: --check-matches matches played to the end by MatchSimulation with two ball-tracking paddles
+# that aim off centre by a new random amount for every return, so rallies vary in length and points
+# are lost. Every hit is counted where MatchSimulation makes it (Ball.hitPaddle), except a last touch
+# that did not keep the ball in. One MatchTally sees every state, as with --authoritative, and
+# another one every third state, like a 20 Hz --tick-rate. Both must agree with the simulation on
+# every rally of every match played to the end (matches cut short at MAX_STEPS are only counted). Any
+# mismatch is printed and the exit status is 1.
+#
+# observe: time per MatchTally.observe(), which runs under the room lock on every broadcast.
+#
+# Throughput: --producers threads stand for that many rooms, each ending a match with a result taken
+# from the check (about 10 rallies) as fast as it can, for --seconds, into one fresh database:
+#   write-behind   StatsWriter.submit(), as pongServer does
+#   direct         each thread writes its own result in its own transaction, what recording in the
+#                  game's thread would cost it
+# Per run: results written per second, results dropped because the queue was full, the average batch
+# and how long the producing thread was held up per result, p50, p99 and max. Producers never pause,
+# so the queue fills and drops are expected, what matters is that submit() stays cheap while the
+# writer keeps committing full batches. With many threads on few cores the tail of held includes
+# waiting for the interpreter, which direct recording adds its lock waits and commits to.
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.matchSimulation import MatchSimulation
+from assets.code.matchStats import MatchTally, StatsStore, StatsWriter
+
+# A match still going after this many steps (ten minutes at 60 Hz) is cut short. That happens when the
+# ball gets caught inside a paddle that keeps following it, it then turns around every step forever
+MAX_STEPS = 36000
+
+# How far off centre a bot aims (at most, a new amount for every return) and moves its paddle per step
+AIM = 26
+PADDLE_STEP = 8
+
+
+
+# Play one match to the end
+def play_match(rng: random.Random, every: tuple) -> tuple:
+    # Purpose: Step a MatchSimulation until a side wins, counting hits in the simulation itself and
+    #          feeding a MatchTally every n-th state for each n in every
+    # Pre: every holds positive integers
+    # Post: Returns (rallies as [(hits, winner)], hits per side, one MatchTally per n, steps)
+
+    sim = MatchSimulation()
+    tallies = [MatchTally('check', 'authoritative', sim.screenWidth) for _ in every]
+    rallies = []
+    hits = {'left': 0, 'right': 0}
+    rally = []                  # side of every hit in this rally
+    hitPaddle = sim.ball.hitPaddle
+
+    # Whose paddle it was, from which half of the court the ball is in. A ball that is still inside
+    # the paddle on the next steps is turned around again each step, that is still one hit. Both
+    # players aim again for the next return, a bad enough aim misses it
+    def counted(paddleCenter: int) -> None:
+        side = 'left' if sim.ball.rect.x < sim.screenWidth / 2 else 'right'
+        if not rally or rally[-1] != side:
+            rally.append(side)
+            aim[:] = [rng.uniform(-AIM, AIM), rng.uniform(-AIM, AIM)]
+        hitPaddle(paddleCenter)
+    sim.ball.hitPaddle = counted
+
+    aim = [rng.uniform(-AIM, AIM), rng.uniform(-AIM, AIM)]
+    steps = 0
+    while not sim.game_over and steps < MAX_STEPS:
+        score = (sim.lScore, sim.rScore)
+        ballY = sim.ball.rect.y
+        for index, (paddle, side) in enumerate(((sim.leftPaddle, 'left'), (sim.rightPaddle, 'right'))):
+            target = ballY + aim[index] - paddle.rect.centery
+            sim.set_paddle(side, paddle.rect.y + max(-PADDLE_STEP, min(PADDLE_STEP, target)))
+        sim.step()
+        steps += 1
+
+        # A last touch by the side that lost the point did not send the ball back, it is no hit
+        if (sim.lScore, sim.rScore) != score:
+            winner = 'left' if sim.lScore > score[0] else 'right'
+            if rally and rally[-1] != winner:
+                rally.pop()
+            for side in rally:
+                hits[side] += 1
+            rallies.append((len(rally), winner))
+            rally.clear()
+
+        # The last state of the match always goes out, it is the one with the winning score
+        state = sim.state()
+        for n, tally in zip(every, tallies):
+            if steps % n == 0 or sim.game_over:
+                tally.observe(state)
+    return rallies, hits, tallies, steps
+
+
+
+# Every tally against the simulation
+def check(matches: int, every: tuple, seed: int) -> tuple:
+    # Purpose: Play matches and compare each tally's rallies and hits with the simulation's
+    # Pre: matches > 0
+    # Post: Returns (mismatches as printable lines, sample results for the throughput runs, totals)
+
+    rng = random.Random(seed)
+    mismatches = []
+    samples = []
+    totals = {'rallies': 0, 'hits': 0, 'longest': 0, 'steps': 0, 'cut': 0}
+    for match in range(matches):
+        rallies, hits, tallies, steps = play_match(rng, every)
+        if steps >= MAX_STEPS:
+            totals['cut'] += 1
+            continue
+        totals['rallies'] += len(rallies)
+        totals['hits'] += hits['left'] + hits['right']
+        totals['longest'] = max(totals['longest'], max((h for h, _ in rallies), default = 0))
+        totals['steps'] += steps
+        for n, tally in zip(every, tallies):
+            tallied = [(h, winner) for h, winner, _ in tally.rallies]
+            if tallied != rallies or tally.hits != hits:
+                mismatches.append(f"match {match}, every {n}: simulation {rallies} {hits}, tally {tallied} {tally.hits}")
+        samples.append(tallies[0].result({'left': f'player{rng.randrange(1000)}', 'right': f'player{rng.randrange(1000)}'}))
+    return mismatches, samples, totals
+
+
+
+# Time MatchTally.observe
+def observe_cost(samples: int = 200000) -> float:
+    # Purpose: A ball going back and forth across the court with a point now and then
+    # Pre: None
+    # Post: Returns nanoseconds per call
+
+    tally = MatchTally('cost', 'authoritative')
+    states = []
+    ballX, heading, score = 320, -5, 0
+    for sync in range(samples):
+        ballX += heading
+        if ballX <= 20 or ballX >= 620:
+            heading = -heading
+        if sync % 5000 == 4999:
+            score += 1
+            ballX = 320
+        states.append((215, 215, ballX, 240, score % 4, 0, sync))
+    started = time.perf_counter()
+    for state in states:
+        tally.observe(state)
+    return (time.perf_counter() - started) / samples * 1e9
+
+
+
+# One throughput run
+def throughput(path: str, producers: int, seconds: float, samples: list, direct: bool) -> dict:
+    # Purpose: producers threads end matches as fast as they can for seconds, then everything queued
+    #          is written
+    # Pre: path does not exist yet, samples are MatchTally results
+    # Post: Returns the numbers in the header comment, the database holds every result not dropped
+
+    StatsStore(path).close()
+    writer = None if direct else StatsWriter(path)
+    held = []
+    submitted = [0]
+    stop = threading.Event()
+    start = threading.Barrier(producers + 1)
+
+    def produce(index: int) -> None:
+        store = StatsStore(path) if direct else None
+        mine = []
+        count = 0
+        start.wait()
+        while not stop.is_set():
+            result = samples[(index + count) % len(samples)]
+            began = time.perf_counter()
+            if direct:
+                store.write([result])
+            else:
+                writer.submit(result)
+            mine.append(time.perf_counter() - began)
+            count += 1
+
+            # Let the other threads have the interpreter, as a room thread waits for its client
+            if count % 64 == 0:
+                time.sleep(0)
+        if store is not None:
+            store.close()
+        held.extend(mine)
+        submitted[0] += count
+
+    threads = [threading.Thread(target = produce, args = (index,)) for index in range(producers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if writer is not None:
+        writer.close(timeout = 120)
+    elapsed = time.perf_counter() - began
+
+    with sqlite3.connect(path) as db:
+        written = db.execute('SELECT count(*) FROM matches').fetchone()[0]
+    held.sort()
+    pick = lambda pct: held[min(len(held) - 1, int(len(held) * pct / 100))] * 1e6
+    return {
+        'written_per_s': written / elapsed, 'written': written, 'submitted': submitted[0],
+        'dropped': writer.dropped if writer else 0, 'batch': writer.written / max(writer.batches, 1) if writer else 1,
+        'held_p50': pick(50), 'held_p99': pick(99), 'held_max': held[-1] * 1e6,
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "MatchTally accuracy and StatsWriter throughput")
+    parser.add_argument('--check-matches', type = int, default = 200)
+    parser.add_argument('--producers', type = int, nargs = '+', default = [1, 16, 256],
+                        help = "Threads ending matches at once")
+    parser.add_argument('--seconds', type = float, default = 5.0)
+    parser.add_argument('--seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    every = (1, 3)
+    mismatches, samples, totals = check(args.check_matches, every, args.seed)
+    played = args.check_matches - totals['cut']
+    print(f"Check: {played} matches played to the end ({totals['cut']} cut short), {totals['rallies']} rallies, "
+          f"{totals['hits']} hits (longest rally {totals['longest']}), {totals['steps'] / max(played, 1):.0f} steps per match")
+    print(f"  tally of every state and of every 3rd state: {'same as the simulation' if not mismatches else f'{len(mismatches)} MISMATCHES'}")
+    for line in mismatches[:5]:
+        print(f"  {line}")
+    print(f"  observe: {observe_cost():.0f} ns per broadcast state")
+
+    print(f"\n{args.seconds:g} s per run, one fresh database each, {sqlite3.sqlite_version=}")
+    print(f"  {'producers':>9}  {'recording':<13}{'results/s':>10}{'dropped':>11}{'batch':>7}"
+          f"{'held p50 us':>13}{'p99 us':>11}{'max us':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for producers in args.producers:
+            for direct in (False, True):
+                path = os.path.join(directory, f"{producers}-{'direct' if direct else 'behind'}.db")
+                r = throughput(path, producers, args.seconds, samples, direct)
+                print(f"  {producers:>9}  {'direct' if direct else 'write-behind':<13}{r['written_per_s']:>10,.0f}"
+                      f"{r['dropped']:>11,}{r['batch']:>7.0f}{r['held_p50']:>13.1f}{r['held_p99']:>11,.1f}"
+                      f"{r['held_max']:>12,.0f}", flush = True)
+
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,244 @@
+# =================================================================================================
+# Purpose:                  How long a player whose connection dies takes to be back in its match with a
+#                           session token, and who ends up with its side with and without one
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/reconnect.py --cycles 20 --mode threaded async
+#
+# An authoritative server runs one room with an opponent bot and the measured player. --cycles times,
+# the player's connection is killed and restored:
+#   reset      the socket is closed with a RST, the server notices straight away. Before the player
+#              comes back, a stranger joins the room and must get a spectator seat
+#   silent     the old socket stays open, as when a phone changes networks, the server only learns
+#              of the drop from the resume and closes the old connection
+# then the player connects again, answers the ROOMS offer with 'RESUME room token;' and takes bin1.
+# Per kind, from opening the new connection:
+#   handshake  the side line arrived (the side must be the player's own)
+#   start      START arrived
+#   state      the first full MSG_STATE arrived, which must not be older than the last one before
+#              the drop
+# Last, the same drop against a server with --resume-grace 0 and a plain 'ROOM name;' rejoin, which is
+# what a client without a token can do: the stranger arriving first takes the side.
+
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.matchRoom import RESUME_REQUEST, SESSION_LINE
+from assets.code.wireProtocol import (
+    BINARY_PROTOCOL, MSG_PING, MSG_PONG, MSG_START, MSG_STATE, PING, PROTOCOL_ACCEPT, STATE, encode_ping
+)
+from benchmarks.serverCapacity import launch_server
+from benchmarks.udpLoss import Client, run_client
+
+ROOM = 'resume'
+KINDS = ('reset', 'silent')
+
+
+
+# One connection of the measured player, or of the stranger
+class Seat:
+    def __init__(self) -> None:
+        self.reader = None
+        self.writer = None
+        self.decoder = FrameDecoder()
+        self.side = None
+        self.token = None
+        self.sync = -1
+        self.times = {}             # 'handshake', 'start', 'state' -> seconds after connecting
+
+
+
+# Connect and read until the first full snapshot after START
+async def connect(port: int, request: str, wait_state: bool = True) -> Seat:
+    # Purpose: Answer the ROOMS offer with request, take bin1 like pongClient's lobby and time each step
+    # Pre: A server listens on port, request is a complete 'ROOM name;' or 'RESUME name token;'
+    # Post: Returns the Seat once a MSG_STATE after START arrived (or once the side is known if not
+    #       wait_state), raises ConnectionError if the server closes the connection first
+
+    seat = Seat()
+    began = time.perf_counter()
+    seat.reader, seat.writer = await asyncio.open_connection('127.0.0.1', port)
+    started = False
+    while True:
+        data = await seat.reader.read(65536)
+        if not data:
+            raise ConnectionError("server closed the connection during the handshake")
+        seat.decoder.feed(data)
+        for frame in seat.decoder.frames():
+            if seat.decoder.protocol == BINARY_PROTOCOL:
+                if frame[0] == MSG_START and not started:
+                    started = True
+                    seat.times['start'] = time.perf_counter() - began
+                elif frame[0] == MSG_STATE and started:
+                    seat.sync = STATE.unpack_from(frame)[7]
+                    seat.times['state'] = time.perf_counter() - began
+                    return seat
+                elif frame[0] == MSG_PING:
+                    seat.writer.write(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
+                continue
+
+            msg = str(frame, 'ascii').strip()
+            if msg.startswith('ROOMS'):
+                seat.writer.write(request.encode())
+            elif ',' in msg and seat.side is None:
+                seat.side = msg.split(',')[2]
+                seat.times['handshake'] = time.perf_counter() - began
+                if not wait_state:
+                    return seat
+            elif msg.startswith(SESSION_LINE + ' '):
+                seat.token = msg.split()[1]
+            elif msg.startswith('PROTOCOLS'):
+                seat.writer.write(PROTOCOL_ACCEPT)
+            elif msg == PROTOCOL_ACCEPT.decode().rstrip(';'):
+                seat.decoder.switch_protocol(BINARY_PROTOCOL)
+            elif msg == 'START' and not started:
+                started = True
+                seat.times['start'] = time.perf_counter() - began
+
+
+
+# Kill a connection the way the server should notice
+def reset(seat: Seat) -> None:
+    # Purpose: Close with SO_LINGER 0, so the server's next read fails with a RST instead of a clean EOF
+    # Pre: seat is connected
+    # Post: The socket is gone
+
+    sock = seat.writer.get_extra_info('socket')
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+    seat.writer.transport.abort()
+
+
+
+# The kill and restore cycles against one server
+async def measure(port: int, cycles: int) -> dict:
+    # Purpose: Keep an opponent in the room, then drop and resume the player cycles times per kind
+    # Pre: An authoritative server with the default --resume-grace listens on port
+    # Post: Returns kind -> list of Seat.times, raises AssertionError if a side or snapshot is wrong
+
+    loop = asyncio.get_running_loop()
+    opponent = Client(ROOM)
+    task = loop.create_task(run_client(opponent, '127.0.0.1', port))
+    await asyncio.sleep(0.2)
+    player = await connect(port, f'ROOM {ROOM};')
+    assert player.side in ('left', 'right') and player.token, "the player got no side or no token"
+    side, token = player.side, player.token
+
+    results = {kind: [] for kind in KINDS}
+    kept = []
+    for cycle in range(cycles):
+        for kind in KINDS:
+            await asyncio.sleep(0.1)
+            last_sync = player.sync
+            if kind == 'reset':
+                reset(player)
+                await asyncio.sleep(0.1)
+                stranger = await connect(port, f'ROOM {ROOM};', wait_state = False)
+                assert stranger.side == 'spectator', f"a stranger took the held side ({stranger.side})"
+                stranger.writer.close()
+            else:
+                kept.append(player)
+
+            player = await connect(port, f'{RESUME_REQUEST} {ROOM} {token};')
+            assert player.side == side, f"resumed as {player.side}, not {side}"
+            assert player.sync >= last_sync, "the first snapshot after resuming is older than the last before the drop"
+            results[kind].append(player.times)
+
+            # Keep reading, so the server does not take this connection for a slow one
+            loop.create_task(drain(player))
+
+    # The silently dropped connections must have been closed by the server
+    await asyncio.sleep(0.2)
+    closed = sum(seat.reader.at_eof() for seat in kept)
+    for seat in kept + [player]:
+        seat.writer.close()
+    opponent.writer.close()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions = True)
+    assert closed == len(kept), f"the server kept {len(kept) - closed} replaced connections open"
+    return results
+
+
+
+# Read a connection until it closes
+async def drain(seat: Seat) -> None:
+    # Purpose: Answer pings and note the newest sync, like a client sitting in a match
+    # Pre: seat finished connect()
+    # Post: Returns at EOF or once the socket is killed
+
+    try:
+        while data := await seat.reader.read(65536):
+            seat.decoder.feed(data)
+            for frame in seat.decoder.frames():
+                if frame[0] == MSG_STATE:
+                    seat.sync = max(seat.sync, STATE.unpack_from(frame)[7])
+                elif frame[0] == MSG_PING:
+                    seat.writer.write(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
+    except (OSError, ValueError):
+        pass
+
+
+
+# The same drop without a token or a held side
+async def without_token(port: int) -> tuple:
+    # Purpose: Drop the player, let a stranger join first, then rejoin with 'ROOM name;'
+    # Pre: A server with --resume-grace 0 listens on port
+    # Post: Returns (the player's side before, the stranger's side, the player's side after)
+
+    opponent = Client(ROOM)
+    task = asyncio.get_running_loop().create_task(run_client(opponent, '127.0.0.1', port))
+    await asyncio.sleep(0.2)
+    player = await connect(port, f'ROOM {ROOM};')
+    before = player.side
+    reset(player)
+    await asyncio.sleep(0.1)
+    stranger = await connect(port, f'ROOM {ROOM};', wait_state = False)
+    player = await connect(port, f'ROOM {ROOM};', wait_state = False)
+    for seat in (stranger, player):
+        seat.writer.close()
+    opponent.writer.close()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions = True)
+    return before, stranger.side, player.side
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Time for a dropped player to resume its match with a session token")
+    parser.add_argument('--mode', choices = ['threaded', 'async'], nargs = '+', default = ['threaded', 'async'])
+    parser.add_argument('--port', type = int, default = 5771)
+    parser.add_argument('--cycles', type = int, default = 20, help = "Kill and restore cycles per kind")
+    args = parser.parse_args()
+
+    pick = lambda values, pct: values[min(len(values) - 1, int(len(values) * pct / 100))]
+    for index, mode in enumerate(args.mode):
+        port = args.port + 2 * index
+        server = launch_server(mode, port, ['--authoritative'])
+        try:
+            results = asyncio.run(measure(port, args.cycles))
+        finally:
+            server.kill()
+            server.wait()
+
+        print(f"\n{mode} server, {args.cycles} cycles per kind, same side and no older snapshot every time")
+        print(f"  {'kind':<8}{'step':<11}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}")
+        for kind in KINDS:
+            for step in ('handshake', 'start', 'state'):
+                values = sorted(times[step] * 1000 for times in results[kind])
+                print(f"  {kind:<8}{step:<11}{pick(values, 50):>8.1f}{pick(values, 99):>8.1f}{values[-1]:>8.1f}")
+
+        server = launch_server(mode, port + 1, ['--authoritative', '--resume-grace', '0'])
+        try:
+            before, stranger, after = asyncio.run(without_token(port + 1))
+        finally:
+            server.kill()
+            server.wait()
+        print(f"  without a token: the player was {before}, the stranger got {stranger}, the player came back as {after}")
@@ -0,0 +1,170 @@
+# =================================================================================================
+# Purpose:                  Spectators on the main server against spectators behind a tree of relays
+#                           (pongServer --relay): the main server's CPU, what the players see, and the
+#                           delay every relay hop adds
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/relayFanout.py --spectators 300 --fanout 2 --depth 2 --seconds 5
+#
+# An authoritative async server hosts one match between two bot players that track the ball. It is
+# run twice with --spectators: once with all of them connected to it directly, once with them spread
+# over the leaves of a relay tree, --fanout relays per node and --depth levels, every relay its own
+# process. Per run:
+#   main cpu     CPU seconds per second used by the main server process (Linux, from /proc)
+#   player gap   p99 time between new snapshots at the players, what they see as a stall
+#   hop delay    when a spectator got a sync, minus when the first player got it, per tree depth
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.serverCapacity import launch_server
+from benchmarks.udpLoss import Client, run_client
+
+ROOM = 'match'
+
+
+
+# CPU time a process has used so far
+def cpu_seconds(pid: int) -> float:
+    # Purpose: User plus system time from /proc/pid/stat
+    # Pre: pid is a running process
+    # Post: Returns seconds, or nan where /proc is not available
+
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            fields = stat.read().rpartition(')')[2].split()
+    except OSError:
+        return float('nan')
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+
+# Start the relay tree under the main server
+def launch_relays(main_port: int, fanout: int, depth: int) -> tuple:
+    # Purpose: Every node gets fanout async relays below it, down to depth levels
+    # Pre: The main server listens on main_port, the ports after it are free
+    # Post: Returns (processes, {port: depth} of the leaves)
+
+    processes = []
+    level = [main_port]
+    port = main_port
+    for _ in range(depth):
+        below = []
+        for parent in level:
+            for _ in range(fanout):
+                port += 1
+                args = ['--relay', f'127.0.0.1:{parent}', '--relay-room', ROOM]
+                processes.append(launch_server('async', port, args))
+                below.append(port)
+        level = below
+    return processes, dict.fromkeys(level, depth)
+
+
+
+# Percentile of a sorted list
+def pick(values: list, pct: float) -> float:
+    # Purpose: Nearest-rank percentile, the same way udpLoss.summarize picks them
+    # Pre: values is sorted and not empty
+    # Post: Returns one of the values
+
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+
+# One run: players on the main server, spectators wherever ports says
+async def measure(main_port: int, main_pid: int, ports: dict, spectators: int, warmup: float, seconds: float) -> dict:
+    # Purpose: Connect everyone, then record the main server's CPU and every snapshot for seconds
+    # Pre: The main server (and relays) are running, ports maps each port spectators use to its depth
+    # Post: Returns the numbers in the header comment, every connection is closed
+
+    loop = asyncio.get_running_loop()
+    players = [Client(ROOM), Client(ROOM)]
+    tasks = [loop.create_task(run_client(player, '127.0.0.1', main_port)) for player in players]
+    await asyncio.wait_for(asyncio.gather(*(player.started.wait() for player in players)), 10)
+
+    watchers = []
+    portList = list(ports)
+    for index in range(spectators):
+        port = portList[index % len(portList)]
+        watcher = Client(ROOM)
+        watchers.append((watcher, ports[port]))
+        tasks.append(loop.create_task(run_client(watcher, '127.0.0.1', port)))
+    await asyncio.wait_for(asyncio.gather(*(watcher.started.wait() for watcher, _ in watchers)), 30)
+
+    await asyncio.sleep(warmup)
+    for client in players + [watcher for watcher, _ in watchers]:
+        client.arrivals.clear()
+    cpuStart, wallStart = cpu_seconds(main_pid), time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu = (cpu_seconds(main_pid) - cpuStart) / (time.perf_counter() - wallStart)
+
+    # The first player to get a sync sets its time, everyone else is compared with that
+    firstSeen = {}
+    for player in players:
+        for arrived, sync in player.arrivals:
+            firstSeen[sync] = min(arrived, firstSeen.get(sync, arrived))
+    gaps = sorted((b[0] - a[0]) * 1000 for player in players for a, b in zip(player.arrivals, player.arrivals[1:]))
+    delays = {}
+    for watcher, depth in watchers:
+        delays.setdefault(depth, []).extend(
+            (arrived - firstSeen[sync]) * 1000 for arrived, sync in watcher.arrivals if sync in firstSeen
+        )
+
+    for client in players + [watcher for watcher, _ in watchers]:
+        client.writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+
+    result = {'cpu': cpu, 'gap_p99': pick(gaps, 99) if gaps else float('nan'), 'delays': {}}
+    for depth, values in sorted(delays.items()):
+        values.sort()
+        if values:
+            result['delays'][depth] = (pick(values, 50), pick(values, 99))
+    return result
+
+
+
+# Print one run's row
+def report(label: str, result: dict) -> None:
+    # Purpose: One line per run, hop delays by depth at the end
+    # Pre: result comes from measure
+    # Post: Printed
+
+    hops = '  '.join(f"depth {depth}: p50 {p50:.1f} p99 {p99:.1f}" for depth, (p50, p99) in result['delays'].items())
+    print(f"{label:<22}{result['cpu'] * 100:>9.1f}%{result['gap_p99']:>16.1f}   {hops}", flush = True)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Spectators on the main server against a relay tree")
+    parser.add_argument('--port', type = int, default = 5800, help = "Main server, relays use the ports after it")
+    parser.add_argument('--spectators', type = int, default = 300)
+    parser.add_argument('--fanout', type = int, default = 2)
+    parser.add_argument('--depth', type = int, default = 2)
+    parser.add_argument('--warmup', type = float, default = 1.0)
+    parser.add_argument('--seconds', type = float, default = 5.0)
+    args = parser.parse_args()
+
+    print(f"{args.spectators} spectators, {args.seconds:.0f} s per run, delays in ms")
+    print(f"{'':<22}{'main cpu':>10}{'player gap p99':>16}   hop delay")
+    processes = []
+    try:
+        main = launch_server('async', args.port, ['--authoritative'])
+        processes.append(main)
+        result = asyncio.run(measure(args.port, main.pid, {args.port: 0}, args.spectators, args.warmup, args.seconds))
+        report("direct", result)
+
+        relays, leaves = launch_relays(args.port, args.fanout, args.depth)
+        processes.extend(relays)
+        result = asyncio.run(measure(args.port, main.pid, leaves, args.spectators, args.warmup, args.seconds))
+        report(f"{len(relays)} relays, {len(leaves)} leaves", result)
+    finally:
+        for process in processes:
+            process.kill()
@@ -0,0 +1,117 @@
+# =================================================================================================
+# Purpose:                  Cost of one pongClient frame drawn the old way (clear, draw everything,
+#                           update the whole window) against CourtRenderer's cached court and dirty rects
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/renderCost.py --frames 5000
+# Without a display set SDL_VIDEODRIVER=dummy. The dummy driver makes the display update nearly free,
+# so on a real window the difference in pixels sent matters more than the times printed here.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+from assets.code.courtRenderer import CourtRenderer
+from assets.code.helperCode import updateScore
+
+WHITE = (255, 255, 255)
+
+
+
+# Positions of the paddles and ball for every frame
+def make_frames(count: int, width: int, height: int) -> list:
+    # Purpose: Same motion for both renderers, a bouncing ball with paddles following it and the
+    #          score changing every few hundred frames
+    # Pre: count > 0
+    # Post: Returns a list of (paddles, ball, lScore, rScore)
+
+    frames = []
+    x, y, xVel, yVel = width / 2, height / 2, -5, 3
+    for i in range(count):
+        x += xVel
+        y += yVel
+        if x < 20 or x > width - 25:
+            xVel = -xVel
+        if y < 10 or y > height - 15:
+            yVel = -yVel
+        paddleY = max(10, min(height - 60, int(y) - 25))
+        paddles = [pygame.Rect(10, paddleY, 10, 50), pygame.Rect(width - 20, paddleY, 10, 50)]
+        frames.append((paddles, pygame.Rect(int(x), int(y), 5, 5), (i // 300) % 5, (i // 450) % 5))
+    return frames
+
+
+
+# The drawing playGame did before CourtRenderer
+def draw_full(screen: pygame.Surface, scoreFont: pygame.font.Font, walls: list, centerLine: list, frame: tuple) -> int:
+    # Purpose: Clear, draw every object, render the score and update the whole window
+    # Pre: screen is the display surface
+    # Post: Returns the pixels sent to the display
+
+    paddles, ball, lScore, rScore = frame
+    screen.fill((0,0,0))
+    for paddle in paddles:
+        pygame.draw.rect(screen, WHITE, paddle)
+    pygame.draw.rect(screen, WHITE, ball)
+    for rect in centerLine:
+        pygame.draw.rect(screen, WHITE, rect)
+    for rect in walls:
+        pygame.draw.rect(screen, WHITE, rect)
+    updateScore(lScore, rScore, screen, WHITE, scoreFont)
+    pygame.display.update()
+    return screen.get_width() * screen.get_height()
+
+
+
+# The drawing playGame does now
+def draw_dirty(screen: pygame.Surface, renderer: CourtRenderer, frame: tuple) -> int:
+    # Purpose: Restore last frame's rects from the cached court, draw the moving parts, update only those
+    # Pre: renderer draws on screen
+    # Post: Returns the pixels sent to the display
+
+    paddles, ball, lScore, rScore = frame
+    dirtyRects = renderer.drawFrame(paddles, ball, lScore, rScore)
+    pygame.display.update(dirtyRects)
+    return sum(rect.width * rect.height for rect in dirtyRects)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Full redraw against cached court with dirty rects")
+    parser.add_argument('--frames', type = int, default = 5000)
+    parser.add_argument('--width', type = int, default = 640)
+    parser.add_argument('--height', type = int, default = 480)
+    args = parser.parse_args()
+
+    pygame.init()
+    screen = pygame.display.set_mode((args.width, args.height))
+    scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
+    winFont = pygame.font.Font("./assets/fonts/visitor.ttf", 48)
+    walls = [pygame.Rect(-10, 0, args.width + 20, 10), pygame.Rect(-10, args.height - 10, args.width + 20, 10)]
+    centerLine = [pygame.Rect((args.width / 2) - 5, i, 5, 5) for i in range(0, args.height, 10)]
+    frames = make_frames(args.frames, args.width, args.height)
+    print(f"{args.frames} frames at {args.width}x{args.height}, video driver {pygame.display.get_driver()}")
+
+    results = {}
+    renderer = CourtRenderer(screen, scoreFont, winFont, walls, centerLine)
+    for name, draw in (('full redraw', lambda frame: draw_full(screen, scoreFont, walls, centerLine, frame)),
+                       ('dirty rects', lambda frame: draw_dirty(screen, renderer, frame))):
+        pixels = 0
+        times = []
+        for frame in frames:
+            start = time.perf_counter()
+            pixels += draw(frame)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        results[name] = sum(times) / len(times)
+        print(f"  {name:<12} mean {results[name] * 1000:7.3f} ms   p99 {times[int(len(times) * 0.99)] * 1000:7.3f} ms"
+              f"   {pixels / len(frames):>9.0f} px updated per frame")
+
+    print(f"  {results['full redraw'] / results['dirty rects']:.1f}x less time per frame")
+    pygame.quit()
@@ -0,0 +1,145 @@
+# =================================================================================================
+# Purpose:                  How deep rollback mode (pongServer --rollback) rolls back and what simulating
+#                           frames again costs, at a range of network latencies
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/rollbackNetcode.py --frames 3600 --latency 0 20 50 100 150 --jitter 5
+#
+# Two RollbackSessions play one match in this process on a simulated 60 Hz clock, no sockets. Each
+# bot moves its paddle the way playGame does (5 px a frame, up or down) towards the ball as its own
+# session shows it, so it reacts to its predictions too. Its input reaches the other session after
+# --latency ms one way plus up to --jitter ms, in order like over TCP (the server's relay adds no
+# frames). Per latency:
+#   rollback      share of frames that caused a rollback, and the rollback depth (frames simulated
+#                 again) p50, p99 and max
+#   resim cost    time spent simulating again, per frame drawn on average and in the worst frame
+#   stalls        ticks a session waited because it was MAX_ROLLBACK frames ahead of the other's inputs
+#   same          after both played --frames frames and every input arrived, both sessions and one
+#                 simulated from the inputs alone are in the same state
+# Bandwidth does not depend on latency: 7 bytes a frame up and 9 down per player, against 15 (a full
+# MSG_STATE) or about 10 (with deltas) down and 7 up in authoritative mode.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.rollbackSession import MAX_ROLLBACK, SIDES, RollbackSession
+
+FRAME_MS = 1000 / 60
+PADDLE_SPEED = 5
+
+
+
+# One bot's input for its next frame
+def bot_input(session: RollbackSession, paddleY: int, height: int) -> int:
+    # Purpose: Move towards the ball in this session's view, within playGame's paddle limits
+    # Pre: paddleY is where the bot's paddle is now
+    # Post: Returns the paddle position for the next frame
+
+    target = session.sim.ball.rect.y - 22
+    if target > paddleY and paddleY + 50 < height - 10:
+        return paddleY + PADDLE_SPEED
+    if target < paddleY - PADDLE_SPEED and paddleY > 10:
+        return paddleY - PADDLE_SPEED
+    return paddleY
+
+
+
+# Play one match at one latency
+def run(frames: int, latency: float, jitter: float, seed: int) -> dict:
+    # Purpose: Step both sessions tick by tick, delivering inputs when they are due
+    # Pre: frames > 0
+    # Post: Returns the numbers in the header comment
+
+    rng = random.Random(seed)
+    sessions = {side: RollbackSession(side) for side in SIDES}
+    paddles = {side: sessions[side].start[side] for side in SIDES}
+    in_flight = {side: [] for side in SIDES}      # (arrival ms, paddleY, frame) sent to the other side
+    depths = []
+    frame_costs = []
+    tick = 0
+
+    while any(sessions[side].frame < frames for side in SIDES):
+        now = tick * FRAME_MS
+        tick += 1
+        for side in SIDES:
+            session = sessions[side]
+            other = SIDES[1 - SIDES.index(side)]
+
+            # The other player's inputs that have arrived by now
+            arrived = in_flight[other]
+            while arrived and arrived[0][0] <= now:
+                _, paddleY, frame = arrived.pop(0)
+                session.add_remote(other, paddleY, frame)
+
+            started = time.perf_counter()
+            resimulated = session.resimulated
+            if session.rollback_from is not None:
+                depths.append(session.frame - session.rollback_from + 1)
+            session.settle()
+            if session.frame < frames and session.can_advance():
+                paddles[side] = bot_input(session, paddles[side], session.sim.screenHeight)
+                frame = session.add_local(paddles[side])
+                delay = latency + rng.uniform(0, jitter)
+                due = max(now + delay, in_flight[side][-1][0] if in_flight[side] else 0)
+                in_flight[side].append((due, paddles[side], frame))
+                session.advance()
+            if session.resimulated != resimulated:
+                frame_costs.append(time.perf_counter() - started)
+
+    # Deliver everything still on the way, then every session knows every input
+    for side in SIDES:
+        other = SIDES[1 - SIDES.index(side)]
+        for _, paddleY, frame in in_flight[other]:
+            sessions[side].add_remote(other, paddleY, frame)
+        if sessions[side].rollback_from is not None:
+            depths.append(sessions[side].frame - sessions[side].rollback_from + 1)
+        sessions[side].settle()
+    reference = RollbackSession('spectator')
+    reference.inputs = {side: list(sessions[side].inputs[side]) for side in SIDES}
+    reference.advance_confirmed()
+    same = sessions['left'].sim.save() == sessions['right'].sim.save() == reference.sim.save()
+
+    depths.sort()
+    frame_costs.sort()
+    pick = lambda values, pct: values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0
+    rollbacks = sum(s.rollbacks for s in sessions.values())
+    resimulated = sum(s.resimulated for s in sessions.values())
+    return {
+        'rollback_share': rollbacks / (2 * frames),
+        'depth_p50': pick(depths, 50), 'depth_p99': pick(depths, 99), 'depth_max': depths[-1] if depths else 0,
+        'cost_per_frame_us': sum(s.rollback_seconds for s in sessions.values()) / (2 * frames) * 1e6,
+        'worst_frame_us': frame_costs[-1] * 1e6 if frame_costs else 0.0,
+        'us_per_resimulated': sum(s.rollback_seconds for s in sessions.values()) / resimulated * 1e6 if resimulated else 0.0,
+        'stalls': sum(s.stalls for s in sessions.values()),
+        'same': same,
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Rollback depth and re-simulation cost by latency")
+    parser.add_argument('--frames', type = int, default = 3600, help = "Frames each player plays (3600 = 1 minute)")
+    parser.add_argument('--latency', type = float, nargs = '+', default = [0, 20, 50, 100, 150, 250],
+                        help = "One-way latencies in ms")
+    parser.add_argument('--jitter', type = float, default = 5, help = "Up to this many ms added to each input")
+    parser.add_argument('--seed', type = int, default = 1)
+    args = parser.parse_args()
+
+    print(f"{args.frames} frames per player, MAX_ROLLBACK {MAX_ROLLBACK} frames, jitter up to {args.jitter:g} ms")
+    print(f"{'one way':>8}{'rollbacks':>11}{'depth p50':>11}{'p99':>6}{'max':>6}"
+          f"{'resim us/frame':>16}{'worst frame us':>16}{'us/resim':>10}{'stalls':>8}  same")
+    ok = True
+    for latency in args.latency:
+        r = run(args.frames, latency, args.jitter, args.seed)
+        ok = ok and r['same']
+        print(f"{latency:>6g}ms{r['rollback_share'] * 100:>10.0f}%{r['depth_p50']:>11}{r['depth_p99']:>6}{r['depth_max']:>6}"
+              f"{r['cost_per_frame_us']:>16.1f}{r['worst_frame_us']:>16.0f}{r['us_per_resimulated']:>10.1f}"
+              f"{r['stalls']:>8}  {'yes' if r['same'] else 'NO'}", flush = True)
+    if not ok:
+        sys.exit(1)
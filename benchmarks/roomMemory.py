@@ -0,0 +1,146 @@
+# =================================================================================================
+# Purpose:                  Memory per match room: the MatchRoom objects on their own (next to the same
+#                           fields without __slots__), and a live pongServer's RSS with two connected
+#                           players in each of N rooms
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/roomMemory.py --rooms 100 500 --live-rooms 100 300
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.matchRoom import MatchRoom
+from benchmarks.serverCapacity import launch_server
+
+
+# The same fields as MatchRoom in a regular class, for comparison
+class DictRoom:
+    def __init__(self, name: str, simulation = None) -> None:
+        self.name = name
+        self.leftPaddleY = 215
+        self.rightPaddleY = 215
+        self.ballX = 320
+        self.ballY = 240
+        self.lScore = 0
+        self.rScore = 0
+        self.sync = 0
+        self.clients = []
+        self.lock = threading.Lock()
+        self.game_running = False
+        self.state_dirty = False
+        self.simulation = simulation
+
+
+
+# Bytes allocated per room while building count rooms
+def room_state_bytes(make_room, count: int) -> float:
+    # Purpose: Measure what the room objects themselves cost, without any clients
+    # Pre: make_room(name) returns a new room
+    # Post: Returns traced bytes per room, rooms are kept in a dict like RoomManager does
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rooms = {}
+    for i in range(count):
+        name = f'room-{i}'
+        rooms[name] = make_room(name)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+
+
+# Resident memory of a process, in bytes
+def rss_bytes(pid: int) -> int:
+    # Purpose: Read VmRSS from /proc (Linux only)
+    # Pre: pid is running
+    # Post: Returns the resident set size
+
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+
+# Fill a live server with rooms of two players each
+def live_room_bytes(mode: str, port: int, count: int, extra_args: list) -> tuple:
+    # Purpose: Server RSS growth per room, including outboxes, decoders and, in threaded mode, threads
+    # Pre: port is free on localhost, Linux /proc is available
+    # Post: Returns (bytes per room, rooms whose players both saw START)
+
+    proc = launch_server(mode, port, extra_args)
+    sockets = []
+    try:
+        time.sleep(0.5)
+        baseline = rss_bytes(proc.pid)
+        for i in range(count):
+            for _ in range(2):
+
+                # The room choice can go out before the offer arrives, the server reads it right after
+                sock = socket.create_connection(('127.0.0.1', port), timeout = 5)
+                sock.sendall(f'ROOM bench-{i};'.encode())
+                sockets.append(sock)
+
+        # Let every outbox drain its handshake and START, then measure
+        time.sleep(1.0)
+        grown = rss_bytes(proc.pid) - baseline
+        started = 0
+        for i in range(count):
+            seen = 0
+            for sock in sockets[2 * i:2 * i + 2]:
+                sock.settimeout(0.5)
+                received = b''
+                try:
+                    while b'START' not in received:
+                        received += sock.recv(65536)
+                except socket.timeout:
+                    pass
+                seen += b'START' in received
+            started += seen == 2
+        return grown / count, started
+    finally:
+        for sock in sockets:
+            sock.close()
+        proc.kill()
+        proc.wait()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Memory per match room")
+    parser.add_argument('--rooms', type = int, nargs = '+', default = [100, 1000])
+    parser.add_argument('--live-rooms', type = int, nargs = '*', default = [100, 300],
+                        help = "Rooms of two connected players to open on a live server (Linux only)")
+    parser.add_argument('--modes', nargs = '+', default = ['async', 'threaded'])
+    parser.add_argument('--port', type = int, default = 5650)
+    args = parser.parse_args()
+
+    from assets.code.matchSimulation import MatchSimulation
+
+    print("Room state only (tracemalloc, no clients)")
+    print(f"{'rooms':>7}{'slots B':>10}{'dict B':>10}{'slots+sim B':>14}")
+    for count in args.rooms:
+        slots = room_state_bytes(MatchRoom, count)
+        plain = room_state_bytes(DictRoom, count)
+        simulated = room_state_bytes(lambda name: MatchRoom(name, simulation = MatchSimulation()), count)
+        print(f"{count:>7}{slots:>10,.0f}{plain:>10,.0f}{simulated:>14,.0f}")
+
+    if args.live_rooms and os.path.exists('/proc/self/status'):
+        print("\nLive server, 2 players per room (RSS growth)")
+        print(f"{'mode':<10}{'rooms':>7}{'KiB/room':>10}{'started':>9}")
+        port = args.port
+        for mode in args.modes:
+            for count in args.live_rooms:
+                perRoom, started = live_room_bytes(mode, port, count, [])
+                port += 1
+                print(f"{mode:<10}{count:>7}{perRoom / 1024:>10.1f}{started:>9}")
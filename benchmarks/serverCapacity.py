@@ -0,0 +1,189 @@
+# =================================================================================================
+# Purpose:                  Compare connected-client capacity and per-update latency of the threaded
+#                           and async pongServer modes
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/serverCapacity.py --spectators 50 200 500 --updates 200
+
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+# Start pongServer.py in a subprocess and wait until it accepts connections
+def launch_server(mode: str, port: int, extra_args: list = (), output = subprocess.DEVNULL) -> subprocess.Popen:
+    # Purpose: Run the server under test in its own process so it gets its own GIL
+    # Pre: port is free on localhost, output is a file to capture the server's prints in (default: discard)
+    # Post: Returns the running process once its listening socket is up
+
+    proc = subprocess.Popen(
+        [sys.executable, '-u', os.path.join(REPO_ROOT, 'pongServer.py'), '--mode', mode, '--port', str(port), *extra_args],
+        cwd = REPO_ROOT, stdout = output, stderr = subprocess.STDOUT if output is not subprocess.DEVNULL else subprocess.DEVNULL
+    )
+
+    # Poll until the port accepts a connection (the probe becomes a spectator-free no-op once closed)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            probe = socket.create_connection(('127.0.0.1', port), timeout = 0.2)
+            probe.close()
+            time.sleep(0.2)
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+
+# Connect one client and read its handshake
+def connect_client(port: int, timeout: float = 5.0, room: str = 'default') -> socket.socket:
+    # Purpose: Open a client connection, pick the room if offered, and consume the 'width,height,side;' handshake
+    # Pre: Server is listening on localhost:port
+    # Post: Returns a connected socket, raises OSError if the server did not answer in time
+
+    sock = socket.create_connection(('127.0.0.1', port), timeout = timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    buffer = b''
+    while True:
+        data = sock.recv(1024)
+        if not data:
+            raise OSError("server closed connection during handshake")
+        buffer += data
+
+        # Answer the ROOMS offer right away instead of waiting for the server to give up on us
+        if buffer.startswith(b'ROOMS') and b';' in buffer:
+            sock.sendall(f'ROOM {room};'.encode())
+            buffer = buffer.split(b';', 1)[1]
+        if b',' in buffer.split(b';', 1)[0] and b';' in buffer:
+            return sock
+
+
+
+# Run one benchmark round against an already running server
+def measure(port: int, spectators: int, updates: int, interval: float) -> dict:
+    # Purpose: Connect two players and N spectators, drive updates from the left player and time
+    #          how long each update takes to reach every spectator
+    # Pre: Server on localhost:port has no other clients connected
+    # Post: Returns connection count, setup time and latency percentiles in milliseconds
+
+    setupStart = time.perf_counter()
+    left = connect_client(port)
+    right = connect_client(port)
+
+    # Connect spectators until we reach the target or the server stops answering
+    spectatorSockets = []
+    for _ in range(spectators):
+        try:
+            spectatorSockets.append(connect_client(port))
+        except OSError:
+            break
+    setupTime = time.perf_counter() - setupStart
+
+    selector = selectors.DefaultSelector()
+    for sock in spectatorSockets:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, data = bytearray())
+
+    # Drain the START message from every socket
+    time.sleep(0.2)
+    for key, _ in selector.select(timeout = 0.5):
+        try:
+            key.fileobj.recv(65536)
+        except BlockingIOError:
+            pass
+
+    fanoutLatencies = []
+    firstLatencies = []
+    for syncNum in range(1, updates + 1):
+
+        # Ball and scores stay fixed, only sync matters for matching replies
+        sent = time.perf_counter()
+        left.send(f'215,320,240,0,0,{syncNum}'.encode())
+
+        # Wait until every spectator has seen this sync value
+        pending = set(spectatorSockets)
+        first = None
+        deadline = sent + 2.0
+        while pending and time.perf_counter() < deadline:
+            for key, _ in selector.select(timeout = 0.05):
+                try:
+                    data = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                buffer = key.data
+                buffer += data
+                if f',{syncNum};'.encode() in buffer:
+                    pending.discard(key.fileobj)
+                    buffer.clear()
+                    if first is None:
+                        first = time.perf_counter() - sent
+        if not pending:
+            fanoutLatencies.append(time.perf_counter() - sent)
+            firstLatencies.append(first if first is not None else 0.0)
+        time.sleep(interval)
+
+    for sock in [left, right, *spectatorSockets]:
+        sock.close()
+    selector.close()
+
+    return {
+        'connected': len(spectatorSockets) + 2,
+        'setup_s': setupTime,
+        'delivered': len(fanoutLatencies),
+        'first_p50_ms': percentile(firstLatencies, 50) * 1000,
+        'fanout_p50_ms': percentile(fanoutLatencies, 50) * 1000,
+        'fanout_p99_ms': percentile(fanoutLatencies, 99) * 1000,
+    }
+
+
+
+# Nearest-rank percentile
+def percentile(values: list, pct: float) -> float:
+    # Purpose: Small helper so the benchmark needs no third-party packages
+    # Pre: values holds numbers (may be empty)
+    # Post: Returns the pct-th percentile, or NaN for an empty list
+
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Threaded vs async pongServer capacity benchmark")
+    parser.add_argument('--spectators', type = int, nargs = '+', default = [10, 100, 300])
+    parser.add_argument('--updates', type = int, default = 100)
+    parser.add_argument('--interval', type = float, default = 0.01, help = "Seconds between left player updates")
+    parser.add_argument('--modes', nargs = '+', default = ['threaded', 'async'])
+    parser.add_argument('--port', type = int, default = 5600)
+    parser.add_argument('--server-args', default = '', help = "Extra pongServer.py arguments, e.g. '--tick-rate 30'")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'target':>8}{'conn':>7}{'setup s':>10}{'deliv':>7}{'1st p50':>10}{'all p50':>10}{'all p99':>10}")
+    port = args.port
+    for mode in args.modes:
+        for spectators in args.spectators:
+
+            # Fresh server per round so game state and client lists start empty
+            proc = launch_server(mode, port, args.server_args.split())
+            try:
+                result = measure(port, spectators, args.updates, args.interval)
+            finally:
+                proc.kill()
+                proc.wait()
+            port += 1
+
+            print(f"{mode:<10}{spectators:>8}{result['connected']:>7}{result['setup_s']:>10.3f}"
+                  f"{result['delivered']:>7}{result['first_p50_ms']:>10.3f}{result['fanout_p50_ms']:>10.3f}"
+                  f"{result['fanout_p99_ms']:>10.3f}")
@@ -0,0 +1,62 @@
+# =================================================================================================
+# Purpose:                  How many MatchSimulation ticks per second one core sustains, i.e. how many
+#                           authoritative 60 Hz matches one server process could simulate
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/simulationTicks.py --seconds 3
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.matchSimulation import MatchSimulation
+
+
+
+# Run the simulation with both paddles chasing the ball
+def run(seconds: float) -> tuple:
+    # Purpose: Step one match as fast as possible, restarting it whenever a side wins
+    # Pre: seconds > 0
+    # Post: Returns (ticks, elapsed seconds, matches finished)
+
+    sim = MatchSimulation()
+    ticks = 0
+    matches = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+
+        # Check the clock every 1000 ticks so timing does not dominate the loop
+        for _ in range(1000):
+
+            # Imperfect players: the left one hits off-centre to give the ball an angle, the right
+            # one tracks slowly, so points still get scored
+            ballY = sim.ball.rect.y
+            for side, paddle, aim, speed in (('left', sim.leftPaddle, 18, 5), ('right', sim.rightPaddle, 0, 3)):
+                offset = ballY + aim - paddle.rect.centery
+                sim.set_paddle(side, paddle.rect.y + max(-speed, min(speed, offset)))
+            sim.step()
+            if sim.game_over:
+                matches += 1
+                sim.reset_match()
+        ticks += 1000
+        if time.perf_counter() >= deadline:
+            return ticks, time.perf_counter() - start, matches
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Authoritative simulation throughput")
+    parser.add_argument('--seconds', type = float, default = 3.0)
+    parser.add_argument('--tick-rate', type = float, default = 60, help = "Server tick rate to size against")
+    args = parser.parse_args()
+
+    ticks, elapsed, matches = run(args.seconds)
+    rate = ticks / elapsed
+    print(f"{ticks} ticks in {elapsed:.2f} s, {matches} matches finished")
+    print(f"{rate:,.0f} ticks/s on one core = {rate / args.tick_rate:,.0f} concurrent matches at {args.tick_rate:g} Hz "
+          f"(simulation only, excluding networking)")
@@ -0,0 +1,234 @@
+# =================================================================================================
+# Purpose:                  Snapshot delay and freezes seen by a client behind a lossy link, over TCP
+#                           and over the --udp transport, at several loss rates
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/udpLoss.py --loss 0 0.01 0.05 0.1 --seconds 5
+#
+# An authoritative server (--udp) runs one room per measurement with two bot players that track the
+# ball, connected directly. The measured client is a spectator connected through lossShim, once
+# staying on TCP and once taking the UDP offer. For every snapshot with a new sync it notes
+#   delay    arrival time minus when that sync was sent, relative to the quickest snapshot
+#   freeze   time since the previous new snapshot, what a player sees as a stall
+#   received share of the syncs between the first and the last that arrived at all
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.udpTransport import UdpLink, parse_udp_offer
+from assets.code.wireProtocol import (
+    BINARY_PROTOCOL, MSG_PING, MSG_PONG, MSG_START, MSG_STATE, PING, PING_FEATURE, PROTOCOL_ACCEPT, STATE,
+    encode_input, encode_ping
+)
+from benchmarks.lossShim import LinkModel, LossShim
+from benchmarks.serverCapacity import launch_server
+
+TICK_RATE = 60
+
+
+
+# One bot client, a player that follows the ball or a spectator that records what it gets
+class Client:
+    def __init__(self, room: str, use_udp: bool = False) -> None:
+        self.room = room
+        self.use_udp = use_udp
+        self.side = None
+        self.udp_offer = None
+        self.udp_link = None
+        self.started = asyncio.Event()
+        self.arrivals = []          # (arrival time, sync) of every snapshot newer than the last
+        self.last_sync = -1
+        self.writer = None
+
+    def on_state(self, message) -> None:
+        _, leftY, rightY, ballX, ballY, _, _, sync = STATE.unpack_from(message)
+        if sync <= self.last_sync:
+            return
+        self.last_sync = sync
+        self.arrivals.append((time.perf_counter(), sync))
+        if self.side in ('left', 'right'):
+            self.writer.write(encode_input(ballY - 22, sync))
+
+
+
+# Connect a Client and keep reading until the connection closes
+async def run_client(client: Client, host: str, port: int) -> None:
+    # Purpose: Room choice, bin1 negotiation and START like pongClient's lobby, then snapshots,
+    #          over UDP once the server answers there if client.use_udp
+    # Pre: A --udp server (or a LossShim in front of one) listens on host:port
+    # Post: client.arrivals holds every new snapshot, returns when the connection is closed
+
+    reader, client.writer = await asyncio.open_connection(host, port)
+    decoder = FrameDecoder()
+    loop = asyncio.get_running_loop()
+    started = False
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            decoder.feed(data)
+            for frame in decoder.frames():
+                if decoder.protocol == BINARY_PROTOCOL:
+                    if frame[0] == MSG_STATE:
+                        client.on_state(frame)
+                    elif frame[0] == MSG_PING:
+                        client.writer.write(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
+                    started = started or frame[0] == MSG_START
+                else:
+                    msg = str(frame, 'ascii').strip()
+                    started = started or msg == 'START'
+                    handle_line(client, msg, decoder)
+
+                # Like pongClient, the game (and UDP) starts once START is in and bin1 is acknowledged
+                if started and decoder.protocol == BINARY_PROTOCOL and not client.started.is_set():
+                    client.started.set()
+                    if client.use_udp and client.udp_offer is not None:
+                        client.udp_link = UdpLink(host, *client.udp_offer)
+                        loop.add_reader(client.udp_link.sock.fileno(), receive_datagrams, client)
+                        loop.create_task(send_hellos(client.udp_link))
+    finally:
+        if client.udp_link is not None:
+            loop.remove_reader(client.udp_link.sock.fileno())
+            client.udp_link.close()
+
+
+
+# Answer one handshake line
+def handle_line(client: Client, msg: str, decoder: FrameDecoder) -> None:
+    # Purpose: Pick the room, note the side and the UDP offer, accept pings and bin1
+    # Pre: msg is one text line from the server without its ';'
+    # Post: The decoder is switched to binary at the bin1 ack
+
+    if msg.startswith('ROOMS'):
+        client.writer.write(f'ROOM {client.room};'.encode())
+    elif ',' in msg and client.side is None:
+        client.side = msg.split(',')[2]
+    elif msg == PING_FEATURE.decode().rstrip(';'):
+        client.writer.write(PING_FEATURE)
+    elif msg.startswith('UDP '):
+        client.udp_offer = parse_udp_offer(msg)
+    elif msg.startswith('PROTOCOLS'):
+        client.writer.write(PROTOCOL_ACCEPT)
+    elif msg == PROTOCOL_ACCEPT.decode().rstrip(';'):
+        decoder.switch_protocol(BINARY_PROTOCOL)
+
+
+
+# Read every datagram waiting on a client's UdpLink
+def receive_datagrams(client: Client) -> None:
+    # Purpose: Event loop reader callback, the link already drops stale datagrams
+    # Pre: client.udp_link is open
+    # Post: New snapshots are recorded
+
+    for message in client.udp_link.receive():
+        if message[0] == MSG_STATE:
+            client.on_state(message)
+
+
+
+# Keep saying hello until the server answers over UDP
+async def send_hellos(link: UdpLink) -> None:
+    # Purpose: pongClient calls poll() every frame, this does it every 50 ms
+    # Pre: link was just opened
+    # Post: Returns once a datagram came back or the link was closed
+
+    while not link.established and link.sock.fileno() >= 0:
+        link.poll(time.perf_counter())
+        await asyncio.sleep(0.05)
+
+
+
+# What the measured client saw
+def summarize(arrivals: list) -> dict:
+    # Purpose: Delay and freeze percentiles and the share of syncs received
+    # Pre: arrivals is in arrival order
+    # Post: Returns the numbers in milliseconds, empty if fewer than two snapshots arrived
+
+    if len(arrivals) < 2:
+        return {}
+    offset = min(t - sync / TICK_RATE for t, sync in arrivals)
+    delays = sorted((t - sync / TICK_RATE - offset) * 1000 for t, sync in arrivals)
+    gaps = sorted((b[0] - a[0]) * 1000 for a, b in zip(arrivals, arrivals[1:]))
+    pick = lambda values, pct: values[min(len(values) - 1, int(len(values) * pct / 100))]
+    return {
+        'received': len(arrivals) / (arrivals[-1][1] - arrivals[0][1] + 1),
+        'delay_p50': pick(delays, 50), 'delay_p99': pick(delays, 99), 'delay_max': delays[-1],
+        'freeze_p99': pick(gaps, 99), 'freeze_max': gaps[-1],
+    }
+
+
+
+# One measurement: a fresh room, two players and the spectator behind the shim
+async def measure(server_port: int, shim: LossShim, room: str, use_udp: bool, warmup: float, seconds: float) -> dict:
+    # Purpose: Run the room for warmup + seconds and summarize what the spectator received after warmup
+    # Pre: The server and shim are running, room is not used yet
+    # Post: Returns summarize()'s numbers, every connection is closed
+
+    players = [Client(room), Client(room)]
+    spectator = Client(room, use_udp)
+    tasks = [asyncio.get_running_loop().create_task(run_client(player, '127.0.0.1', server_port)) for player in players]
+    await asyncio.sleep(0.3)
+    tasks.append(asyncio.get_running_loop().create_task(run_client(spectator, '127.0.0.1', shim.listen_port)))
+    await asyncio.wait_for(spectator.started.wait(), 5)
+
+    await asyncio.sleep(warmup)
+    spectator.arrivals.clear()
+    await asyncio.sleep(seconds)
+    arrivals = list(spectator.arrivals)
+
+    for client in players + [spectator]:
+        client.writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+    return summarize(arrivals)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "TCP against UDP snapshots behind a lossy link")
+    parser.add_argument('--port', type = int, default = 5790)
+    parser.add_argument('--mode', choices = ['threaded', 'async'], default = 'async')
+    parser.add_argument('--loss', type = float, nargs = '+', default = [0.0, 0.01, 0.05, 0.1])
+    parser.add_argument('--latency-ms', type = float, default = 20)
+    parser.add_argument('--jitter-ms', type = float, default = 5)
+    parser.add_argument('--rto-ms', type = float, default = 200)
+    parser.add_argument('--warmup', type = float, default = 0.5)
+    parser.add_argument('--seconds', type = float, default = 5.0)
+    args = parser.parse_args()
+
+    server = launch_server(args.mode, args.port, ['--authoritative', '--udp'])
+    model = LinkModel(0.0, args.latency_ms / 1000, args.jitter_ms / 1000, args.rto_ms / 1000, seed = 1)
+
+    async def main() -> None:
+        shim = LossShim('127.0.0.1', args.port, model)
+        await shim.start()
+        print(f"{args.mode} server, {args.latency_ms:.0f} ms + up to {args.jitter_ms:.0f} ms each way, "
+              f"lost TCP reads held {args.rto_ms:.0f} ms, {args.seconds:.0f} s per row")
+        print(f"{'loss':>6} {'transport':<10}{'received':>9}{'delay p50':>11}{'p99':>8}{'max':>8}"
+              f"{'freeze p99':>12}{'max':>8}   ms")
+        for index, loss in enumerate(args.loss):
+            model.loss = loss
+            for use_udp in (False, True):
+                transport = 'udp' if use_udp else 'tcp'
+                result = await measure(args.port, shim, f'loss{index}{transport}', use_udp, args.warmup, args.seconds)
+                if not result:
+                    print(f"{loss:>6.1%} {transport:<10}no snapshots")
+                    continue
+                print(f"{loss:>6.1%} {transport:<10}{result['received']:>9.1%}{result['delay_p50']:>11.1f}"
+                      f"{result['delay_p99']:>8.1f}{result['delay_max']:>8.1f}{result['freeze_p99']:>12.1f}"
+                      f"{result['freeze_max']:>8.1f}", flush = True)
+        shim.close()
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.kill()
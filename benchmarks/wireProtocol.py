@@ -0,0 +1,87 @@
+# =================================================================================================
+# Purpose:                  Micro-benchmark of bytes per frame and per-message encode/parse cost for
+#                           the text and binary wire protocols, on the server and the client side
+# =================================================================================================
+
+# Usage (from the repository root):
+#   python benchmarks/wireProtocol.py --iterations 200000
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.wireProtocol import STATE, UPDATE, encode_state, encode_update
+
+# A mid-game frame, large enough values that the text encoding is not flattered
+LEFT_Y, RIGHT_Y, BALL_X, BALL_Y, L_SCORE, R_SCORE, SYNC = 215, 187, 318, 242, 3, 2, 48213
+
+
+
+# Server side: encode a snapshot for one recipient
+def server_encode_text() -> bytes:
+    return f'{LEFT_Y},{RIGHT_Y},{BALL_X},{BALL_Y},{L_SCORE},{R_SCORE},{SYNC};'.encode()
+
+def server_encode_binary() -> bytes:
+    return encode_state(LEFT_Y, RIGHT_Y, BALL_X, BALL_Y, L_SCORE, R_SCORE, SYNC)
+
+
+# Client side: encode one update
+def client_encode_text() -> bytes:
+    return f'{LEFT_Y},{BALL_X},{BALL_Y},{L_SCORE},{R_SCORE},{SYNC}'.encode()
+
+def client_encode_binary() -> bytes:
+    return encode_update(LEFT_Y, BALL_X, BALL_Y, L_SCORE, R_SCORE, SYNC)
+
+
+TEXT_STATE = server_encode_text()
+BINARY_STATE = server_encode_binary()
+TEXT_UPDATE = client_encode_text()
+BINARY_UPDATE = client_encode_binary()
+
+
+# Server side: parse one client update, the same steps pongServer.parse_text_update takes
+def server_parse_text() -> tuple:
+    paddleY, ballX, ballY, lScore, rScore, sync = TEXT_UPDATE.decode().split(',')
+    return int(paddleY), int(ballX), int(ballY), int(lScore), int(rScore), int(sync)
+
+def server_parse_binary() -> tuple:
+    return UPDATE.unpack_from(BINARY_UPDATE)[1:]
+
+
+# Client side: parse one spectator snapshot, the same steps playGame takes
+def client_parse_text() -> tuple:
+    leftY, rightY, ballX, ballY, lScore, rScore, sync = TEXT_STATE.decode().strip().rstrip(';').split(',')
+    return int(leftY), int(rightY), int(ballX), int(ballY), int(lScore), int(rScore), int(sync)
+
+def client_parse_binary() -> tuple:
+    return STATE.unpack_from(BINARY_STATE)[1:]
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Text vs binary wire protocol micro-benchmark")
+    parser.add_argument('--iterations', type = int, default = 200000)
+    args = parser.parse_args()
+
+    # Both encodings must carry the same values before their speed is worth comparing
+    assert server_parse_text() == server_parse_binary()
+    assert client_parse_text() == client_parse_binary()
+
+    print(f"{'message':<22}{'text B':>8}{'bin B':>8}")
+    print(f"{'server -> client':<22}{len(TEXT_STATE):>8}{len(BINARY_STATE):>8}")
+    print(f"{'client -> server':<22}{len(TEXT_UPDATE):>8}{len(BINARY_UPDATE):>8}")
+    print()
+
+    print(f"{'operation':<22}{'text ns':>10}{'bin ns':>10}{'speedup':>9}")
+    for name, text, binary in [
+        ('server encode state', server_encode_text, server_encode_binary),
+        ('server parse update', server_parse_text, server_parse_binary),
+        ('client encode update', client_encode_text, client_encode_binary),
+        ('client parse state', client_parse_text, client_parse_binary),
+    ]:
+        textNs = min(timeit.repeat(text, number = args.iterations, repeat = 3)) / args.iterations * 1e9
+        binaryNs = min(timeit.repeat(binary, number = args.iterations, repeat = 3)) / args.iterations * 1e9
+        print(f"{name:<22}{textNs:>10.1f}{binaryNs:>10.1f}{textNs / binaryNs:>8.1f}x")
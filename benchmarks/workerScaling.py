@@ -0,0 +1,145 @@
+# =================================================================================================
+# Purpose:                  Snapshots per second pongServer delivers across many rooms with 0 (single
+#                           process) or N worker processes, and how the workers split the load
+# =================================================================================================
+
+# Usage (from the repository root, Linux):
+#   python benchmarks/workerScaling.py --workers 0 1 2 4 --rooms 200 --rate 60 --seconds 5
+#
+# Every room gets two players from driver processes on this machine. The left player sends a
+# ';' terminated text update at --rate Hz, the server fans each one out to both players. With
+# --workers the server's last per-worker stats table is printed after each run.
+
+import argparse
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.serverCapacity import launch_server
+
+
+
+# One load generator process
+def drive(port: int, roomNames: list, seconds: float, rate: float, results: multiprocessing.Queue) -> None:
+    # Purpose: Play every room in roomNames from one selector loop
+    # Pre: Server is listening on localhost:port
+    # Post: Puts (snapshots received, updates sent, seconds measured) on results
+
+    selector = selectors.DefaultSelector()
+    leftPlayers = []
+    for name in roomNames:
+        for side in ('left', 'right'):
+
+            # The room choice can go out before the offer arrives, the server reads it right after
+            sock = socket.create_connection(('127.0.0.1', port), timeout = 10)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(f'ROOM {name};'.encode())
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+            if side == 'left':
+                leftPlayers.append(sock)
+
+    # Give every room time to start, and throw away the handshakes and STARTs
+    time.sleep(1.0)
+    for key, _ in selector.select(timeout = 0):
+        try:
+            key.fileobj.recv(65536)
+        except (BlockingIOError, OSError):
+            pass
+    received = 0
+    sent = 0
+    syncNum = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    nextSend = start
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        if now >= nextSend:
+            syncNum += 1
+            update = f'215,{syncNum % 640},240,0,0,{syncNum};'.encode()
+            for sock in leftPlayers:
+                try:
+                    sock.send(update)
+                    sent += 1
+                except (BlockingIOError, OSError):
+                    pass
+            nextSend += 1 / rate
+        for key, _ in selector.select(timeout = max(0, min(nextSend, deadline) - time.perf_counter())):
+            try:
+                data = key.fileobj.recv(65536)
+            except (BlockingIOError, OSError):
+                continue
+            received += data.count(b';')
+
+    elapsed = time.perf_counter() - start
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    results.put((received, sent, elapsed))
+
+
+
+# One run against a fresh server
+def run(workers: int, mode: str, port: int, rooms: int, drivers: int, rate: float, seconds: float) -> dict:
+    # Purpose: Start the server, spread the rooms over the driver processes, and add up their counts
+    # Pre: port is free on localhost
+    # Post: Returns snapshots/s, updates/s and the server's last per-worker stats table
+
+    args = ['--workers', str(workers), '--stats-interval', '1'] if workers else []
+    with tempfile.TemporaryFile('w+') as output:
+        proc = launch_server(mode, port, args, output)
+        try:
+            results = multiprocessing.Queue()
+            names = [f'bench-{i}' for i in range(rooms)]
+            processes = [
+                multiprocessing.Process(target = drive, args = (port, names[i::drivers], seconds, rate, results))
+                for i in range(drivers)
+            ]
+            for process in processes:
+                process.start()
+            counts = [results.get(timeout = seconds + 60) for _ in processes]
+
+            # The last table the server printed while the drivers were still playing
+            output.seek(0)
+            tables = output.read().split('worker  ')
+            for process in processes:
+                process.join()
+        finally:
+            proc.kill()
+            proc.wait()
+
+        table = 'worker  ' + tables[-1].strip() if workers and len(tables) > 1 else ''
+
+    received = sum(c[0] for c in counts)
+    sent = sum(c[1] for c in counts)
+    elapsed = max(c[2] for c in counts)
+    return {'snapshots_s': received / elapsed, 'updates_s': sent / elapsed, 'table': table}
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "pongServer worker process scaling")
+    parser.add_argument('--workers', type = int, nargs = '+', default = [0, 1, 2, 4])
+    parser.add_argument('--mode', choices = ['threaded', 'async'], default = 'async')
+    parser.add_argument('--rooms', type = int, default = 200)
+    parser.add_argument('--drivers', type = int, default = 4, help = "Load generator processes")
+    parser.add_argument('--rate', type = float, default = 60, help = "Updates per second per room")
+    parser.add_argument('--seconds', type = float, default = 5)
+    parser.add_argument('--port', type = int, default = 5700)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.rooms} rooms, {args.rate:g} updates/s per room, {args.mode} workers")
+    print(f"{'workers':>8}{'updates/s':>12}{'snapshots/s':>14}{'delivered %':>13}")
+    for index, workers in enumerate(args.workers):
+        result = run(workers, args.mode, args.port + index, args.rooms, args.drivers, args.rate, args.seconds)
+        delivered = 100 * result['snapshots_s'] / (2 * result['updates_s']) if result['updates_s'] else 0
+        print(f"{workers:>8}{result['updates_s']:>12,.0f}{result['snapshots_s']:>14,.0f}{delivered:>13.1f}")
+        if result['table']:
+            print('\n'.join('        ' + line for line in result['table'].splitlines()))
@@ -6,50 +6,129 @@
 # =================================================================================================
 
 import pygame
-import tkinter as tk
+import argparse
+import errno
+import itertools
+import os
+import select
 import sys
 import socket
+import time
 
 from assets.code.helperCode import *
+from assets.code.courtRenderer import CourtRenderer
+from assets.code.deltaSnapshot import DeltaDecoder
+from assets.code.fixedTimestep import FixedTimestep, interpolate
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.frameProfiler import FrameProfiler
+from assets.code.lobbyHandshake import LobbyHandshake
+from assets.code.matchRoom import RESUME_REQUEST
+from assets.code.netSmoothing import PredictionCorrector, SnapshotBuffer
+from assets.code.rollbackSession import SIDES, RollbackSession
+from assets.code.udpTransport import UdpLink
+from assets.code.wireProtocol import (
+    BINARY_PROTOCOL, MSG_DELTA, MSG_PEER_INPUT, MSG_PING, MSG_PONG, MSG_START, MSG_STATE, PEER_INPUT, PING,
+    encode_ack, encode_input, encode_ping, encode_update
+)
+
+# How far in the past remote paddles and the ball are drawn, a few server ticks hides network jitter.
+# 0 draws the newest snapshot as soon as it arrives
+RENDER_DELAY = 0.05
+
+# Per-frame phase timing, e.g. PONG_PROFILE=overlay or PONG_PROFILE=overlay,csv=frames.csv. F3 shows and
+# hides the overlay while profiling. Empty (the default) turns it off
+PROFILE = os.environ.get("PONG_PROFILE", "")
+
+# The ball, the paddles and sync move TICK_RATE times a second on every client and the server, however
+# fast frames are drawn. Frames are drawn up to PONG_FPS times a second, set it to the monitor's refresh
+# rate (e.g. PONG_FPS=144) to draw every refresh, a slower machine just draws fewer frames
+TICK_RATE = 60
+RENDER_FPS = int(os.environ.get("PONG_FPS", "60"))
+
+# Seconds between acknowledgements of the newest snapshot over UDP, the server encodes deltas against it
+ACK_INTERVAL = 0.05
+
+# Seconds a player keeps trying to get back into its match after the connection drops
+RESUME_WINDOW = 10.0
+
+# Seconds to wait for the server to accept the connection, and milliseconds between checks of the lobby
+# from the start screen, the window stays responsive in between
+CONNECT_TIMEOUT = 10.0
+LOBBY_POLL_MS = 20
+
+# Seconds a headless client keeps playing after the match is decided, so its last updates go out
+HEADLESS_LINGER = 1.0
+
+
+
+# Start pygame and load the fonts and sounds, the lobby does it while waiting for START
+def loadAssets() -> dict:
+    # Purpose: Everything playGame needs before its first frame except the window
+    # Pre: A headless client set SDL's dummy video and audio drivers
+    # Post: pygame is initialized, returns the fonts and sounds by name
+
+    pygame.mixer.pre_init(44100, -16, 2, 2048)
+    pygame.init()
+    return {'scoreFont': pygame.font.Font("./assets/fonts/pong-score.ttf", 32),
+            'winFont': pygame.font.Font("./assets/fonts/visitor.ttf", 48),
+            'pointSound': pygame.mixer.Sound("./assets/sounds/point.wav"),
+            'bounceSound': pygame.mixer.Sound("./assets/sounds/bounce.wav")}
+
+
 
 # This is the main game loop.  For the most part, you will not need to modify this.  The sections
 # where you should add to the code are marked.  Feel free to change any part of this project
 # to suit your needs.
-def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.socket) -> None:
+def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.socket,
+             decoder:FrameDecoder = None, authoritative:bool = False, renderDelay:float = RENDER_DELAY,
+             profile:str = PROFILE, renderFps:int = RENDER_FPS, udpOffer:tuple = None,
+             rollback:bool = False, serverAddress:tuple = None, roomName:str = None,
+             sessionToken:str = None, assets:dict = None, headless:bool = False,
+             startTime:float = None) -> None:
     # Author: Nathan Garrison, Caleb Mpungu, Naman Rao
     # Purpose: Run the main Pong game loop for a client
-    # Pre: Client is connected to server, has received screen dimensions and player side
-    # Post: Updates paddle and ball positions, receives state from server, and renders game
+    # Pre: Client is connected to server, has received screen dimensions and player side,
+    #      decoder is the lobby's decoder (negotiated protocol and any bytes read after START),
+    #      authoritative is True when the server simulates the ball and score,
+    #      renderDelay is how many seconds behind the newest snapshot remote objects are drawn,
+    #      profile is a PONG_PROFILE setting, renderFps caps frames drawn per second (0 for no cap),
+    #      udpOffer is the server's (port, token) when it offered UDP, rollback is True when the server
+    #      only relays inputs, and a player whose handshake had a sessionToken reconnects to
+    #      serverAddress and takes back its side in roomName if the connection drops, assets come
+    #      from loadAssets (loaded here if None), a headless client has no window and its paddle
+    #      follows the ball, startTime is when START arrived (the time to the first frame is printed
+    #      when profiling or headless)
+    # Post: Updates paddle and ball positions, receives state from server, and renders game. Only a
+    #       headless client returns, once the match is over
 
     # Global game state variables (will be updated from server, just making sure they have values to begin)
-    oppPaddleY = 0
-    ballX = screenWidth // 2
-    ballY = screenHeight // 2
     lScore = 0
     rScore = 0
     sync = 0
 
-    # Pygame inits
-    pygame.mixer.pre_init(44100, -16, 2, 2048)
-    pygame.init()
+    # Pygame inits, usually done while waiting in the lobby
+    if assets is None:
+        assets = loadAssets()
 
     # Constants
     WHITE = (255,255,255)
     clock = pygame.time.Clock()
-    scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
-    winFont = pygame.font.Font("./assets/fonts/visitor.ttf", 48)
-    pointSound = pygame.mixer.Sound("./assets/sounds/point.wav")
-    bounceSound = pygame.mixer.Sound("./assets/sounds/bounce.wav")
-
-    # Display objects
-    screen = pygame.display.set_mode((screenWidth, screenHeight))
-    winMessage = pygame.Rect(0,0,0,0)
+    scoreFont = assets['scoreFont']
+    winFont = assets['winFont']
+    pointSound = assets['pointSound']
+    bounceSound = assets['bounceSound']
+
+    # Display objects, a headless client opens no window
+    screen = None if headless else pygame.display.set_mode((screenWidth, screenHeight))
     topWall = pygame.Rect(-10,0,screenWidth+20, 10)
     bottomWall = pygame.Rect(-10, screenHeight-10, screenWidth+20, 10)
     centerLine = []
     for i in range(0, screenHeight, 10):
         centerLine.append(pygame.Rect((screenWidth/2)-5,i,5,5))
 
+    # Walls and the center line are drawn once, each frame only the moving parts and the score are redrawn
+    renderer = None if headless else CourtRenderer(screen, scoreFont, winFont, [topWall, bottomWall], centerLine, WHITE)
+
     # Paddle properties and init
     paddleHeight = 50
     paddleWidth = 10
@@ -71,19 +150,75 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
         opponentPaddleObj = Paddle(pygame.Rect(0,0,0,0))
         playerPaddleObj = Paddle(pygame.Rect(0,0,0,0))
 
-    # Buffer for incoming data
-    recv_buffer = ''
+    # Incremental decoder for incoming data, it carries over whatever the lobby read after START
+    if decoder is None:
+        decoder = FrameDecoder()
+
+    # In rollback mode only inputs arrive, this client simulates the whole match from both players'
+    # inputs, predicting the opponent's and rolling back when the real one differs
+    session = None
+    if rollback and decoder.protocol == BINARY_PROTOCOL:
+        session = RollbackSession(playerPaddle, screenWidth, screenHeight)
+
+    # The local paddle moves as soon as a key is pressed. Everything else comes from server snapshots,
+    # drawn renderDelay in the past so they move smoothly between them. Without an authoritative server
+    # the left client owns the ball and the right client predicts it and corrects towards the left's
+    simulateBall = not authoritative and session is None and playerPaddle in ['left', 'right']
+    ownsBall = simulateBall and playerPaddle == 'left'
+    predictBall = simulateBall and playerPaddle == 'right'
+    snapshots = SnapshotBuffer(renderDelay)
+    corrector = PredictionCorrector()
+    nextCaption = 0.0
+    gameOverAt = None
+
+    # Times every phase of every frame when profiling, does nothing otherwise
+    profiler = FrameProfiler.fromSetting(profile)
+
+    # Simulation ticks owed since the last frame, and what this client simulates as it was one tick ago
+    # so frames drawn between ticks can show it part of the way there
+    timestep = FixedTimestep(TICK_RATE)
+    previousPositions = (playerPaddleObj.rect.y, ball.rect.x, ball.rect.y)
+
+    # Snapshots and our updates go over UDP once the server has heard from us there, until then
+    # (and always without an offer) over the TCP connection
+    udpLink = None
+    if udpOffer is not None and decoder.protocol == BINARY_PROTOCOL:
+        udpLink = UdpLink(client.getpeername()[0], *udpOffer)
+    nextAck = 0.0
+
+    # Rebuilds full snapshots from keyframes and deltas, a delta whose base we never got waits for a keyframe
+    deltas = DeltaDecoder()
+
+    # Updates, inputs and pong answers the socket has not taken yet. They go out in order, whole, before
+    # anything newer, since a frame cut short would misframe every message after it
+    outgoing = bytearray()
+
+    def sendToServer(message: bytes) -> None:
+        outgoing.extend(message)
+        flushToServer()
+
+    # Send as much of outgoing as the socket takes now, the rest is tried again every frame. A
+    # connection that went away is noticed by the next receive
+    def flushToServer() -> None:
+        if not outgoing:
+            return
+        try:
+            sent = client.send(outgoing)
+        except BlockingIOError:
+            return
+        except OSError:
+            outgoing.clear()
+            return
+        del outgoing[:sent]
 
     # Set socket to non-blocking mode
     client.setblocking(False)
 
     while True:
-        # Wiping the screen
-        screen.fill((0,0,0))
-
         # Getting keypress events
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                profiler.close()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN:
@@ -93,9 +228,28 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
                 elif event.key == pygame.K_UP:
                     playerPaddleObj.moving = "up"
 
+                elif event.key == pygame.K_F3:
+                    profiler.toggleOverlay()
+
+            # The window was covered or restored, send all of it again (a headless client has none)
+            elif event.type == pygame.VIDEOEXPOSE:
+                if renderer is not None:
+                    renderer.invalidate()
+
             elif event.type == pygame.KEYUP:
                 playerPaddleObj.moving = ""
 
+        # Nobody is at the keyboard of a headless client, its paddle goes wherever the ball is
+        if headless and playerPaddle in ['left', 'right']:
+            offset = ball.rect.centery - playerPaddleObj.rect.centery
+            if offset > playerPaddleObj.speed:
+                playerPaddleObj.moving = "down"
+            elif offset < -playerPaddleObj.speed:
+                playerPaddleObj.moving = "up"
+            else:
+                playerPaddleObj.moving = ""
+        profiler.lap('events')
+
         # =========================================================================================
         # Your code here to send an update to the server on your paddle's information,
         # where the ball is and the current score.
@@ -105,215 +259,558 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
         
         # =========================================================================================
 
-        # Update the player paddle and opponent paddle's location on the screen
-        for paddle in [playerPaddleObj, opponentPaddleObj]:
-            if paddle.moving == "down":
-                if paddle.rect.bottomleft[1] < screenHeight-10:
-                    paddle.rect.y += paddle.speed
-            elif paddle.moving == "up":
-                if paddle.rect.topleft[1] > 10:
-                    paddle.rect.y -= paddle.speed
+        # Run every simulation tick that is due, none on a frame drawn between ticks and several on a
+        # frame that came late, so the game plays at the same speed at any frame rate
+        steps = timestep.advance()
+        for _ in range(steps):
 
-        for paddle in [leftPaddle, rightPaddle]:
-            pygame.draw.rect(screen, WHITE, paddle)
+            # A rollback player too far ahead of the opponent's inputs waits for them
+            if session is not None and session.side is not None and not session.can_advance():
+                continue
+            previousPositions = (playerPaddleObj.rect.y, ball.rect.x, ball.rect.y)
+
+            # Update the player paddle and opponent paddle's location on the screen
+            for paddle in [playerPaddleObj, opponentPaddleObj]:
+                if paddle.moving == "down":
+                    if paddle.rect.bottomleft[1] < screenHeight-10:
+                        paddle.rect.y += paddle.speed
+                elif paddle.moving == "up":
+                    if paddle.rect.topleft[1] > 10:
+                        paddle.rect.y -= paddle.speed
+            profiler.lap('paddles')
+
+            # If the game is over, stop all movement
+            if lScore > 4 or rScore > 4:
+                playerPaddleObj.moving = ""
+            else:
+
+                # ==== Ball Logic =================================================================
+                # An authoritative server simulates the ball, the client (and any spectator) only draws what it sends
+                if simulateBall:
+                    ball.updatePos()
+
+                    # If the ball makes it past the edge of the screen, update score, etc.
+                    if ball.rect.x > screenWidth:
+                        lScore += 1
+                        pointSound.play()
+                        ball.reset(nowGoing="left")
+                    elif ball.rect.x < 0:
+                        rScore += 1
+                        pointSound.play()
+                        ball.reset(nowGoing="right")
+                    
+                    # If the ball hits a paddle
+                    if ball.rect.colliderect(playerPaddleObj.rect):
+                        bounceSound.play()
+                        ball.hitPaddle(playerPaddleObj.rect.center[1])
+                    elif ball.rect.colliderect(opponentPaddleObj.rect):
+                        bounceSound.play()
+                        ball.hitPaddle(opponentPaddleObj.rect.center[1])
+                    
+                    # If the ball hits a wall
+                    if ball.rect.colliderect(topWall) or ball.rect.colliderect(bottomWall):
+                        bounceSound.play()
+                        ball.hitWall()
+
+                    # Work off part of any difference from the owner's ball, a fixed amount per tick
+                    if predictBall:
+                        corrector.apply(ball)
+                # ==== End Ball Logic =============================================================
+            profiler.lap('ball')
+
+            # Rollback mode: this frame's input goes to the server, and the frame is simulated with it
+            # and the opponent's input (or a prediction of it) right away
+            if session is not None and session.side is not None:
+                sendToServer(encode_input(playerPaddleObj.rect.y, session.add_local(playerPaddleObj.rect.y)))
+                session.advance()
+
+            # This number should be synchronized between you and your opponent.  If your number is larger
+            # then you are ahead of them in time, if theirs is larger, they are ahead of you, and you need to
+            # catch up (use their info)
+            sync += 1
+
+        # Rollback mode draws this client's simulation, simulated again from the first frame an
+        # opponent input that arrived since the last frame was predicted wrong. Spectators only
+        # simulate frames both inputs have arrived for
+        if session is not None:
+            if session.side is None:
+                session.advance_confirmed()
+            else:
+                session.settle()
+            sim = session.sim
+            if (sim.lScore, sim.rScore) != (lScore, rScore):
+                pointSound.play()
+            elif (sim.ball.xVel, sim.ball.yVel) != (ball.xVel, ball.yVel):
+                bounceSound.play()
+            ball.rect.topleft = sim.ball.rect.topleft
+            ball.xVel, ball.yVel = sim.ball.xVel, sim.ball.yVel
+            if playerPaddle != 'left':
+                leftPaddle.rect.y = sim.leftPaddle.rect.y
+            if playerPaddle != 'right':
+                rightPaddle.rect.y = sim.rightPaddle.rect.y
+            lScore, rScore, sync = sim.lScore, sim.rScore, session.frame
+
+        # Send client's update to the server here, only the paddle matters to an authoritative server.
+        # A frame drawn between ticks has nothing new to send, rollback mode sent every tick's input
+        if steps and session is None:
+            send = udpLink.send if udpLink is not None and udpLink.established else sendToServer
+            if decoder.protocol == BINARY_PROTOCOL and authoritative:
+                send(encode_input(playerPaddleObj.rect.y, sync))
+            elif decoder.protocol == BINARY_PROTOCOL:
+                send(encode_update(playerPaddleObj.rect.y, ball.rect.x, ball.rect.y, lScore, rScore, sync))
+            else:
+                message = f"{playerPaddleObj.rect.y},{ball.rect.x},{ball.rect.y},{lScore},{rScore},{sync}"
+                sendToServer(message.encode())
+
+        # Whatever the socket could not take last frame
+        flushToServer()
+        profiler.lap('send')
 
         # If the game is over, display the win message
+        winText = None
         if lScore > 4 or rScore > 4:
             winText = "Player 1 Wins! " if lScore > 4 else "Player 2 Wins! "
-            textSurface = winFont.render(winText, False, WHITE, (0,0,0))
-            textRect = textSurface.get_rect()
-            textRect.center = ((screenWidth/2), screenHeight/2)
-            winMessage = screen.blit(textSurface, textRect)
-
-            # Stop all movement
-            playerPaddleObj.moving = ""
-        else:
 
-            # ==== Ball Logic =====================================================================
-            ball.updatePos()
-
-            # If the ball makes it past the edge of the screen, update score, etc.
-            if ball.rect.x > screenWidth:
-                lScore += 1
-                pointSound.play()
-                ball.reset(nowGoing="left")
-            elif ball.rect.x < 0:
-                rScore += 1
-                pointSound.play()
-                ball.reset(nowGoing="right")
-                
-            # If the ball hits a paddle
-            if ball.rect.colliderect(playerPaddleObj.rect):
-                bounceSound.play()
-                ball.hitPaddle(playerPaddleObj.rect.center[1])
-            elif ball.rect.colliderect(opponentPaddleObj.rect):
-                bounceSound.play()
-                ball.hitPaddle(opponentPaddleObj.rect.center[1])
-                
-            # If the ball hits a wall
-            if ball.rect.colliderect(topWall) or ball.rect.colliderect(bottomWall):
-                bounceSound.play()
-                ball.hitWall()
-            
-            pygame.draw.rect(screen, WHITE, ball)
-            # ==== End Ball Logic =================================================================
-
-        # Send client's update to the server here
-        message = f"{playerPaddleObj.rect.y},{ball.rect.x},{ball.rect.y},{lScore},{rScore},{sync}"
-        client.send(message.encode())
-
-        # Drawing the dotted line in the center
-        for i in centerLine:
-            pygame.draw.rect(screen, WHITE, i)
-        
-        # Drawing the player's new location
-        for paddle in [playerPaddleObj, opponentPaddleObj]:
-            pygame.draw.rect(screen, WHITE, paddle)
-
-        pygame.draw.rect(screen, WHITE, topWall)
-        pygame.draw.rect(screen, WHITE, bottomWall)
-        scoreRect = updateScore(lScore, rScore, screen, WHITE, scoreFont)
-        pygame.display.update()
-        clock.tick(60)
-        
-        # This number should be synchronized between you and your opponent.  If your number is larger
-        # then you are ahead of them in time, if theirs is larger, they are ahead of you, and you need to
-        # catch up (use their info)
-        sync += 1
+        # What this client simulates is drawn between its last two ticks, remote paddles and the ball
+        # already come from the snapshot buffer at this frame's time
+        alpha = timestep.alpha
+        playerRect = playerPaddleObj.rect.copy()
+        playerRect.y = interpolate(previousPositions[0], playerPaddleObj.rect.y, alpha)
+        ballRect = ball.rect.copy()
+        if simulateBall:
+            ballRect.x = interpolate(previousPositions[1], ball.rect.x, alpha)
+            ballRect.y = interpolate(previousPositions[2], ball.rect.y, alpha)
+        paddleRects = {'left': [playerRect, rightPaddle.rect], 'right': [leftPaddle.rect, playerRect]}
+        paddleRects = paddleRects.get(playerPaddle, [leftPaddle.rect, rightPaddle.rect])
+
+        # Paddles, ball (or the win message) and score over the court, and only where something changed
+        if renderer is not None:
+            dirtyRects = renderer.drawFrame(paddleRects, ballRect, lScore, rScore, winText)
+            profiler.lap('draw')
+            dirtyRects += renderer.addDrawn(profiler.draw(screen))
+            profiler.lap('overlay')
+            pygame.display.update(dirtyRects)
+            profiler.lap('flip')
+
+        # How long the first frame took after START when profiling (or for bots), assets loaded in the
+        # lobby are not part of it
+        if startTime is not None and (profile or headless):
+            print(f"First frame {(time.perf_counter() - startTime) * 1000:.1f} ms after START")
+        startTime = None
+
+        # A headless client leaves once the match is over and its last updates had time to go out
+        if headless and winText is not None:
+            if gameOverAt is None:
+                gameOverAt = time.perf_counter()
+            elif time.perf_counter() - gameOverAt > HEADLESS_LINGER:
+                profiler.close()
+                client.close()
+                if udpLink is not None:
+                    udpLink.close()
+                pygame.quit()
+                return
+        clock.tick(renderFps)
+        profiler.lap('tick')
         # =========================================================================================
         # Send your server update here at the end of the game loop to sync your game with your
         # opponent's game
 
+        lost = False
         try:
 
-            # Receive data from the server
-            data = client.recv(1024).decode()
+            # Receive everything the server sent since the last frame, the decoder will read in
+            # multiple messages (START, updates, etc.) and keep any partial one for next time
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    lost = True
+                    break
+                decoder.feed(data)
 
-            if data:
+        except BlockingIOError:
+            pass
+        except OSError:
+            lost = True
+
+        # The connection dropped, a player with a session token connects again and picks up where it
+        # left off: the server sends the current state (or in rollback mode every input) as soon as
+        # we speak bin1 again
+        if lost and sessionToken is not None:
+            started = time.perf_counter()
+            resumed = resumeSession(serverAddress, roomName, sessionToken, playerPaddle)
+            client.close()
+            if resumed is None:
+                print("Lost the connection to the server")
+                sessionToken = None
+            else:
+                client = resumed['client']
+                decoder = resumed['decoder']
+                deltas = DeltaDecoder()
+
+                # Half a message must not start the new connection, rollback inputs are all sent again below
+                outgoing.clear()
+                if udpLink is not None:
+                    udpLink.close()
+                    udpLink = None
+                if resumed['udpOffer'] is not None and decoder.protocol == BINARY_PROTOCOL:
+                    udpLink = UdpLink(client.getpeername()[0], *resumed['udpOffer'])
+
+                # The server ignores the inputs it already relayed, the rest fill the gap. Sent before
+                # the socket goes back to non-blocking, so all of it goes out
+                if session is not None and session.side is not None:
+                    try:
+                        client.sendall(b''.join(encode_input(paddleY, frame)
+                                                for frame, paddleY in enumerate(session.inputs[session.side], 1)))
+                    except OSError:
+                        pass
+                client.setblocking(False)
+                print(f"Resumed as {playerPaddle} in room {roomName} after {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        # Datagrams that arrived in order, and a hello while the server has not answered yet
+        datagrams = []
+        if udpLink is not None:
+            datagrams = udpLink.receive()
+            udpLink.poll(time.perf_counter())
+
+            # Tell the server which snapshot we have, its deltas over UDP are relative to it
+            if udpLink.established and deltas.latest is not None and time.perf_counter() >= nextAck:
+                nextAck = time.perf_counter() + ACK_INTERVAL
+                udpLink.send(encode_ack(deltas.latest))
+        profiler.lap('recv')
+
+        # Process all complete messages in the buffer, then the datagrams
+        previousScore = (lScore, rScore)
+        now = time.perf_counter()
+        for frame in itertools.chain(decoder.frames(), datagrams):
+
+            # A new match in this room (a player took a side freed after game over): the server counts
+            # sync from 1 again and starts its deltas over from a keyframe, so nothing from the last
+            # match is a base or a score any more
+            if frame[0] == MSG_START if decoder.protocol == BINARY_PROTOCOL else bytes(frame).strip() == b"START":
+                lScore = rScore = sync = 0
+                previousScore = (0, 0)
+                ball.reset(nowGoing="left")
+                deltas = DeltaDecoder()
+                snapshots = SnapshotBuffer(renderDelay)
+                corrector = PredictionCorrector()
+                if session is not None:
+                    session = RollbackSession(playerPaddle, screenWidth, screenHeight)
+                gameOverAt = None
+                continue
 
-                # Append received data to buffer because client will read in multiple messages (START, updates, etc.))
-                recv_buffer += data
+            # Binary snapshots have the same layout for every side and a fixed size
+            if decoder.protocol == BINARY_PROTOCOL:
 
-                # Process all complete messages in the buffer
-                while ';' in recv_buffer:
+                # Answer the server's round trip probe straight away
+                if frame[0] == MSG_PING:
+                    sendToServer(encode_ping(MSG_PONG, PING.unpack_from(frame)[1]))
 
-                    # Extract full message
-                    msg, recv_buffer = recv_buffer.split(';', 1)
-                    msg = msg.strip()
+                # Rollback mode: an input of the other player (or of either, for spectators)
+                if frame[0] == MSG_PEER_INPUT and session is not None:
+                    _, side, paddleY, frameNumber = PEER_INPUT.unpack_from(frame)
+                    session.add_remote(SIDES[side], paddleY, frameNumber)
+                    continue
+                if frame[0] != MSG_STATE and frame[0] != MSG_DELTA:
+                    continue
+                state = deltas.apply(frame)
+                if state is None:
+                    continue
+                leftY, rightY, ballX, ballY, leftScore, rightScore, syncNum = state
 
-                    # Skip empty messages
-                    if not msg:
-                        continue
+            else:
+                msg = str(frame, 'ascii').strip()
 
-                    try:
+                # Skip empty messages
+                if not msg:
+                    continue
 
-                        # Parse the message from the server
-                        if playerPaddle == 'left' or playerPaddle == 'right':
-                            oppPaddleY, ballX, ballY, leftScore, rightScore, syncNum = msg.split(",")
-                            opponentPaddleObj.rect.y = int(oppPaddleY)
-                        else:
-                            leftY, rightY, ballX, ballY, leftScore, rightScore, syncNum = msg.split(",")
-                        
-                        # Update opponent paddle, ball position, and scores
-                        # If player is a spectator, set left/right paddle positions
-                        if playerPaddle not in ['left', 'right']:
-                            leftPaddle.rect.y = int(leftY)
-                            rightPaddle.rect.y = int(rightY)
-                        ball.rect.x = int(ballX)
-                        ball.rect.y = int(ballY)
-                        lScore = int(leftScore)
-                        rScore = int(rightScore)
-                        sync = int(syncNum)
-
-                    except:
-                        pass
+                try:
 
-        except BlockingIOError:
-            pass
+                    # Parse the message from the server, players are not sent their own paddle
+                    if playerPaddle == 'left':
+                        rightY, ballX, ballY, leftScore, rightScore, syncNum = map(int, msg.split(","))
+                        leftY = None
+                    elif playerPaddle == 'right':
+                        leftY, ballX, ballY, leftScore, rightScore, syncNum = map(int, msg.split(","))
+                        rightY = None
+                    else:
+                        leftY, rightY, ballX, ballY, leftScore, rightScore, syncNum = map(int, msg.split(","))
+
+                except:
+                    continue
+
+            # Catch up if the opponent is ahead of us, never go back in time
+            sync = max(sync, syncNum)
+
+            # Positions go into the snapshot buffer and are drawn from it below, a repeat of a sync
+            # we already have is not drawn again
+            fresh = snapshots.add(syncNum, (leftY, rightY, ballX, ballY), now)
+
+            # The ball's owner only ever gets its own older state echoed back, everyone else takes the
+            # server's score (game over included, even from a repeated sync) and corrects their copy of
+            # the ball against it
+            if not ownsBall:
+                lScore = leftScore
+                rScore = rightScore
+                if predictBall and fresh:
+                    corrector.reconcile(ball, ballX, ballY, syncNum, sync)
+
+        # Draw remote paddles (and the ball, unless this client simulates it) renderDelay in the past
+        sample = snapshots.sample(now)
+        if sample is not None:
+            leftY, rightY, ballX, ballY = sample
+            if playerPaddle == 'left':
+                opponentPaddleObj.rect.y = rightY
+            elif playerPaddle == 'right':
+                opponentPaddleObj.rect.y = leftY
+            else:
+                leftPaddle.rect.y = leftY
+                rightPaddle.rect.y = rightY
+            if not simulateBall:
+                ball.rect.x = ballX
+                ball.rect.y = ballY
+
+        # Show how far behind the server we draw and how far off the local ball was
+        if now >= nextCaption and not headless:
+            nextCaption = now + 1.0
+            udpStatus = f"  udp lost or late {udpLink.filter.loss() * 100:.1f}%" if udpLink is not None and udpLink.established else ""
+            if session is not None:
+                pygame.display.set_caption(f"Pong  frame {session.frame}  rollbacks {session.rollbacks}  "
+                                           f"deepest {session.max_depth}  stalls {session.stalls}")
+            else:
+                pygame.display.set_caption(f"Pong  delay {snapshots.measuredDelay * 1000:.0f} ms  "
+                                           f"correction {corrector.meanCorrection:.1f} px{udpStatus}")
+
+        # Scoring happens on the server in authoritative mode, play the sound when it tells us
+        if authoritative and (lScore, rScore) != previousScore:
+            pointSound.play()
+        profiler.lap('apply')
+        profiler.endFrame()
         # =========================================================================================
 
 
 
 
+# Read the server's handshake, from the ROOMS offer up to START and the binary protocol ack
+def readHandshake(client:socket.socket, roomRequest:bytes, playerName:str = "") -> dict:
+    # Purpose: Wait in recv while a LobbyHandshake answers the ROOMS offer with roomRequest, accepts
+    #          the features and protocol the server offers and notes the court, side, room, mode, UDP
+    #          offer and session token
+    # Pre: client just connected and is blocking
+    # Post: Returns what playGame needs in a dict, decoder keeps whatever followed START. Raises
+    #       ConnectionError if the server closes the connection first
+
+    lobby = LobbyHandshake(roomRequest, playerName)
+    while not lobby.done:
+
+        # Receive data from the server
+        data = client.recv(1024)
+
+        # If no data, server has disconnected
+        if not data:
+            raise ConnectionError("server closed the connection")
+        client.sendall(lobby.feed(data))
+    return lobby.info
+
+
+
+# Read whatever the server sent to the lobby so far, without waiting for more
+def pollLobby(client:socket.socket, lobby:LobbyHandshake) -> bool:
+    # Purpose: Feed lobby every byte that has arrived and send its answers
+    # Pre: client is connected and non-blocking
+    # Post: Returns True once the game starts. Raises ConnectionError if the server closed the
+    #       connection (and OSError for any other socket error)
+
+    try:
+        while not lobby.done:
+            data = client.recv(4096)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            client.sendall(lobby.feed(data))
+    except BlockingIOError:
+        pass
+    return lobby.done
+
+
+
+# Connect again after the connection dropped during a match and take back our side
+def resumeSession(serverAddress:tuple, roomName:str, sessionToken:str, paddleSide:str,
+                  window:float = RESUME_WINDOW) -> dict:
+    # Purpose: Answer the ROOMS offer with 'RESUME room token;' until the server takes us back or
+    #          window seconds have passed, keeping the game window responsive in between
+    # Pre: serverAddress is the (ip, port) we joined through, sessionToken came with paddleSide
+    # Post: Returns readHandshake's dict with the connected socket under 'client', or None if the
+    #       server could not be reached or gave our side to someone else
+
+    deadline = time.monotonic() + window
+    request = f"{RESUME_REQUEST} {roomName} {sessionToken};".encode()
+    while time.monotonic() < deadline:
+        pygame.event.pump()
+        try:
+            client = socket.create_connection(serverAddress, timeout = 1.0)
+        except OSError:
+            time.sleep(0.1)
+            continue
+        try:
+            client.settimeout(2.0)
+            info = readHandshake(client, request)
+            client.settimeout(None)
+        except OSError:
+            client.close()
+            time.sleep(0.1)
+            continue
+        if info['paddleSide'] != paddleSide:
+            print(f"Could not resume, the server made us {info['paddleSide']}")
+            client.close()
+            return None
+        info['client'] = client
+        return info
+    return None
+
+
+
 # This is where you will connect to the server to get the info required to call the game loop.  Mainly
 # the screen width, height and player paddle (either "left" or "right")
 # If you want to hard code the screen's dimensions into the code, that's fine, but you will need to know
 # which client is which
-def joinServer(ip:str, port:str, errorLabel:tk.Label, app:tk.Tk) -> None:
+def joinServer(ip:str, port:str, errorLabel:"tk.Label", app:"tk.Tk", room:str = "", name:str = "",
+               joinButton:"tk.Button" = None) -> None:
     # Author: Nathan Garrison, Caleb Mpungu, Naman Rao
-    # Purpose: Connects to the Pong server, receives initial game info, and launches the game loop
-    # Pre: IP and port are valid; Tkinter label and app are initialized
-    # Post: Client is connected to server, receives screenWidth, screenHeight, player side, and calls playGame
-    
-    # Create a socket and connect to the server
+    # Purpose: Connects to the Pong server and waits in the lobby from Tk's event loop, loading the
+    #          game's assets meanwhile, then launches the game loop
+    # Pre: IP and port are valid; Tkinter label and app are initialized; room is the match to join
+    #      or create, blank for any match waiting for a player; name is what the server's match
+    #      statistics call us, blank for our IP address; joinButton is disabled while we wait
+    # Post: Returns straight away, the start screen stays responsive. Client is connected to server,
+    #       receives screenWidth, screenHeight, player side, and calls playGame once the game starts
+
+    # Create a socket and connect to the server without waiting for it
     # You don't have to use SOCK_STREAM, use what you think is best
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client.setblocking(False)
     try:
-        client.connect((ip, int(port)))
-    except Exception as e:
-        errorLabel.config(text=f"Could not connect to server at {ip}:{port}. Error: {e}")
-        errorLabel.update()
+        result = client.connect_ex((ip, int(port)))
+    except (OSError, ValueError, OverflowError) as e:
+        result = e
+    if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)):
+        if isinstance(result, int):
+            result = os.strerror(result)
+        errorLabel.config(text=f"Could not connect to server at {ip}:{port}. Error: {result}")
+        client.close()
         return
 
-    print("Connected to server, waiting for server to start...")
+    if joinButton is not None:
+        joinButton.config(state="disabled")
+    lobby = LobbyHandshake(f"ROOM {room.strip()};".encode() if room.strip() else b"ROOM;", name.strip())
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    connected = False
+    assets = None
 
-    screenWidth = None
-    screenHeight = None
-    paddleSide = None
-    gameStarted = False
-    buffer = ''
+    # Checked every LOBBY_POLL_MS from Tk's event loop until the game starts or the connection fails
+    def waitInLobby() -> None:
+        nonlocal connected, assets
+        try:
+            if not connected:
+                _, writable, failed = select.select([], [client], [client], 0)
+                if not writable and not failed:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("timed out")
+                    app.after(LOBBY_POLL_MS, waitInLobby)
+                    return
+                error = client.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise OSError(error, os.strerror(error))
+                connected = True
+                print("Connected to server, waiting for server to start...")
+                errorLabel.config(text=f"Connected to server at {ip}:{port}, waiting for an opponent...")
+            started = pollLobby(client, lobby)
+        except OSError as e:
+            if connected:
+                errorLabel.config(text=f"Lost the connection to {ip}:{port} before the game started. Error: {e}")
+            else:
+                errorLabel.config(text=f"Could not connect to server at {ip}:{port}. Error: {e}")
+            if joinButton is not None:
+                joinButton.config(state="normal")
+            client.close()
+            return
+
+        # With our side known there is nothing to do but wait, load the game meanwhile
+        if assets is None and lobby.info['paddleSide'] is not None:
+            assets = loadAssets()
+        if not started:
+            app.after(LOBBY_POLL_MS, waitInLobby)
+            return
+
+        # If you have messages you'd like to show the user use the errorLabel widget like so
+        info = lobby.info
+        roomName = info['roomName']
+        where = f" in room {roomName}" if roomName else ""
+        errorLabel.config(text=f"Connected to server at {ip}:{port}{where}. Starting game...")
+        # You may or may not need to call this, depending on how many times you update the label
+        errorLabel.update()
 
-    client.setblocking(True)
+        # Close this window and start the game with the info passed to you from the server
+        app.withdraw()     # Hides the window (we'll kill it later)
+        playGame(info['screenWidth'], info['screenHeight'], info['paddleSide'], client, info['decoder'],
+                 info['authoritative'], udpOffer = info['udpOffer'], rollback = info['rollback'],
+                 serverAddress = (ip, int(port)), roomName = roomName, sessionToken = info['sessionToken'],
+                 assets = assets, startTime = info['startTime'])  # User will be either left or right paddle
+        app.quit()         # Kills the window
 
-    while not gameStarted:
-        
-        # Receive data from the server
-        data = client.recv(1024).decode()
+    waitInLobby()
 
-        # If no data, server has disconnected
-        if not data:
-            continue
 
-        # Append received data to buffer
-        buffer += data
 
-        # Process all complete messages in the buffer
-        while ';' in buffer:
+# Join without the start screen, for kiosks (--server) and bots (--headless)
+def joinFromCommandLine(server:str, room:str = "", name:str = "", headless:bool = False,
+                        preload:bool = True) -> None:
+    # Purpose: Connect to server (ip:port), wait in the lobby in select and load the game's assets
+    #          meanwhile (unless not preload), then play. Neither tkinter nor, when headless, a pygame
+    #          window is ever opened
+    # Pre: server is 'ip:port', room and name as for joinServer
+    # Post: Plays the match, exits with an error message if the server cannot be reached or closes
+    #       the connection before the game starts. A headless client returns once the match is over
 
-            # Extract full message
-            msg, buffer = buffer.split(';', 1)
-            msg = msg.strip()
+    # SDL must know before pygame starts that there is no screen or sound card
+    if headless:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
 
-            # Skip empty messages
-            if not msg:
-                continue
+    ip, _, port = server.rpartition(":")
+    try:
+        client = socket.create_connection((ip, int(port)), timeout = CONNECT_TIMEOUT)
+    except (OSError, ValueError, OverflowError) as e:
+        sys.exit(f"Could not connect to server at {server}. Error: {e}")
+    print("Connected to server, waiting for server to start...")
 
-            # Parse the message from the server
-            if msg == "START":
-                gameStarted = True
-                print("Game starting.")
-            elif "," in msg:
-                try:
-                    screenWidth, screenHeight, paddleSide = msg.split(",")
-                    screenWidth = int(screenWidth)
-                    screenHeight = int(screenHeight)
-                except:
-                    continue
-    
+    client.setblocking(False)
+    lobby = LobbyHandshake(f"ROOM {room.strip()};".encode() if room.strip() else b"ROOM;", name.strip())
+    assets = None
+    try:
+        while not pollLobby(client, lobby):
 
-    # If you have messages you'd like to show the user use the errorLabel widget like so
-    errorLabel.config(text=f"Connected to server at {ip}:{port}. Starting game...")
-    # You may or may not need to call this, depending on how many times you update the label
-    errorLabel.update()     
+            # With our side known there is nothing to do but wait, load the game meanwhile
+            if preload and assets is None and lobby.info['paddleSide'] is not None:
+                assets = loadAssets()
+                continue
+            select.select([client], [], [])
+    except OSError as e:
+        client.close()
+        sys.exit(f"Lost the connection to {server} before the game started. Error: {e}")
 
-    # Close this window and start the game with the info passed to you from the server
-    app.withdraw()     # Hides the window (we'll kill it later)
-    playGame(screenWidth, screenHeight, paddleSide, client)  # User will be either left or right paddle
-    app.quit()         # Kills the window
+    info = lobby.info
+    print(f"Playing as {info['paddleSide']}" + (f" in room {info['roomName']}" if info['roomName'] else ""))
+    playGame(info['screenWidth'], info['screenHeight'], info['paddleSide'], client, info['decoder'],
+             info['authoritative'], udpOffer = info['udpOffer'], rollback = info['rollback'],
+             serverAddress = (ip, int(port)), roomName = info['roomName'], sessionToken = info['sessionToken'],
+             assets = assets, headless = headless, startTime = info['startTime'])
 
 
 # This displays the opening screen, you don't need to edit this (but may if you like)
 def startScreen():
+    # Only the start screen needs tkinter, --server and --headless run where it is not installed
+    import tkinter as tk
+
     app = tk.Tk()
     app.title("Server Info")
 
@@ -334,13 +831,40 @@ def startScreen():
     portEntry = tk.Entry(app)
     portEntry.grid(column=1, row=2)
 
+    roomLabel = tk.Label(text="Room (blank = any):")
+    roomLabel.grid(column=0, row=3, sticky="W", padx=8)
+
+    roomEntry = tk.Entry(app)
+    roomEntry.grid(column=1, row=3)
+
+    nameLabel = tk.Label(text="Name (optional):")
+    nameLabel.grid(column=0, row=4, sticky="W", padx=8)
+
+    nameEntry = tk.Entry(app)
+    nameEntry.grid(column=1, row=4)
+
     errorLabel = tk.Label(text="")
-    errorLabel.grid(column=0, row=4, columnspan=2)
+    errorLabel.grid(column=0, row=6, columnspan=2)
 
-    joinButton = tk.Button(text="Join", command=lambda: joinServer(ipEntry.get(), portEntry.get(), errorLabel, app))
-    joinButton.grid(column=0, row=3, columnspan=2)
+    joinButton = tk.Button(text="Join", command=lambda: joinServer(ipEntry.get(), portEntry.get(), errorLabel, app, roomEntry.get(), nameEntry.get(), joinButton))
+    joinButton.grid(column=0, row=5, columnspan=2)
 
     app.mainloop()
 
 if __name__ == "__main__":
-    startScreen()
+    parser = argparse.ArgumentParser(description = "Multiplayer pong client, opens the start screen unless --server is given")
+    parser.add_argument('--server', metavar = 'IP:PORT', help = "Join this server straight away, without the start screen")
+    parser.add_argument('--room', default = "", help = "Room to join or create with --server (default: any match waiting for a player)")
+    parser.add_argument('--name', default = "", help = "Name for the server's match statistics (default: our IP address)")
+    parser.add_argument('--headless', action = 'store_true',
+                        help = "No window and no sound, the paddle follows the ball and the client exits after the match (bots)")
+    parser.add_argument('--no-preload', action = 'store_true',
+                        help = "Start pygame and load fonts and sounds only after START, not while waiting for it")
+    args = parser.parse_args()
+
+    if args.server is None:
+        if args.room or args.name or args.headless or args.no_preload:
+            parser.error("--room, --name, --headless and --no-preload need --server")
+        startScreen()
+    else:
+        joinFromCommandLine(args.server, args.room, args.name, args.headless, not args.no_preload)
@@ -6,9 +6,36 @@
 # =================================================================================================
 
 # Synchronization 
+import argparse
+import asyncio
+import atexit
+import multiprocessing
+import os
 import socket
+import sqlite3
 import threading
 import time 
+from typing import Callable
+
+from assets.code.clientOutbox import SLOW_POLICIES, AsyncOutbox, ThreadedOutbox
+from assets.code.deltaSnapshot import DeltaSnapshot, DeltaTracker
+from assets.code.frameDecoder import FrameDecoder
+from assets.code.matchRecording import SPECTATOR_POLL, MatchRecorder, Recording, ReplayPlayer, recording_path
+from assets.code.matchRoom import (
+    RESUME_GRACE, SESSION_LINE, MatchRoom, RoomManager, parse_resume_request, parse_room_request, parse_watch_request
+)
+from assets.code.matchStats import NAME_REQUEST, MatchTally, StatsStore, StatsWriter, parse_player_name
+from assets.code.rateControl import CONTROL_HZ, RATE_TIERS, RateController, parse_rate_tiers
+from assets.code.serverMetrics import ServerMetrics, format_report, start_metrics_endpoint
+from assets.code.spectatorRelay import RECONNECT_DELAY, UpstreamFeed, parse_upstream
+from assets.code.tickScheduler import TickScheduler
+from assets.code.udpTransport import DatagramHandler, UdpEndpoint
+from assets.code.workerPool import WorkerRouter, receive_connection, send_stats, worker_stats
+from assets.code.wireProtocol import (
+    ACK, AUTHORITATIVE_MODE, BINARY_PROTOCOL, DELTA_FEATURE, INPUT, MSG_ACK, MSG_INPUT, MSG_PING, MSG_PONG,
+    MSG_UPDATE, NAME_FEATURE, PING, PING_FEATURE, PROTOCOL_ACCEPT, PROTOCOL_OFFER, ROLLBACK_MODE, START_MESSAGE, STATE,
+    TEXT_PROTOCOL, UPDATE, encode_peer_input, encode_ping, encode_state
+)
 
 # Use this file to write your server logic
 # You will need to support at least two clients
@@ -21,206 +48,1503 @@ import time
 screenWidth = 640
 screenHeight = 480
 
-# These variables store the current state of the game that needs to be synchronized between clients
-leftPaddleY = 215    # Y position of left player's paddle (Player 1)
-rightPaddleY = 215   # Y position of right player's paddle (Player 2)
+# Every match (paddles, ball, scores, sync, clients, game running flag) lives in its own MatchRoom,
+# each with its own lock, see assets/code/matchRoom.py
+rooms = RoomManager(screenWidth, screenHeight)
+
+# Seconds a new client gets to answer the ROOMS offer before it is put in the default room,
+# 0 skips room selection and everyone plays in the default room
+room_wait = 0.25
+
+# Seconds a dropped player's side is kept for it to resume with its session token (--resume-grace)
+resume_grace = RESUME_GRACE
+
+# Broadcasts per second when a tick scheduler is used, 0 broadcasts on every received packet
+tick_rate = 0
+
+# Snapshots a client may have queued before the slow-consumer policy ('latest' or 'disconnect') applies
+send_queue_size = 8
+slow_policy = 'latest'
+
+# START in every protocol, see ClientOutbox.push_snapshot
+START_MESSAGES = dict.fromkeys(('left', 'right', 'spectator'), "START;\n".encode())
+START_MESSAGES[BINARY_PROTOCOL] = START_MESSAGE
+
+# True when every room gets a MatchSimulation that owns the ball and score (--authoritative)
+authoritative = False
+
+# True when the server only relays each player's inputs and clients simulate the match (--rollback),
+# no snapshots are sent at all
+rollback = False
+
+# Role -> (ceiling, floor) snapshot rates with --adaptive-rate, every client then gets a RateController
+# that lowers its rate while its link backs up. None sends every client every snapshot
+rate_tiers = None
+
+# ServerMetrics when --metrics-interval or --metrics-port is given. None skips every measurement
+metrics = None
+metrics_interval = 0
+metrics_port = 0
+metrics_label = ''
+
+# UdpEndpoint when --udp is given: binary clients that take the offer get snapshots as datagrams and
+# send their updates the same way. None keeps everything on TCP
+udp_enabled = False
+udp = None
+
+# The one room a spectator relay (--relay) or replay server (--replay) serves, pinned in rooms, None for a normal server. Its
+# state comes from the upstream server, every client joins it as a spectator
+relay_room = None
+relay_upstream = None
+relay_watch = 'default'
+
+# Directory every match is recorded to (--record), None records nothing
+record_dir = None
+
+# StatsWriter every match's result goes to (--match-stats), None keeps no statistics. Workers open
+# their own on match_stats_path
+match_stats = None
+match_stats_path = None
+
+# ReplayPlayer of a replay server (--replay), which serves one recorded match to spectators the way a
+# relay serves its upstream room, in relay_room
+replay_player = None
+
+
+
+# Build the state message a client with the given side should receive
+def build_state_message(room: MatchRoom, side: str) -> str:
+    # Purpose: Format the current game state for a left, right, or spectator client
+    # Pre: room's game state (paddles, ball, scores, sync) is initialized
+    # Post: Returns the ';' terminated text message for that side (caller holds room.lock)
+
+    # Determine opponent paddle position for each player
+    if side == 'left':
+        return f'{room.rightPaddleY},{room.ballX},{room.ballY},{room.lScore},{room.rScore},{room.sync};'
+
+    elif side == 'right':
+        return f'{room.leftPaddleY},{room.ballX},{room.ballY},{room.lScore},{room.rScore},{room.sync};'
+
+    # Spectators get both paddle positions but can't control either,
+    # sends a special message to spectator clients
+    return (f'{room.leftPaddleY},{room.rightPaddleY},{room.ballX},{room.ballY},'
+            f'{room.lScore},{room.rScore},{room.sync};')
+
+
+
+# Build the binary snapshot, one layout for players and spectators alike
+def build_binary_state(room: MatchRoom) -> bytes:
+    # Purpose: Pack the current game state as a wireProtocol STATE message
+    # Pre: room's game state (paddles, ball, scores, sync) is initialized
+    # Post: Returns the packed message (caller holds room.lock)
+
+    return encode_state(room.leftPaddleY, room.rightPaddleY, room.ballX, room.ballY, room.lScore, room.rScore, room.sync)
+
+
+
+# Parse one text update received from a client
+def parse_text_update(data: str) -> tuple:
+    # Purpose: Turn 'paddleY,ballX,ballY,lScore,rScore,sync' into integers
+    # Pre: data holds exactly one update
+    # Post: Returns (paddleY, ballX, ballY, lScore, rScore, sync), raises ValueError if malformed
+
+    paddleY, clientBallX, clientBallY, clientLScore, clientRScore, clientSync = data.split(',')
+    return int(paddleY), int(clientBallX), int(clientBallY), int(clientLScore), int(clientRScore), int(clientSync)
+
+
+
+# Apply one update received from a client to the game state
+def apply_client_update(room: MatchRoom, player_side: str, update: tuple) -> None:
+    # Purpose: Merge a parsed (paddleY, ballX, ballY, lScore, rScore, sync) update into the room's game state
+    # Pre: Caller holds room.lock
+    # Post: Updates paddle position, and ball, scores and sync if the update came from the left client
+
+    paddleY, clientBallX, clientBallY, clientLScore, clientRScore, clientSync = update
+
+    # Update this player's paddle position
+    room.set_paddle(player_side, paddleY)
+
+    # The server simulation owns ball and score, only the paddle is taken from the client
+    if room.simulation is not None:
+        return
+
+    # Issues with desync if right client has higher sync, so only
+    # left client updates ball position and scores and right side just follows
+    if player_side == 'left':
+        if clientSync >= room.sync:
+            room.ballX = clientBallX
+            room.ballY = clientBallY
+            room.lScore = clientLScore
+            room.rScore = clientRScore
+            room.sync = clientSync
+
+        # Check for game over condition
+        if room.lScore > 4 or room.rScore > 4:
+            room.game_running = False
+
+    # Let the tick scheduler know there is something new to send
+    room.state_dirty = True
+
+
+
+# Handle the bytes of one read from a client, in whichever protocol it speaks
+def process_client_data(room: MatchRoom, outbox, decoder: FrameDecoder, data: bytes) -> None:
+    # Purpose: Answer a 'USE bin1;' request, then apply every complete text or binary update to the room's game state
+    # Pre: outbox and decoder belong to this client in room, data is what one recv returned
+    # Post: Complete messages are applied, a partial message stays in the decoder until the next read
 
-# Ball state (starts in middle of screen)
-ballX = screenWidth // 2 
-ballY = screenHeight // 2
+    # Older clients send unterminated text updates, one per packet. Two that TCP delivered in one read
+    # run together (the first's sync into the second's paddle) and cannot be told apart, so the read is
+    # skipped: the client sends a whole update every frame and the next one replaces them
+    if decoder.protocol == TEXT_PROTOCOL and not decoder.seen_delimiter and b';' not in data:
+        try:
+            update = parse_text_update(data.decode())
+        except ValueError:
+            return
+        with room.lock:
+            apply_client_update(room, outbox.side, update)
+        return
 
-# Scores
-lScore = 0
-rScore = 0
+    decoder.feed(data)
+    with room.lock:
+        for frame in decoder.frames():
+
+            if decoder.protocol == BINARY_PROTOCOL:
+                apply_binary_message(room, outbox, frame)
+                continue
+
+            msg = str(frame, 'ascii').strip()
+            if not msg:
+                continue
+
+            # A client that accepted the PROTOCOLS offer says so before its first update
+            if msg.startswith('USE '):
+                if msg.split()[1] == BINARY_PROTOCOL:
+                    outbox.switch_protocol(BINARY_PROTOCOL, PROTOCOL_ACCEPT)
+                    decoder.switch_protocol(BINARY_PROTOCOL)
+
+                    # Inputs are only relayed to binary clients, one that switches during the match
+                    # gets all of them so far, and from here on the rest in order (we hold the lock).
+                    # Otherwise it gets the state right away instead of at the next broadcast, which
+                    # is all a resumed player needs to carry on
+                    if rollback and room.game_running and room.inputs:
+                        outbox.push(b''.join(room.inputs), droppable = False)
+                    elif not rollback and room.game_running:
+                        outbox.push_snapshot(snapshot_messages(room), droppable = False)
+                continue
+
+            # A player's answer to the name offer, only ever made while keeping match statistics
+            if msg.startswith(NAME_REQUEST + ' '):
+                name = parse_player_name(msg)
+                if name is not None and match_stats is not None and outbox.side != 'spectator':
+                    room.names[outbox.side] = name
+                continue
+
+            # Accepting the ping offer, only ever made while metrics or rate control are on
+            if msg == PING_FEATURE.decode().rstrip(';'):
+                outbox.pings = metrics is not None or rate_tiers is not None
+                continue
+
+            # Accepting delta snapshots, they start with the first snapshot after the bin1 ack
+            if msg == DELTA_FEATURE.decode().rstrip(';'):
+                outbox.deltas = DeltaTracker()
+                continue
+
+            apply_client_update(room, outbox.side, parse_text_update(msg))
+
+
+
+# Apply one binary message from a client, received over TCP or UDP
+def apply_binary_message(room: MatchRoom, outbox, frame) -> None:
+    # Purpose: Apply an update, an authoritative-mode input, a ping answer or a delta acknowledgement
+    # Pre: Caller holds room.lock, frame is one complete message of a known type
+    # Post: The room's game state, the client's round trip time or its delta base is updated, other
+    #       types are ignored
+
+    if frame[0] == MSG_UPDATE:
+        apply_client_update(room, outbox.side, UPDATE.unpack_from(frame)[1:])
+    elif frame[0] == MSG_INPUT:
+        _, paddleY, frameNumber = INPUT.unpack_from(frame)
+        room.set_paddle(outbox.side, paddleY)
+        if rollback:
+            relay_input(room, outbox, paddleY, frameNumber)
+    elif frame[0] == MSG_PONG and outbox.pings and PING.unpack_from(frame)[1] == outbox.ping_id:
+        outbox.rtt = time.perf_counter() - outbox.ping_sent
+        outbox.pong_id = outbox.ping_id
+        if metrics is not None:
+            metrics.record('rtt', outbox.rtt)
+    elif frame[0] == MSG_ACK and outbox.deltas is not None:
+        outbox.deltas.ack(ACK.unpack_from(frame)[1])
+
+
+
+# Pass a player's input on to everyone else in a rollback match
+def relay_input(room: MatchRoom, outbox, paddleY: int, frameNumber: int) -> None:
+    # Purpose: Rollback mode's only traffic, the input goes to the other player and every spectator
+    # Pre: Caller holds room.lock, so every client gets the inputs in the order they are kept
+    # Post: The input is kept for late joiners and queued as a control message, which is never dropped.
+    #       Frames already relayed (sent again by a resumed player) are ignored. After a gap (inputs
+    #       that never arrived) the input is relayed anyway, the others predict the missing frames
+    #       instead of waiting for them forever
+
+    if outbox.side not in ('left', 'right') or not room.game_running:
+        return
+    if frameNumber <= room.input_frames[outbox.side]:
+        return
+    room.input_frames[outbox.side] = frameNumber
+    message = encode_peer_input(0 if outbox.side == 'left' else 1, paddleY, frameNumber)
+    room.inputs.append(message)
+    for c, _ in room.clients:
+        if c is not outbox and c.protocol == BINARY_PROTOCOL:
+            c.push(message, droppable = False)
+
+
+
+# Whether a client's update is broadcast as soon as it arrives
+def broadcast_on_receive() -> bool:
+    # Purpose: Without a tick scheduler every update is sent on at once, except by a relay or replay
+    #          server, whose state comes from elsewhere, or in rollback mode, where only inputs are sent
+    # Pre: None
+    # Post: Returns True if the handler should call broadcast_state
+
+    return not tick_rate and relay_room is None and not rollback
+
+
+
+# Handle one datagram from a client that took the UDP offer
+def handle_datagram(data: bytes, addr) -> None:
+    # Purpose: Apply a client's update received over UDP, the same way as one read over TCP
+    # Pre: udp is set
+    # Post: Unknown, stale and malformed datagrams are dropped, a hello only records the address
+
+    received = udp.receive(data, addr)
+    if received is None:
+        return
+    room, outbox, message = received
+    if metrics is not None:
+        started = time.perf_counter()
+    with room.lock:
+        apply_binary_message(room, outbox, message)
+    if metrics is not None:
+        metrics.record('parse', time.perf_counter() - started)
+    if broadcast_on_receive():
+        broadcast_state(room)
+
+
+
+# Open the UDP socket next to the TCP listener and serve it from a thread
+def start_udp(host: str, port: int) -> None:
+    # Purpose: Threaded mode UDP setup, port 0 picks a free port (workers)
+    # Pre: udp_enabled is set
+    # Post: udp is set and a daemon thread hands every datagram to handle_datagram
+
+    global udp
+
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.bind((host, port))
+    udp = UdpEndpoint(udp_socket.getsockname()[1], udp_socket.sendto)
+    print(f'{metrics_label}UDP snapshots on port {udp.port}')
+
+    def serve_udp() -> None:
+        while True:
+            try:
+                data, addr = udp_socket.recvfrom(2048)
+            except ConnectionResetError:
+                # Windows reports an earlier send to a closed client port here
+                continue
+            try:
+                handle_datagram(data, addr)
+            except Exception as e:
+                print(f"Error handling datagram from {addr}: {e}")
+    threading.Thread(target = serve_udp, daemon = True).start()
 
-# Sync variable to track game state updates
-sync = 0
 
-# Store all connected client sockets (2 players + any spectators)
-clients = []
-client_sides = {}
 
-# Prevent threads writing at same time on a global variable
-stateLock = threading.Lock()
+# Async mode version of start_udp
+async def start_udp_async(host: str, port: int) -> None:
+    # Purpose: Serve the UDP socket from the running event loop
+    # Pre: udp_enabled is set
+    # Post: udp is set and every datagram goes to handle_datagram on the loop
 
-# Game running flag
-game_running = False
+    global udp
 
-# Store paddle positions
-paddles = {}
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: DatagramHandler(handle_datagram), local_addr = (host or '0.0.0.0', port)
+    )
+    udp = UdpEndpoint(transport.get_extra_info('sockname')[1], transport.sendto)
+    print(f'{metrics_label}UDP snapshots on port {udp.port}')
+
+
+
+# Build the lines a newly connected client receives
+def handshake_message(room: MatchRoom, side: str) -> bytes:
+    # Purpose: 'width,height,side;' followed by the room name, a player's session token and name
+    #          offer (the latter when keeping match statistics), the ping offer when collecting
+    #          metrics or controlling rates,
+    #          the delta and binary protocol offers and, if the server simulates the match or only
+    #          relays inputs, the authoritative or rollback mode notice
+    # Pre: side was just picked for this client in room, caller holds room.lock
+    # Post: Returns the bytes to send before anything else
+
+    message = f'{screenWidth},{screenHeight},{side};ROOM {room.name};'.encode()
+    if side in room.tokens:
+        message += f'{SESSION_LINE} {room.tokens[side]};'.encode()
+        if match_stats is not None:
+            message += NAME_FEATURE
+    if metrics is not None or rate_tiers is not None:
+        message += PING_FEATURE
+    message += DELTA_FEATURE + PROTOCOL_OFFER
+    if authoritative:
+        message += AUTHORITATIVE_MODE
+    elif rollback:
+        message += ROLLBACK_MODE
+    return message
+
+
+
+# Read which room a new client wants
+def read_room_choice(client_socket: socket.socket) -> tuple:
+    # Purpose: Send the ROOMS offer and wait up to room_wait for a 'ROOM name;' reply
+    # Pre: client_socket was just accepted, nothing has been sent on it
+    # Post: Returns (room name, '' for any open room or None for the default room, any bytes read
+    #       that were not a room request, whether it asked to watch, and the session token of a
+    #       client resuming its side or None), raises ConnectionError if the client left
+
+    if not room_wait:
+        return None, b'', False, None
+    client_socket.sendall(rooms.listing())
+
+    # Older clients never answer, so give up after room_wait
+    data = b''
+    client_socket.settimeout(room_wait)
+    try:
+        while b';' not in data and len(data) < 64:
+            chunk = client_socket.recv(64)
+            if not chunk:
+                raise ConnectionError("client left before choosing a room")
+            data += chunk
+    except socket.timeout:
+        pass
+    finally:
+        client_socket.settimeout(None)
+
+    line, _, rest = data.partition(b';')
+    name, spectator, token = parse_room_choice(line.decode(errors = 'replace'))
+    return (name, rest, spectator, token) if name is not None else (None, data, False, None)
+
+
+
+# Async mode version of read_room_choice
+async def read_room_choice_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 offer: bytes = None) -> tuple:
+    # Purpose: Send the ROOMS offer (this process's rooms unless offer is given) and wait up to
+    #          room_wait for a 'ROOM name;' reply
+    # Pre: Connection was just accepted, nothing has been sent on it
+    # Post: Same result as read_room_choice, raises asyncio.IncompleteReadError if the client left
+
+    if not room_wait:
+        return None, b'', False, None
+    writer.write(offer or rooms.listing())
+
+    # Older clients never answer, so give up after room_wait
+    try:
+        line = await asyncio.wait_for(reader.readuntil(b';'), room_wait)
+    except asyncio.TimeoutError:
+        return None, b'', False, None
+    name, spectator, token = parse_room_choice(line[:-1].decode(errors = 'replace'))
+    return (name, b'', spectator, token) if name is not None else (None, line, False, None)
+
+
+
+# Parse the line a client answers the ROOMS offer with
+def parse_room_choice(line: str) -> tuple:
+    # Purpose: Tell 'ROOM name' (play, or watch once the room is full) from 'WATCH name' (always watch)
+    #          and 'RESUME name token' (take back a side)
+    # Pre: line is the client's first line without its ';'
+    # Post: Returns (room name as parse_room_request gives it, True if the client only watches,
+    #       session token or None)
+
+    watched = parse_watch_request(line)
+    if watched is not None:
+        return watched, True, None
+    resumed = parse_resume_request(line)
+    if resumed is not None:
+        return resumed[0], False, resumed[1]
+    return parse_room_request(line), False, None
+
+
+
+# Put a new client in its room and start the match if it was the missing player
+def join_room(room_name: str, make_outbox: Callable, addr, spectator: bool = False, token: str = None) -> tuple:
+    # Purpose: Pick the room and side, queue the handshake, and send START when the game can begin
+    # Pre: room_name, spectator and token come from read_room_choice, make_outbox(side) returns a new
+    #      outbox for this client
+    # Post: Returns (room, outbox), the client is in room.clients with its handshake queued first. A
+    #       valid token gets the side it was issued for back, with START straight away if the match is on
+
+    # A relay has one room and no players, whatever room the client asked for
+    if relay_room is not None:
+        room_name, spectator = relay_room.name, True
+
+    def create_outbox(room: MatchRoom, side: str):
+        outbox = make_outbox(side)
+        if match_stats is not None and side != 'spectator':
+            room.names.setdefault(side, str(addr[0]))
+        if rate_tiers is not None:
+            outbox.rate = RateController(*rate_tiers[side])
+        message = handshake_message(room, side)
+
+        # The UDP offer carries a token of this client's own, so it is added here and not in handshake_message
+        if udp is not None:
+            message += udp.register(room, outbox)
+        outbox.push(message, droppable = False)
+        return outbox
+
+    room, outbox, resumed = rooms.join(room_name, create_outbox, spectator, token)
+    print(f"Client {'resumed' if resumed else 'connected'} from {addr} as {outbox.side} in room {room.name}")
+
+    # Check if we can start the game, only a player taking a side starts one: a spectator joining
+    # after game over leaves the finished match on screen
+    with room.lock:
+        start = outbox.side != 'spectator' and should_start_game(room)
+        if start:
+            if room.simulation is not None:
+                room.simulation.reset_match()
+
+            # The left client counts sync from 0 again, its updates would be older than the last match's
+            else:
+                room.lScore = room.rScore = room.sync = 0
+            room.inputs.clear()
+            room.input_frames = {'left': 0, 'right': 0}
+            room.game_running = True
+        late = room.game_running and not start
+
+    if start:
+
+        # Both players connected, start the game
+        print(f"Two players connected in room {room.name}. Game can start.")
+        broadcast_start(room)
+
+    # Spectators (or a resumed player) joining a game in progress start right away
+    elif late:
+        outbox.push_snapshot(START_MESSAGES, droppable = False)
+
+    return room, outbox
+
+
+
+# Check whether both players are present and the game should start
+def should_start_game(room: MatchRoom) -> bool:
+    # Purpose: Decide if a START message should go out to every client in the room
+    # Pre: Caller holds room.lock
+    # Post: Returns True once, when both players are connected and the game is not running yet
+
+    if room.game_running:
+        return False
+
+    # Check if both players are connected
+    return room.open_side() is None
 
 
 
 # Broadcast updates to all clients
-def broadcast_state() -> None:
+def broadcast_state(room: MatchRoom) -> None:
     # Author: Nathan Garrison, Naman Rao, Caleb Mpungu
-    # Purpose: Send the current game state to all connected clients
-    # Pre: Global game state variables (paddles, ball, scores, sync) are initialized
-    # Post: Each client receives opponent paddle position, ball position, scores, and sync value
+    # Purpose: Send the room's current game state to all of its clients
+    # Pre: room's game state (paddles, ball, scores, sync) is initialized
+    # Post: Each client's outbox has the opponent paddle position, ball position, scores, and sync value queued
 
-    global ballX, ballY, lScore, rScore, sync, paddles
+    if metrics is not None:
+        started = time.perf_counter()
 
-    # Send each client the opponent paddle position, ball position, scores, and sync value
-    with stateLock:
+    # Encode the snapshot once per role and protocol while holding the lock, then release it before fanning out
+    with room.lock:
+        messages = snapshot_messages(room)
+        recipients = list(room.clients)
 
-        # Iterate through all connected clients
-        for client_socket, side in clients:
+        # Recorded under the lock, so the recording has the states in the order they were sent
+        if room.recorder is not None:
+            room.recorder.append(messages['delta'].state, messages[BINARY_PROTOCOL])
 
-            try:
+        # Tallied the same way, a match that was just won goes to the stats writer below
+        finished = None
+        if room.tally is not None and room.tally.observe(messages['delta'].state):
+            finished, room.tally = room.tally.result(dict(room.names)), None
 
-                # Determine opponent paddle position for each player
-                if side == 'left':
-                    oppPaddleY = paddles.get('right', screenHeight // 2 - 25)
-                    message = f'{oppPaddleY},{ballX},{ballY},{lScore},{rScore},{sync};'
+    # Queueing never blocks, each outbox drains on its own and applies the slow-consumer policy
+    for outbox, _ in recipients:
+        outbox.push_snapshot(messages)
+    if finished is not None:
+        match_stats.submit(finished)
 
-                elif side == 'right':
-                    oppPaddleY = paddles.get('left', screenHeight // 2 - 25)
-                    message = f'{oppPaddleY},{ballX},{ballY},{lScore},{rScore},{sync};'
+    if metrics is not None:
+        metrics.record('broadcast', time.perf_counter() - started)
 
-                # Spectators get both paddle positions but can't control either,
-                # sends a special message to spectator clients
-                elif side == 'spectator':
-                    leftY = paddles.get('left', screenHeight // 2 - 25)
-                    rightY = paddles.get('right', screenHeight // 2 - 25)
-                    message = f'{leftY},{rightY},{ballX},{ballY},{lScore},{rScore},{sync};'
 
-                # Send message to client
-                client_socket.send(message.encode())
 
-            # If sending fails, skip this client
-            except:
-                continue
+# Encode the room's state for every kind of client
+def snapshot_messages(room: MatchRoom) -> dict:
+    # Purpose: The messages argument of ClientOutbox.push_snapshot for the current state
+    # Pre: Caller holds room.lock
+    # Post: Returns the text message of each side, the binary keyframe and the DeltaSnapshot, whose
+    #       deltas are encoded once per distinct base as clients need them
+
+    messages = {side: build_state_message(room, side).encode() for side in ('left', 'right', 'spectator')}
+    keyframe = messages[BINARY_PROTOCOL] = build_binary_state(room)
+    messages['delta'] = DeltaSnapshot(STATE.unpack(keyframe)[1:], keyframe)
+    return messages
+
+
+
+# Send START to every connected client
+def broadcast_start(room: MatchRoom) -> None:
+    # Purpose: Tell every client in the room the game has started, in the protocol each one speaks
+    # Pre: Both players are connected
+    # Post: START is queued as a control message that is never dropped, and the match is recorded
+    #       from here with --record and tallied with --match-stats
+
+    if record_dir is not None:
+        start_recording(room)
+    if match_stats is not None:
+        start_tally(room)
+    with room.lock:
+        recipients = list(room.clients)
+    for c, _ in recipients:
+        c.push_snapshot(START_MESSAGES, droppable = False)
+
+
+
+# Start writing the room's match to a new file in record_dir
+def start_recording(room: MatchRoom) -> None:
+    # Purpose: Give the room a MatchRecorder, its first record is the START being sent
+    # Pre: record_dir is set
+    # Post: Every broadcast_state of the room is recorded until finish_recording, a file that cannot be
+    #       created is reported and the match goes on unrecorded
+
+    try:
+        recorder = MatchRecorder(recording_path(record_dir, room.name), screenWidth, screenHeight,
+                                 authoritative, room.name)
+    except OSError as e:
+        print(f"Not recording room {room.name}: {e}")
+        return
+    with room.lock:
+        previous, room.recorder = room.recorder, recorder
+        recorder.start()
+    if previous is not None:
+        finish_recording_file(previous)
+
+
+
+# Stop recording the room's match
+def finish_recording(room: MatchRoom) -> None:
+    # Purpose: Called when the match is over or its room is empty
+    # Pre: None, a room that is not being recorded is left alone
+    # Post: The recording has its index written and is closed
+
+    with room.lock:
+        recorder, room.recorder = room.recorder, None
+    if recorder is not None:
+        finish_recording_file(recorder)
+
+
+
+# Close a recorder that no room appends to any more
+def finish_recording_file(recorder: MatchRecorder) -> None:
+    # Purpose: Write the index outside the room lock and say where the recording is
+    # Pre: recorder was taken out of its room under the room's lock
+    # Post: The file is complete
+
+    try:
+        size = recorder.close()
+    except OSError as e:
+        print(f"Recording {recorder.path} failed: {e}")
+        return
+    print(f"Recorded {recorder.states} states to {recorder.path} ({size / max(recorder.states, 1):.1f} bytes per state)")
+
+
+
+# Start keeping statistics of the room's match
+def start_tally(room: MatchRoom) -> None:
+    # Purpose: Give the room a MatchTally, a tally it replaces belonged to a match that was abandoned
+    # Pre: match_stats is set
+    # Post: Every broadcast_state of the room is tallied until a side wins or finish_tally
+
+    tally = MatchTally(room.name, 'authoritative' if authoritative else 'peer', screenWidth)
+    with room.lock:
+        previous, room.tally = room.tally, tally
+        names = dict(room.names)
+    if previous is not None:
+        match_stats.submit(previous.result(names))
+
+
+
+# Stop keeping statistics of the room's match before a side won
+def finish_tally(room: MatchRoom) -> None:
+    # Purpose: Called when the room is empty
+    # Pre: None, a room without a tally is left alone
+    # Post: The match's result, without a winner, is queued for match_stats
+
+    with room.lock:
+        tally, room.tally = room.tally, None
+        names = dict(room.names)
+    if tally is not None:
+        match_stats.submit(tally.result(names))
 
 
 
 # Handle individual client connection
-def handle_client(client_socket: socket.socket, player_side: str) -> None:
+def handle_client(client_socket: socket.socket, addr, choice: tuple = None) -> None:
     # Author: Nathan Garrison, Naman Rao, Caleb Mpungu
-    # Purpose: Handles communication with a single client, updates game state, and broadcasts it
-    # Pre: Client socket is connected, player_side is assigned a side: ('left', 'right', or 'spectator')
-    # Post: Updates global paddle positions, ball position, scores, and sync. Removes client and paddle on disconnect
+    # Purpose: Places a client in a room, then handles its updates and broadcasts the room's state
+    # Pre: Client socket was just accepted, or choice is the (room name, bytes read, spectator, token)
+    #      the front process already got from it when this is a worker
+    # Post: Updates the room's paddle positions, ball position, scores, and sync. Leaves the room on disconnect
 
-    global paddles, ballX, ballY, lScore, rScore, sync, game_running
+    room = None
+    outbox = None
 
-    # Initialize paddle position for this player
-    paddles[player_side] = screenHeight // 2 - 25
+    # Like asyncio's transports, send every frame as soon as it is queued. Otherwise a frame that follows
+    # another, such as the snapshot after a resumed player's bin1 ack, waits for the client's delayed ACK
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     try:
+        # Room first, its side decides the handshake
+        room_name, data, spectator, token = choice or read_room_choice(client_socket)
+        room, outbox = join_room(
+            room_name, lambda side: ThreadedOutbox(client_socket, side, send_queue_size, slow_policy), addr,
+            spectator, token
+        )
+        decoder = FrameDecoder()
+
         # Start game when both players are connected
         while True:
 
+            # Update game state
+            if data:
+                if metrics is not None:
+                    started = time.perf_counter()
+                process_client_data(room, outbox, decoder, data)
+                if metrics is not None:
+                    metrics.record('parse', time.perf_counter() - started)
+
+                # Broadcast updated state to all clients in the room, or leave it for the next tick.
+                # A relay only broadcasts what comes from upstream, rollback mode only relays inputs
+                if broadcast_on_receive():
+                    broadcast_state(room)
+
             # Wait for data from client
-            data = client_socket.recv(1024).decode()
+            data = client_socket.recv(1024)
 
             # If no data, client has disconnected
             if not data:
                 break
 
-            # Parse received data
-            paddleY, clientBallX, clientBallY, clientLScore, clientRScore, clientSync = data.split(',')
-            paddleY = int(paddleY)
-            clientBallX = int(clientBallX)
-            clientBallY = int(clientBallY)
-            clientLScore = int(clientLScore)
-            clientRScore = int(clientRScore)
-            clientSync = int(clientSync)
+    except Exception as e:
+        print(f"Error handling client {outbox.side if outbox else addr}: {e}")
 
-            # Update game state
-            with stateLock:
+    finally:
 
-                # Update this player's paddle position
-                paddles[player_side] = paddleY
+        # Leave the room (it goes away with its last client) and clean up on disconnect
+        if outbox is not None:
+            rooms.leave(room, outbox)
 
-                # Issues with desync if right client has higher sync, so only
-                # left client updates ball position and scores and right side just follows
-                if player_side == 'left':
-                    if clientSync >= sync:
-                        ballX = clientBallX
-                        ballY = clientBallY
-                        lScore = clientLScore
-                        rScore = clientRScore
-                        sync = clientSync
+            # A room's match ends with its last client, the room a relay serves outlives its spectators
+            if not room.clients and room is not relay_room:
+                finish_recording(room)
+                finish_tally(room)
+            if udp is not None:
+                udp.unregister(outbox)
+            outbox.close()
+            report_dropped_frames(outbox)
+            report_rate(outbox)
+        client_socket.close()
 
-                    # Check for game over condition
-                    if lScore > 4 or rScore > 4:
-                        game_running = False
 
-            # Broadcast updated state to all clients
-            broadcast_state()
 
-    except Exception as e:
-        print(f"Error handling client {player_side}: {e}")
+# Print how many snapshots a disconnecting client missed
+def report_dropped_frames(outbox) -> None:
+    # Purpose: Surface slow consumers when they leave
+    # Pre: outbox is the ClientOutbox of a client that just disconnected
+    # Post: Prints a line if any of its snapshots were dropped
 
-    finally:
+    if outbox.dropped_frames:
+        print(f"Client {outbox.side} dropped {outbox.dropped_frames} of "
+              f"{outbox.dropped_frames + outbox.sent_frames} frames ({outbox.policy} policy)")
 
-        # Clean up on disconnect
-        client_socket.close()
 
-        with stateLock:
 
-            # Remove client from list
-            clients[:] = [
-                (c, s) for c, s, in clients if c != client_socket
-            ]
+# Print what the rate controller did for a disconnecting client
+def report_rate(outbox) -> None:
+    # Purpose: Show which clients were held below their ceiling and for how many snapshots
+    # Pre: outbox is the ClientOutbox of a client that just disconnected
+    # Post: Prints a line if its rate was ever lowered
 
-            # Remove paddle state
-            paddles.pop(player_side, None)
+    rate = outbox.rate
+    if rate is not None and rate.decreases:
+        print(f"Client {outbox.side} left at {rate.rate:g} Hz of {rate.ceiling:g}, lowered {rate.decreases} "
+              f"times and raised {rate.increases}, {rate.skipped} snapshots skipped")
+
+
+
+# Broadcast once per tick, merging every update received since the last one
+def broadcast_tick(tick: int) -> None:
+    # Purpose: TickScheduler callback
+    # Pre: tick_rate is set, so handlers only mark their room's state dirty
+    # Post: Sends one snapshot per room per tick, and nothing for rooms where no update arrived
+
+    for room in rooms.all():
+        if room.state_dirty:
+            room.state_dirty = False
+            broadcast_state(room)
+
+
+
+# Step the server-owned match once per tick and broadcast the result
+def simulation_tick(tick: int) -> None:
+    # Purpose: TickScheduler callback in authoritative mode
+    # Pre: Every room has a MatchSimulation, clients only report their paddle positions
+    # Post: Ball, scores and sync come from each running room's simulation and are sent to its clients
+
+    for room in rooms.all():
+        with room.lock:
+            if not room.game_running:
+                continue
+
+            # Latest reported paddles, then the same ball rules playGame runs each frame
+            simulation = room.simulation
+            simulation.set_paddle('left', room.leftPaddleY)
+            simulation.set_paddle('right', room.rightPaddleY)
+            simulation.step()
+            _, _, room.ballX, room.ballY, room.lScore, room.rScore, room.sync = simulation.state()
+
+            # Check for game over condition
+            if simulation.game_over:
+                room.game_running = False
+
+        broadcast_state(room)
+        if not room.game_running:
+            finish_recording(room)
+
+
+
+# Pick the TickScheduler callback for the configured mode
+def tick_callback() -> Callable[[int], None]:
+    # Purpose: Authoritative servers simulate every tick, the others only broadcast merged updates
+    # Pre: authoritative is set (or not) before the server starts
+    # Post: Returns simulation_tick or broadcast_tick
+
+    return simulation_tick if authoritative else broadcast_tick
+
+
+
+# Ping clients and print the metrics report, once a second while metrics are on
+def metrics_tick(tick: int) -> None:
+    # Purpose: TickScheduler callback at 1 Hz
+    # Pre: metrics is set
+    # Post: Every binary client that accepted the ping offer has a new MSG_PING queued, and every
+    #       metrics_interval seconds the report since the previous one is printed
+
+    # With rate control on, rate_tick pings more often
+    now = time.perf_counter()
+    if rate_tiers is None:
+        for room in rooms.all():
+            for outbox, _ in list(room.clients):
+                ping_client(outbox, now)
+
+    if metrics_interval and tick % metrics_interval == 0:
+        print(metrics_label + format_report(metrics.report(rooms, reset = True)), flush = True)
+
+
+
+# Send a client the next MSG_PING
+def ping_client(outbox, now: float) -> None:
+    # Purpose: Start a round trip measurement, answered in apply_binary_message
+    # Pre: now is time.perf_counter()
+    # Post: Binary clients that accepted the ping offer have a MSG_PING queued, others get nothing
+
+    if outbox.pings and outbox.protocol == BINARY_PROTOCOL:
+        outbox.ping_id += 1
+        outbox.ping_sent = now
+        outbox.push(encode_ping(MSG_PING, outbox.ping_id), droppable = False)
+
+
+
+# Adjust every client's snapshot rate to what its link takes
+def rate_tick(tick: int) -> None:
+    # Purpose: TickScheduler callback at CONTROL_HZ with --adaptive-rate, see rateControl.py
+    # Pre: rate_tiers is set, so every client has a RateController
+    # Post: Each controller has seen its client's backlog and round trip, and answered clients are
+    #       pinged again (unanswered ones after a second)
+
+    now = time.perf_counter()
+    for room in rooms.all():
+        for outbox, _ in list(room.clients):
+            if outbox.rate is None or outbox.closed:
+                continue
+
+            # A ping still on its way counts for as long as it has been out
+            rtt = outbox.rtt
+            if outbox.pings and outbox.pong_id != outbox.ping_id:
+                rtt = max(rtt or 0.0, now - outbox.ping_sent)
+            peak, outbox.peak_snapshots = outbox.peak_snapshots, outbox.queued_snapshots
+            outbox.rate.update(now, outbox.sent_bytes, outbox.dropped_frames, peak, outbox.buffered(), rtt)
+
+            if outbox.pong_id == outbox.ping_id or now - outbox.ping_sent >= 1.0:
+                ping_client(outbox, now)
+
+
+
+# Set up the metrics endpoint and timer for this process
+def metrics_scheduler(endpoint_port: int) -> TickScheduler:
+    # Purpose: Open the local HTTP endpoint if a port is given and build the 1 Hz metrics scheduler
+    # Pre: metrics is set
+    # Post: Returns the scheduler, the caller runs it on a thread or on its event loop
+
+    if endpoint_port:
+        start_metrics_endpoint(metrics, lambda: rooms, endpoint_port)
+        print(f'{metrics_label}Metrics on http://127.0.0.1:{endpoint_port}/ (text) and /json')
+    return TickScheduler(1.0, metrics_tick)
 
 
 
 # Server set up
-def start_server(host: str, port: int) -> None:
+def start_server(host: str, port: int, tick_rate_hz: float = 0, tick_report: float = 0) -> None:
     # Author: Nathan Garrison, Naman Rao, Caleb Mpungu
-    # Purpose: Initialize server, accept clients, assign sides, start game, and spawn threads
+    # Purpose: Initialize server, accept clients and spawn a thread for each, which places it in a room
     # Pre: Host and port are valid; server can bind to socket
     # Post: Server listens indefinitely, clients are handled in threads, game state updates continuously
 
-    global clients, game_running
+    global tick_rate
+
+    # A relay needs the upstream handshake (court size, mode, room) before it can greet anyone, a replay
+    # takes them from the recording
+    if relay_upstream is not None:
+        ready = threading.Event()
+        threading.Thread(target = run_relay_upstream, args = (*relay_upstream, ready), daemon = True).start()
+        ready.wait()
+    elif replay_player is not None:
+        ready = threading.Event()
+        threading.Thread(target = run_replay, args = (ready,), daemon = True).start()
+        ready.wait()
 
     # Create server socket
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.bind((host, port))
-    server_socket.listen(5)
+    server_socket.listen(1024)
     print(f'Server listening on IP: {host} and Port: {port}')
 
+    # Broadcast at a fixed rate from its own thread instead of per received packet
+    tick_rate = tick_rate_hz
+    if tick_rate:
+        scheduler = TickScheduler(tick_rate, tick_callback(), report_every = tick_report)
+        threading.Thread(target = scheduler.run_forever, daemon = True).start()
+    if metrics is not None:
+        threading.Thread(target = metrics_scheduler(metrics_port).run_forever, daemon = True).start()
+    if rate_tiers is not None:
+        threading.Thread(target = TickScheduler(CONTROL_HZ, rate_tick).run_forever, daemon = True).start()
+    if udp_enabled:
+        start_udp(host, port)
+
     while True:
 
-        # Accept new client connection
+        # Accept new client connection, its thread picks the room and side
         client_socket, addr = server_socket.accept()
-        if len(clients) == 0:
-            side = 'left' 
-        elif len(clients) == 1:
-            side = 'right'
-        else:
-            side = 'spectator'
-
-        # Send initial game state to client
-        client_socket.sendall(f'{screenWidth},{screenHeight},{side};'.encode())
-        clients.append((client_socket, side))
-        print(f"Client connected from {addr} as {side}")
-        
-        # Check if we can start the game
-        if not game_running:
-
-            # Check if both players are connected
-            player_sides = [s for _, s in clients]
-            if 'left' in player_sides and 'right' in player_sides:
-
-                # Both players connected, start the game
-                print("Two players connected. Game can start.")
-                game_running = True
-                for c, _ in clients:
-                    c.sendall("START;\n".encode())
-
-        # Start thread to handle this client
         threading.Thread(
             target = handle_client, 
-            args = (client_socket, side), 
+            args = (client_socket, addr), 
+            daemon = True
+        ).start()
+
+
+
+# Handle individual client connection on the event loop
+async def handle_client_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              choice: tuple = None) -> None:
+    # Purpose: Async mode version of handle_client, one coroutine per connection
+    # Pre: Connection was just accepted by asyncio.start_server, or handed over with its choice
+    # Post: Same room, handshake, START, update and clean up behaviour as the threaded server
+
+    addr = writer.get_extra_info('peername')
+    room = None
+    outbox = None
+
+    try:
+        # Room first, its side decides the handshake
+        room_name, data, spectator, token = choice or await read_room_choice_async(reader, writer)
+        room, outbox = join_room(
+            room_name, lambda side: AsyncOutbox(writer, side, send_queue_size, slow_policy), addr, spectator, token
+        )
+        decoder = FrameDecoder()
+
+        while True:
+
+            # Only one coroutine runs at a time, so room locks are never contended here
+            if data:
+                if metrics is not None:
+                    started = time.perf_counter()
+                process_client_data(room, outbox, decoder, data)
+                if metrics is not None:
+                    metrics.record('parse', time.perf_counter() - started)
+                if broadcast_on_receive():
+                    broadcast_state(room)
+
+            # Wait for data from client
+            data = await reader.read(1024)
+
+            # If no data, client has disconnected
+            if not data:
+                break
+
+    except Exception as e:
+        print(f"Error handling client {outbox.side if outbox else addr}: {e}")
+
+    finally:
+
+        # Leave the room (it goes away with its last client) and clean up on disconnect
+        if outbox is not None:
+            rooms.leave(room, outbox)
+
+            # A room's match ends with its last client, the room a relay serves outlives its spectators
+            if not room.clients and room is not relay_room:
+                finish_recording(room)
+                finish_tally(room)
+            if udp is not None:
+                udp.unregister(outbox)
+            outbox.close()
+            report_dropped_frames(outbox)
+            report_rate(outbox)
+        else:
+            writer.close()
+
+
+
+# Async server set up
+def start_async_server(host: str, port: int, tick_rate_hz: float = 0, tick_report: float = 0) -> None:
+    # Purpose: Serve every client from a single asyncio event loop instead of a thread per client
+    # Pre: Host and port are valid; server can bind to socket
+    # Post: Server listens indefinitely, all sockets are multiplexed on one thread
+
+    global tick_rate
+
+    async def serve() -> None:
+        # The loop only keeps weak references to tasks, serve() holds this one for as long as it runs
+        if relay_upstream is not None:
+            ready = asyncio.Event()
+            upstream = asyncio.get_running_loop().create_task(run_relay_upstream_async(*relay_upstream, ready))
+            await ready.wait()
+        elif replay_player is not None:
+            ready = asyncio.Event()
+            upstream = asyncio.get_running_loop().create_task(run_replay_async(ready))
+            await ready.wait()
+
+        server = await asyncio.start_server(handle_client_async, host or None, port, backlog = 1024)
+        print(f'Async server listening on IP: {host} and Port: {port}')
+
+        # Broadcast at a fixed rate from a task on the same loop
+        if tick_rate:
+            scheduler = TickScheduler(tick_rate, tick_callback(), report_every = tick_report)
+            asyncio.get_running_loop().create_task(scheduler.run_async())
+        if metrics is not None:
+            asyncio.get_running_loop().create_task(metrics_scheduler(metrics_port).run_async())
+        if rate_tiers is not None:
+            asyncio.get_running_loop().create_task(TickScheduler(CONTROL_HZ, rate_tick).run_async())
+        if udp_enabled:
+            await start_udp_async(host, port)
+
+        async with server:
+            await server.serve_forever()
+
+    tick_rate = tick_rate_hz
+    asyncio.run(serve())
+
+
+
+# Follow the upstream server as a spectator and re-broadcast what it sends
+def run_relay_upstream(host: str, port: int, ready: threading.Event) -> None:
+    # Purpose: Threaded relay mode, one connection to the upstream server or relay, reconnecting
+    #          after RECONNECT_DELAY whenever it is lost
+    # Pre: relay_upstream is set, runs on its own thread
+    # Post: Never returns, ready is set once the first handshake is done and relay_room exists
+
+    while True:
+        feed = UpstreamFeed(relay_watch)
+        try:
+            with socket.create_connection((host, port), timeout = 5) as upstream:
+                upstream.settimeout(None)
+                upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                upstream.sendall(feed.greeting())
+                while True:
+                    data = upstream.recv(65536)
+                    if not data:
+                        break
+                    reply, events = feed.feed(data)
+                    if reply:
+                        upstream.sendall(reply)
+                    apply_upstream_events(feed, events)
+                    if feed.ready:
+                        ready.set()
+        except (OSError, ValueError) as e:
+            print(f"Upstream {host}:{port}: {e}")
+        print(f"Lost upstream {host}:{port} after {feed.snapshots} snapshots, retrying in {RECONNECT_DELAY:g} s")
+        time.sleep(RECONNECT_DELAY)
+
+
+
+# Async mode version of run_relay_upstream
+async def run_relay_upstream_async(host: str, port: int, ready: asyncio.Event) -> None:
+    # Purpose: Same upstream connection as run_relay_upstream, on the server's event loop
+    # Pre: relay_upstream is set
+    # Post: Never returns, ready is set once the first handshake is done and relay_room exists
+
+    while True:
+        feed = UpstreamFeed(relay_watch)
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 5)
+            writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            writer.write(feed.greeting())
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    reply, events = feed.feed(data)
+                    if reply:
+                        writer.write(reply)
+                    apply_upstream_events(feed, events)
+                    if feed.ready:
+                        ready.set()
+            finally:
+                writer.close()
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            print(f"Upstream {host}:{port}: {e}")
+        print(f"Lost upstream {host}:{port} after {feed.snapshots} snapshots, retrying in {RECONNECT_DELAY:g} s")
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+
+# Play the recording given with --replay to this server's spectators
+def run_replay(ready: threading.Event) -> None:
+    # Purpose: Threaded replay mode, waits for the first spectator, then sleeps until each recorded
+    #          state is due and broadcasts it
+    # Pre: replay_player is set, runs on its own thread
+    # Post: Returns at the end of the recording, ready is set once relay_room exists. The room stays
+    #       up with the last state for anyone still watching
+
+    apply_upstream_events(replay_player, [('ready',)])
+    ready.set()
+    while not relay_room.clients:
+        time.sleep(SPECTATOR_POLL)
+
+    while True:
+        apply_upstream_events(replay_player, replay_player.due(time.perf_counter()))
+        wake = replay_player.next_due()
+        if wake is None:
+            break
+        time.sleep(max(0.0, wake - time.perf_counter()))
+    print(f"Replay of {replay_player.recording.path} done, {replay_player.snapshots} snapshots sent")
+
+
+
+# Async mode version of run_replay
+async def run_replay_async(ready: asyncio.Event) -> None:
+    # Purpose: Same playback as run_replay, on the server's event loop
+    # Pre: replay_player is set
+    # Post: Returns at the end of the recording, ready is set once relay_room exists
+
+    apply_upstream_events(replay_player, [('ready',)])
+    ready.set()
+    while not relay_room.clients:
+        await asyncio.sleep(SPECTATOR_POLL)
+
+    while True:
+        apply_upstream_events(replay_player, replay_player.due(time.perf_counter()))
+        wake = replay_player.next_due()
+        if wake is None:
+            break
+        await asyncio.sleep(max(0.0, wake - time.perf_counter()))
+    print(f"Replay of {replay_player.recording.path} done, {replay_player.snapshots} snapshots sent")
+
+
+
+# Apply what one read from the upstream connection produced
+def apply_upstream_events(feed: UpstreamFeed, events: list) -> None:
+    # Purpose: Take over the upstream handshake, START and snapshots as this relay's own
+    # Pre: events come from feed.feed(), in order, or from a ReplayPlayer's due(), which has the same
+    #      attributes
+    # Post: relay_room mirrors the upstream room and every snapshot is broadcast to its spectators,
+    #       START once per upstream match
+
+    global screenWidth, screenHeight, authoritative, relay_room
+
+    for event in events:
+        if event[0] == 'ready':
+
+            # After a reconnect the room and its spectators are already there, the upstream sends START
+            # again if its match is on and it may be a different match by now
+            if relay_room is None:
+                screenWidth, screenHeight = feed.width, feed.height
+                authoritative = feed.authoritative
+                relay_room = rooms.pin(feed.room)
+                print(f"Serving room {relay_room.name} to spectators ({'authoritative' if authoritative else 'peer to peer'})")
+            else:
+                with relay_room.lock:
+                    relay_room.game_running = False
+
+        elif event[0] == 'start':
+            with relay_room.lock:
+                start = not relay_room.game_running
+                relay_room.game_running = True
+            if start:
+                broadcast_start(relay_room)
+
+        else:
+            with relay_room.lock:
+                (relay_room.leftPaddleY, relay_room.rightPaddleY, relay_room.ballX, relay_room.ballY,
+                 relay_room.lScore, relay_room.rScore, relay_room.sync) = event[1]
+
+                # Check for game over condition, the upstream's next START is a new match
+                if relay_room.lScore > 4 or relay_room.rScore > 4:
+                    relay_room.game_running = False
+            broadcast_state(relay_room)
+            if not relay_room.game_running:
+                finish_recording(relay_room)
+
+
+
+# Give every room a MatchSimulation when the server owns the ball and score
+def configure_rooms(authoritative_mode: bool) -> None:
+    # Purpose: Set up the room manager for the chosen mode, in the main process or a worker
+    # Pre: No client has connected yet
+    # Post: rooms and authoritative are replaced
+
+    global rooms, authoritative
+
+    authoritative = authoritative_mode
+    make_simulation = None
+    if authoritative:
+        from assets.code.matchSimulation import MatchSimulation
+        make_simulation = lambda: MatchSimulation(screenWidth, screenHeight)
+
+    # Timed room locks only when metrics are collected, plain locks cost nothing extra
+    rooms = RoomManager(screenWidth, screenHeight, make_simulation,
+                        make_lock = metrics.make_lock if metrics is not None else None, resume_grace = resume_grace)
+
+
+
+# Entry point of a worker process
+def run_worker(index: int, channel: socket.socket, mode: str, settings: dict) -> None:
+    # Purpose: Serve the rooms the front process routes to this worker, threaded or async
+    # Pre: channel is this worker's end of the socketpair, settings holds the front process's options
+    # Post: Runs until the front process goes away
+
+    global send_queue_size, slow_policy, tick_rate, metrics, metrics_interval, metrics_label, udp_enabled, record_dir
+    global rollback, rate_tiers, resume_grace, match_stats
+
+    # Set again here so workers also work when started with spawn instead of fork
+    send_queue_size = settings['send_queue_size']
+    slow_policy = settings['slow_policy']
+    tick_rate = settings['tick_rate']
+    metrics_interval = settings['metrics_interval']
+    metrics_label = f'Worker {index} '
+    udp_enabled = settings['udp']
+    record_dir = settings['record_dir']
+    rollback = settings['rollback']
+    rate_tiers = settings['rate_tiers']
+    resume_grace = settings['resume_grace']
+    match_stats = StatsWriter(settings['match_stats']) if settings['match_stats'] else None
+    metrics = ServerMetrics() if metrics_interval or settings['metrics_port'] else None
+    configure_rooms(settings['authoritative'])
+
+    if mode == 'async':
+        asyncio.run(serve_worker_async(index, channel, settings))
+    else:
+        serve_worker(index, channel, settings)
+
+    # A worker process skips atexit, results still queued are written here
+    if match_stats is not None:
+        match_stats.close()
+
+
+
+# Threaded worker
+def serve_worker(index: int, channel: socket.socket, settings: dict) -> None:
+    # Purpose: start_server for a worker, connections come from the channel instead of accept()
+    # Pre: Called by run_worker
+    # Post: Returns once the front process goes away
+
+    if tick_rate:
+        scheduler = TickScheduler(tick_rate, tick_callback(), report_every = settings['tick_report'])
+        threading.Thread(target = scheduler.run_forever, daemon = True).start()
+
+    # Each worker serves its own metrics, on the next port after the previous worker's
+    if metrics is not None:
+        endpoint_port = settings['metrics_port'] + index if settings['metrics_port'] else 0
+        threading.Thread(target = metrics_scheduler(endpoint_port).run_forever, daemon = True).start()
+    if rate_tiers is not None:
+        threading.Thread(target = TickScheduler(CONTROL_HZ, rate_tick).run_forever, daemon = True).start()
+
+    # Every worker has its own UDP port, the offer tells clients which one
+    if udp_enabled:
+        start_udp(settings['host'], 0)
+
+    # Report to the front process from its own thread
+    def report() -> None:
+        while True:
+            time.sleep(settings['stats_interval'])
+            send_stats(channel, worker_stats(rooms))
+    threading.Thread(target = report, daemon = True).start()
+
+    while True:
+        received = receive_connection(channel)
+        if received is None:
+            return
+        client_socket, room_name, data, spectator, token = received
+
+        # The front process's event loop made the socket non-blocking, the handler thread wants it blocking
+        client_socket.setblocking(True)
+        threading.Thread(
+            target = handle_client,
+            args = (client_socket, client_socket.getpeername(), (room_name, data, spectator, token)),
             daemon = True
         ).start()
 
 
 
+# Async worker
+async def serve_worker_async(index: int, channel: socket.socket, settings: dict) -> None:
+    # Purpose: start_async_server for a worker, connections come from the channel instead of accept()
+    # Pre: Called by run_worker
+    # Post: Returns once the front process goes away
+
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+
+    if tick_rate:
+        scheduler = TickScheduler(tick_rate, tick_callback(), report_every = settings['tick_report'])
+        loop.create_task(scheduler.run_async())
+    if metrics is not None:
+        endpoint_port = settings['metrics_port'] + index if settings['metrics_port'] else 0
+        loop.create_task(metrics_scheduler(endpoint_port).run_async())
+    if rate_tiers is not None:
+        loop.create_task(TickScheduler(CONTROL_HZ, rate_tick).run_async())
+    if udp_enabled:
+        await start_udp_async(settings['host'], 0)
+
+    async def adopt(client_socket: socket.socket, room_name: str, data: bytes, spectator: bool, token: str) -> None:
+        reader, writer = await asyncio.open_connection(sock = client_socket)
+        await handle_client_async(reader, writer, (room_name, data, spectator, token))
+
+    def on_channel_readable() -> None:
+        try:
+            received = receive_connection(channel)
+        except BlockingIOError:
+            return
+        if received is None:
+            loop.remove_reader(channel.fileno())
+            if not stopped.done():
+                stopped.set_result(None)
+            return
+        loop.create_task(adopt(*received))
+
+    channel.setblocking(False)
+    loop.add_reader(channel.fileno(), on_channel_readable)
+
+    # Report to the front process until it goes away
+    while not stopped.done():
+        await asyncio.wait([stopped], timeout = settings['stats_interval'])
+        if not stopped.done():
+            send_stats(channel, worker_stats(rooms))
+
+
+
+# Front process of a multi-process server
+def start_worker_pool(host: str, port: int, workers: int, mode: str, tick_rate_hz: float = 0,
+                      tick_report: float = 0, stats_interval: float = 5) -> None:
+    # Purpose: Fork workers, then accept every connection, read its room choice and pass the socket
+    #          to the worker that owns that room, so each room lives in exactly one process
+    # Pre: Host and port are valid; server can bind to socket
+    # Post: Runs indefinitely, printing every worker's stats each stats_interval seconds
+
+    settings = {
+        'send_queue_size': send_queue_size, 'slow_policy': slow_policy, 'tick_rate': tick_rate_hz,
+        'tick_report': tick_report, 'authoritative': authoritative, 'stats_interval': stats_interval,
+        'metrics_interval': metrics_interval, 'metrics_port': metrics_port, 'udp': udp_enabled, 'host': host,
+        'record_dir': record_dir, 'rollback': rollback, 'rate_tiers': rate_tiers,
+        'resume_grace': resume_grace, 'match_stats': match_stats_path,
+    }
+    channels = []
+    for index in range(workers):
+        front, back = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        multiprocessing.Process(target = run_worker, args = (index, back, mode, settings), daemon = True).start()
+        back.close()
+        channels.append(front)
+    router = WorkerRouter(channels)
+
+    async def route_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            room_name, data, spectator, token = await read_room_choice_async(reader, writer, router.listing())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        router.hand_off(writer.get_extra_info('socket'), router.room_for(room_name), data, spectator, token)
+
+        # The worker has its own copy of the socket now, closing ours does not end the connection
+        writer.close()
+
+    async def serve() -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_stats(index: int) -> None:
+            try:
+                received = receive_connection(channels[index])
+            except BlockingIOError:
+                return
+            if received is None:
+                loop.remove_reader(channels[index].fileno())
+                print(f"Worker {index} exited")
+                return
+            router.update_stats(index, received[2])
+
+        for index, channel in enumerate(channels):
+            channel.setblocking(False)
+            loop.add_reader(channel.fileno(), on_stats, index)
+
+        server = await asyncio.start_server(route_client, host or None, port, backlog = 1024)
+        print(f'Routing clients on IP: {host} and Port: {port} to {workers} {mode} worker processes')
+        async with server:
+            while True:
+                await asyncio.sleep(stats_interval)
+                print(router.summary(), flush = True)
+
+    asyncio.run(serve())
+
+
+
 # Run server code listening on all IPs and port 5555 on startup
 if __name__ == "__main__":
-    start_server(host = '', port = 5555)
+    parser = argparse.ArgumentParser(description = "Multiplayer pong server")
+    parser.add_argument('--host', default = '', help = "IP to listen on (default: all)")
+    parser.add_argument('--port', type = int, default = 5555, help = "Port to listen on (default: 5555)")
+    parser.add_argument('--mode', choices = ['threaded', 'async'], default = 'threaded',
+                        help = "threaded: one thread per client, async: one event loop for every client")
+    parser.add_argument('--tick-rate', type = float, default = 0,
+                        help = "Broadcast one merged snapshot per tick at this rate, e.g. 20, 30 or 60 (default: every packet)")
+    parser.add_argument('--tick-report', type = float, default = 0,
+                        help = "Seconds between late/skipped tick reports (default: off)")
+    parser.add_argument('--send-queue', type = int, default = send_queue_size,
+                        help = "Snapshots queued per client before the slow-consumer policy applies")
+    parser.add_argument('--slow-policy', choices = list(SLOW_POLICIES), default = slow_policy,
+                        help = "latest: drop queued snapshots and keep the newest, disconnect: drop the client")
+    parser.add_argument('--authoritative', action = 'store_true',
+                        help = "Simulate ball and score on the server, clients only send paddle input (default tick rate 60)")
+    parser.add_argument('--room-wait', type = float, default = room_wait,
+                        help = "Seconds to wait for a client's room choice before using the default room, 0 disables rooms")
+    parser.add_argument('--resume-grace', type = float, default = resume_grace,
+                        help = "Seconds a dropped player's side is kept for it to resume with its session token, 0 gives it away at once")
+    parser.add_argument('--workers', type = int, default = 0,
+                        help = "Worker processes to spread rooms over, each running --mode (default: serve in this process)")
+    parser.add_argument('--stats-interval', type = float, default = 5,
+                        help = "Seconds between per-worker stats reports with --workers")
+    parser.add_argument('--metrics-interval', type = int, default = 0,
+                        help = "Print lock, broadcast, parse and round trip metrics every this many seconds (default: off)")
+    parser.add_argument('--metrics-port', type = int, default = 0,
+                        help = "Serve the metrics on http://127.0.0.1:PORT/ and /json, workers use PORT + index (default: off)")
+    parser.add_argument('--udp', action = 'store_true',
+                        help = "Offer binary clients snapshots and updates over UDP on the same port, workers use a free port each")
+    parser.add_argument('--relay', metavar = 'HOST:PORT',
+                        help = "Spectator relay: watch a room on this server (or relay) and re-broadcast it to our own spectators")
+    parser.add_argument('--relay-room', default = relay_watch, help = "Room to watch with --relay (default: default)")
+    parser.add_argument('--rollback', action = 'store_true',
+                        help = "Only relay each player's inputs, clients simulate the match and roll back late inputs (bin1 clients)")
+    parser.add_argument('--adaptive-rate', action = 'store_true',
+                        help = "Lower a client's snapshot rate while its link backs up or its round trip rises, "
+                               "raise it again once the link recovers")
+    parser.add_argument('--rate-tiers', metavar = 'ROLE=HZ[:FLOOR],...',
+                        help = "Snapshot rate ceiling (and floor) per role with --adaptive-rate (default: " +
+                               ','.join(f'{role}={ceiling}:{floor}' for role, (ceiling, floor) in RATE_TIERS.items()) + ")")
+    parser.add_argument('--record', metavar = 'DIR',
+                        help = "Record every match to a .pongrec file in DIR, for --replay (default: off)")
+    parser.add_argument('--match-stats', metavar = 'DB',
+                        help = "Keep every match's result, rally lengths and hits per player in this SQLite file (default: off)")
+    parser.add_argument('--replay', metavar = 'FILE',
+                        help = "Replay server: play a recorded match to spectators as if it were live")
+    parser.add_argument('--replay-speed', type = float, default = 1.0, help = "Playback speed with --replay (default: 1)")
+    parser.add_argument('--replay-from', type = int, default = 0, metavar = 'SYNC',
+                        help = "Start --replay at this sync instead of the beginning")
+    args = parser.parse_args()
+
+    # A relay only forwards, the match is simulated and ticked upstream
+    if args.relay and (args.workers or args.authoritative or args.tick_rate):
+        parser.error("--relay cannot be combined with --workers, --authoritative or --tick-rate")
+    if args.replay and (args.relay or args.workers or args.authoritative or args.tick_rate):
+        parser.error("--replay cannot be combined with --relay, --workers, --authoritative or --tick-rate")
+    if args.rollback and (args.authoritative or args.tick_rate or args.udp or args.relay or args.replay or args.record):
+        parser.error("--rollback sends no snapshots, it cannot be combined with --authoritative, --tick-rate, "
+                     "--udp, --relay, --replay or --record")
+    if args.match_stats and (args.rollback or args.relay or args.replay):
+        parser.error("--match-stats needs the server to see the match, it cannot be combined with --rollback, "
+                     "--relay or --replay")
+    if args.replay_speed <= 0:
+        parser.error("--replay-speed must be positive")
+    if args.rate_tiers and not args.adaptive_rate:
+        parser.error("--rate-tiers needs --adaptive-rate")
+
+    send_queue_size = args.send_queue
+    slow_policy = args.slow_policy
+    room_wait = args.room_wait
+    resume_grace = args.resume_grace
+    metrics_interval = args.metrics_interval
+    metrics_port = args.metrics_port
+    udp_enabled = args.udp
+    rollback = args.rollback
+    if args.adaptive_rate:
+        try:
+            rate_tiers = parse_rate_tiers(args.rate_tiers) if args.rate_tiers else dict(RATE_TIERS)
+        except ValueError as e:
+            parser.error(f"--rate-tiers: {e}")
+    if args.relay:
+        try:
+            relay_upstream = parse_upstream(args.relay)
+        except ValueError:
+            parser.error(f"--relay expects HOST:PORT, got {args.relay}")
+        relay_watch = args.relay_room
+    if args.replay:
+        try:
+            replay_player = ReplayPlayer(Recording(args.replay), args.replay_speed, args.replay_from)
+        except (OSError, ValueError) as e:
+            parser.error(f"--replay: {e}")
+        print(f"Replaying {args.replay} ({replay_player.recording.duration():.0f} s, room {replay_player.room}) "
+              f"from sync {args.replay_from} at {args.replay_speed:g}x")
+    if args.record:
+        os.makedirs(args.record, exist_ok = True)
+        record_dir = args.record
+    if args.match_stats:
+
+        # Creates the tables once here, and fails now rather than at the end of the first match
+        try:
+            StatsStore(args.match_stats).close()
+        except sqlite3.Error as e:
+            parser.error(f"--match-stats: {e}")
+        match_stats_path = args.match_stats
+
+        # Results still queued are written on the way out. Workers keep their own
+        if not args.workers:
+            match_stats = StatsWriter(match_stats_path)
+            atexit.register(match_stats.close)
+
+    # Instrumentation is created before the rooms, whose locks it times. Workers make their own
+    if (metrics_interval or metrics_port) and not args.workers:
+        metrics = ServerMetrics()
+
+    # Every room gets its own simulation, which needs a tick to run on, 60 matches the clients' frame rate
+    configure_rooms(args.authoritative)
+    if args.authoritative:
+        args.tick_rate = args.tick_rate or 60
+
+    if args.workers:
+        start_worker_pool(host = args.host, port = args.port, workers = args.workers, mode = args.mode,
+                          tick_rate_hz = args.tick_rate, tick_report = args.tick_report, stats_interval = args.stats_interval)
+    elif args.mode == 'async':
+        start_async_server(host = args.host, port = args.port, tick_rate_hz = args.tick_rate, tick_report = args.tick_report)
+    else:
+        start_server(host = args.host, port = args.port, tick_rate_hz = args.tick_rate, tick_report = args.tick_report)